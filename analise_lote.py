@@ -0,0 +1,159 @@
+# Processamento noturno em lote: previsão e comparação de todas as
+# empresas/máquinas/métricas, gravadas em JSONL para o dashboard ler pronto.
+#
+# Exemplos:
+#   python analise_lote.py --metricas "Uso de RAM" "Uso de Disco" "Total de Alertas"
+#   python analise_lote.py --metricas "Uso de RAM" --empresas 1 2 --dias 60 --processos 4 --saida digest.jsonl
+
+from logging_config import setup_logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict
+from datetime import date, datetime, timedelta
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+ETAPAS = ("coleta", "previsao", "comparacao")
+
+
+def processar_empresa(fk_empresa: int, metricas: list, data_inicio: str, data_fim: str, componente: str = None) -> dict:
+    """
+    Executa previsão e comparação para cada máquina x métrica da empresa.
+    As séries da empresa são lidas antes, em lote (uma conexão por métrica),
+    e as análises saem do cache de séries do processo.
+    """
+    from app.models.dataModel import AnaliseRequest
+    from app.services.analise_previsao import processar_request_previsao
+    from app.services.analise_comparacao import processar_request_comparacao, calcular_periodo_anterior
+    from app.services.coleta_dados_service import listar_maquinas_empresa, coletar_series_frota, pre_carregar_periodos
+    from app.utils.helpers import calcular_agrupamento
+
+    tempos = dict.fromkeys(ETAPAS, 0.0)
+    registros = []
+    series = 0
+
+    maquinas = listar_maquinas_empresa(fk_empresa)
+    agrupar_por = calcular_agrupamento(data_inicio, data_fim)
+    periodo_anterior = calcular_periodo_anterior(data_inicio, data_fim)
+
+    for metrica in metricas:
+        base = AnaliseRequest(
+            tipoAnalise="lote", dataIncio=data_inicio, metricaAnalisar=metrica,
+            fkEmpresa=fk_empresa, dataPrevisao=data_fim, componente=componente,
+        )
+        inicio = time.perf_counter()
+        coletadas = coletar_series_frota(base, agrupar_por, maquinas)
+        requisicoes = [AnaliseRequest(**{**asdict(base), "fkMaquina": maquina}) for maquina in coletadas]
+        pre_carregar_periodos(requisicoes, (data_inicio, data_fim), periodo_anterior, agrupar_por)
+        tempos["coleta"] += time.perf_counter() - inicio
+
+        for req in requisicoes:
+            series += 1
+            for etapa, processar in (("previsao", processar_request_previsao), ("comparacao", processar_request_comparacao)):
+                inicio = time.perf_counter()
+                try:
+                    resultado = processar(req)
+                except Exception as e:
+                    logger.error("Falha em %s (empresa %s, máquina %s, %s): %s", etapa, fk_empresa, req.fkMaquina, metrica, e)
+                    resultado = {"erro": str(e)}
+                tempos[etapa] += time.perf_counter() - inicio
+                registros.append({
+                    "fkEmpresa": fk_empresa,
+                    "fkMaquina": req.fkMaquina,
+                    "metrica": metrica,
+                    "componente": componente,
+                    "analise": etapa,
+                    "dataInicio": data_inicio,
+                    "dataFim": data_fim,
+                    "resultado": resultado,
+                })
+
+    return {"fkEmpresa": fk_empresa, "series": series, "tempos": tempos, "registros": registros}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o digest de previsão/comparação de todas as máquinas.")
+    parser.add_argument("--metricas", nargs="+", required=True, help="Métricas analisadas em cada máquina.")
+    parser.add_argument("--empresas", nargs="+", type=int, default=None,
+                        help="Empresas a processar (padrão: todas, via SQL_EMPRESAS).")
+    parser.add_argument("--componente", default=None)
+    parser.add_argument("--dias", type=int, default=30, help="Tamanho da janela analisada, em dias até hoje.")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--saida", default=None, help="Arquivo JSONL (padrão: digest_AAAA-MM-DD.jsonl).")
+    parser.add_argument("--com-insight", action="store_true",
+                        help="Gera o texto da IA para cada análise (padrão: interpretação local).")
+    args = parser.parse_args()
+
+    if not args.com_insight:
+        # Herdado pelos processos filhos antes de importarem o serviço de insight
+        os.environ["INSIGHT_IA_ATIVO"] = "0"
+
+    hoje = date.today()
+    data_fim = hoje.strftime('%Y-%m-%d')
+    data_inicio = (hoje - timedelta(days=args.dias)).strftime('%Y-%m-%d')
+    saida = args.saida or f"digest_{data_fim}.jsonl"
+
+    empresas = args.empresas
+    if empresas is None:
+        from app.services.coleta_dados_service import listar_empresas
+        empresas = listar_empresas()
+    if not empresas:
+        logger.error("Nenhuma empresa para processar.")
+        raise SystemExit(1)
+
+    logger.info("Lote: %d empresa(s), %d métrica(s), %s a %s, %d processo(s).",
+                len(empresas), len(args.metricas), data_inicio, data_fim, args.processos)
+
+    inicio_total = time.perf_counter()
+    tempos = dict.fromkeys(ETAPAS + ("escrita",), 0.0)
+    series = registros = falhas = 0
+    gerado_em = datetime.now().isoformat(timespec='seconds')
+
+    # spawn: cada processo abre o próprio pool de conexões (nada herdado do pai)
+    contexto = multiprocessing.get_context("spawn")
+    with open(saida, "w", encoding="utf-8") as arquivo, \
+            ProcessPoolExecutor(max_workers=max(1, args.processos), mp_context=contexto) as executor:
+        futuros = {
+            executor.submit(processar_empresa, fk_empresa, args.metricas, data_inicio, data_fim, args.componente): fk_empresa
+            for fk_empresa in empresas
+        }
+        for futuro in as_completed(futuros):
+            fk_empresa = futuros[futuro]
+            try:
+                parcial = futuro.result()
+            except Exception as e:
+                falhas += 1
+                logger.error("Falha ao processar a empresa %s: %s", fk_empresa, e)
+                continue
+
+            inicio = time.perf_counter()
+            arquivo.writelines(
+                json.dumps(dict(registro, geradoEm=gerado_em), ensure_ascii=False, default=str) + "\n"
+                for registro in parcial["registros"]
+            )
+            tempos["escrita"] += time.perf_counter() - inicio
+
+            series += parcial["series"]
+            registros += len(parcial["registros"])
+            for etapa in ETAPAS:
+                tempos[etapa] += parcial["tempos"][etapa]
+            logger.info("Empresa %s: %d série(s) processada(s).", fk_empresa, parcial["series"])
+
+    duracao = time.perf_counter() - inicio_total
+    logger.info("Lote concluído em %.2fs: %d série(s), %d registro(s) em %s, %d empresa(s) com falha.",
+                duracao, series, registros, saida, falhas)
+    logger.info("Vazão: %.1f séries/s.", series / duracao if duracao else 0.0)
+    # Coleta e análises somam o tempo de todos os processos (CPU-tempo agregado)
+    logger.info("Tempos por etapa: %s", {etapa: round(valor, 2) for etapa, valor in tempos.items()})
+    if falhas:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,4 +12,7 @@ class AnaliseRequest:
     fkMaquina: Optional[int] = None
     dataPrevisao: Optional[str] = None  # Necessário apenas para 'previsao'
     componente: Optional[str] = None     # Opcional em todos os tipos
-    variavelRelacionada: Optional[str] = None # Necessário apenas para 'correlacao'
\ No newline at end of file
+    variavelRelacionada: Optional[str] = None # Necessário apenas para 'correlacao'
+    ignorarCacheIa: bool = False  # Força nova chamada à IA (ignora o cache de insights)
+    insightAssincrono: bool = False  # Responde os gráficos na hora; o insight sai em /ai/insight/<id>
+    defasagemMaxima: Optional[int] = None  # Correlação: testa defasagens de até N buckets entre as variáveis
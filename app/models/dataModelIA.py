@@ -5,4 +5,5 @@ from dataclasses import dataclass
 @dataclass
 class IARequest:
     """Estrutura do JSON COMUM que virá no fetch."""
-    pergunta: str
\ No newline at end of file
+    pergunta: str
+    ignorarCacheIa: bool = False  # Força nova chamada à IA (ignora o cache de insights)
@@ -1,16 +1,108 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app.models.dataModel import AnaliseRequest
 from app.models.dataModelIA import IARequest
+from functools import wraps
+import hmac
+import json
 import logging
+import os
 
-from app.services.analise_previsao import processar_request_previsao
+import numpy as np
+
+from app.services.analise_previsao import processar_request_previsao, obter_metricas_modelos
+from app.services.analise_frota import processar_request_previsao_frota, processar_request_correlacao_frota
 from app.services.analise_comparacao import processar_request_comparacao
-from app.services.analise_correlacao import processar_request_correlacao 
+from app.services.analise_correlacao import processar_request_correlacao, processar_request_matriz_correlacao
 from app.services.respose_ia import processar_request_pergunta
+from app.services.coleta_dados_service import obter_metricas_cache_series, invalidar_intervalo
+from app.services.gemini_service import obter_metricas_cache_insights, obter_metricas_disjuntor, obter_metricas_chamadas
+from app.services.insight_service import obter_insight, aguardar_insight, obter_metricas_insights
+from app.services.pre_calculo_service import servir_com_pre_calculo, invalidar_pre_calculo, obter_metricas_pre_calculo
+from app.utils.database import obter_metricas_pool
+from app.utils.rollup import obter_metricas_rollup
+from app.utils.cache_disco import obter_metricas_cache_disco
+from app.utils.acumuladores import obter_metricas_acumuladores
 
 logger = logging.getLogger(__name__)
 ai_bp = Blueprint("ai", __name__)
 
+# Tempo máximo de uma conexão SSE de insight e intervalo entre heartbeats
+INSIGHT_SSE_TIMEOUT_S = float(os.getenv("INSIGHT_SSE_TIMEOUT_S", "120"))
+INSIGHT_SSE_HEARTBEAT_S = float(os.getenv("INSIGHT_SSE_HEARTBEAT_S", "15"))
+
+# Token das rotas administrativas (/metricas e /cache/invalidar), enviado no
+# cabeçalho X-Admin-Token. Sem ADMIN_TOKEN essas rotas ficam desabilitadas.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+_VERDADEIROS = {"true", "1", "sim", "yes", "on"}
+_FALSOS = {"false", "0", "nao", "não", "no", "off", ""}
+
+
+class ParametroInvalido(ValueError):
+    """Valor de entrada que a rota responde com 400 (e não com 500)."""
+
+
+def ler_flag(dados_entrada: dict, campo: str, padrao: bool = False) -> bool:
+    """Lê um booleano do JSON aceitando true/false e as strings "true"/"false" (e "1"/"0")."""
+    valor = dados_entrada.get(campo)
+    if valor is None:
+        return padrao
+    if isinstance(valor, bool):
+        return valor
+    if isinstance(valor, int) and valor in (0, 1):
+        return bool(valor)
+    if isinstance(valor, str) and valor.strip().lower() in _VERDADEIROS | _FALSOS:
+        return valor.strip().lower() in _VERDADEIROS
+    raise ParametroInvalido(f"'{campo}' deve ser true ou false.")
+
+
+def ler_inteiro(dados_entrada: dict, campo: str, padrao=None, minimo: int = None):
+    """Lê um inteiro do JSON (número ou texto numérico); ausente/vazio devolve o padrão."""
+    valor = dados_entrada.get(campo)
+    if valor is None or valor == "":
+        return padrao
+    if isinstance(valor, bool):
+        raise ParametroInvalido(f"'{campo}' deve ser um número inteiro.")
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    try:
+        inteiro = int(valor.strip()) if isinstance(valor, str) else valor
+    except ValueError:
+        inteiro = None
+    if not isinstance(inteiro, int):
+        raise ParametroInvalido(f"'{campo}' deve ser um número inteiro.")
+    if minimo is not None and inteiro < minimo:
+        raise ParametroInvalido(f"'{campo}' deve ser no mínimo {minimo}.")
+    return inteiro
+
+
+def ler_data(dados_entrada: dict, campo: str) -> str:
+    """Lê uma data obrigatória (AAAA-MM-DD, com hora opcional) e a devolve como veio."""
+    valor = dados_entrada.get(campo)
+    if not valor:
+        raise ParametroInvalido(f"Informe '{campo}'.")
+    try:
+        if not isinstance(valor, str):
+            raise TypeError(campo)
+        np.datetime64(valor, "s")
+    except (TypeError, ValueError):
+        raise ParametroInvalido(f"'{campo}' deve ser uma data AAAA-MM-DD.")
+    return valor
+
+
+def exigir_admin(rota):
+    """Libera a rota só com o cabeçalho X-Admin-Token igual a ADMIN_TOKEN."""
+    @wraps(rota)
+    def protegida(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"erro": "Rota administrativa desabilitada: defina ADMIN_TOKEN."}), 403
+        token = request.headers.get("X-Admin-Token", "")
+        if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+            return jsonify({"erro": "Token administrativo ausente ou inválido."}), 401
+        return rota(*args, **kwargs)
+    return protegida
+
+
 def mapear_dados_entrada(dados_entrada: dict) -> AnaliseRequest:
     """Mapeia os dados brutos da requisição HTTP para a dataclass AnaliseRequest."""
     return AnaliseRequest(
@@ -21,13 +113,17 @@ def mapear_dados_entrada(dados_entrada: dict) -> AnaliseRequest:
         fkMaquina=dados_entrada.get("fkMaquina"),
         dataPrevisao=dados_entrada.get("dataPrevisao"),
         componente=dados_entrada.get("componente"),
-        variavelRelacionada=dados_entrada.get("variavelRelacionada")
+        variavelRelacionada=dados_entrada.get("variavelRelacionada"),
+        ignorarCacheIa=ler_flag(dados_entrada, "ignorarCacheIa"),
+        insightAssincrono=ler_flag(dados_entrada, "insightAssincrono"),
+        defasagemMaxima=ler_inteiro(dados_entrada, "defasagemMaxima", minimo=0) or None
     )
 
 def mapear_dados_entrada_ia(dados_entrada: dict) -> IARequest:
     """Mapeia os dados brutos da requisição HTTP para a dataclass AnaliseRequest."""
     return IARequest(
         pergunta=dados_entrada.get('pergunta'),
+        ignorarCacheIa=ler_flag(dados_entrada, 'ignorarCacheIa'),
     )
 
 @ai_bp.route("/correlacao", methods=["POST"])
@@ -50,11 +146,74 @@ def correlacao():
             
         return jsonify(resultado_final), 200
 
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
     except Exception as e:
         logger.error("Erro na rota /correlacao: %s", e)
         return jsonify({"erro": f"Falha interna: {e}"}), 500
 
 
+@ai_bp.route("/correlacao/matriz", methods=["POST"])
+def correlacao_matriz():
+    """Correlação entre todas as métricas de 'metricas' na mesma máquina (pares mais fortes)."""
+    try:
+        dados_entrada = request.get_json()
+        analise_req = mapear_dados_entrada(dados_entrada)
+        metricas = dados_entrada.get("metricas") or []
+
+        if not isinstance(metricas, list) or len(metricas) < 2:
+            return jsonify({"erro": "A matriz de correlação exige 'metricas' com ao menos 2 itens."}), 400
+        if not all(isinstance(m, str) and m.strip() for m in metricas):
+            raise ParametroInvalido("'metricas' deve ser uma lista de nomes de métricas (texto).")
+
+        resultado_final = processar_request_matriz_correlacao(
+            analise_req, metricas, ler_inteiro(dados_entrada, "topN", minimo=1)
+        )
+
+        if "erro" in resultado_final:
+            return jsonify(resultado_final), 400
+
+        return jsonify(resultado_final), 200
+
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    except Exception as e:
+        logger.error("Erro na rota /correlacao/matriz: %s", e)
+        return jsonify({"erro": f"Falha interna: {e}"}), 500
+
+
+@ai_bp.route("/correlacao/frota", methods=["POST"])
+def correlacao_frota():
+    """Ranking das máquinas da empresa pelo |r| entre metricaAnalisar e variavelRelacionada."""
+    try:
+        dados_entrada = request.get_json()
+        analise_req = mapear_dados_entrada(dados_entrada)
+
+        if not analise_req.fkEmpresa or not analise_req.metricaAnalisar or not analise_req.variavelRelacionada:
+            return jsonify({"erro": "A correlação da frota exige 'fkEmpresa', 'metricaAnalisar' e 'variavelRelacionada'."}), 400
+
+        resultado_final = processar_request_correlacao_frota(
+            analise_req,
+            pagina=ler_inteiro(dados_entrada, "pagina", 1, minimo=1),
+            tamanho_pagina=ler_inteiro(dados_entrada, "tamanhoPagina", minimo=1),
+            resumo_ia=ler_flag(dados_entrada, "resumoIa"),
+        )
+
+        if "erro" in resultado_final:
+            return jsonify(resultado_final), 400
+
+        return jsonify(resultado_final), 200
+
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    except Exception as e:
+        logger.error("Erro na rota /correlacao/frota: %s", e)
+        return jsonify({"erro": f"Falha interna: {e}"}), 500
+
+
 @ai_bp.route("/comparar", methods=["POST"])
 def comparar():
     """Rota para análise de Comparação."""
@@ -65,7 +224,7 @@ def comparar():
         if not analise_req.dataIncio:
              return jsonify({"erro": "Data de início é obrigatória."}), 400
 
-        resultado_final = processar_request_comparacao(analise_req)
+        resultado_final = servir_com_pre_calculo("comparacao", analise_req, processar_request_comparacao)
         
         if "erro" in resultado_final:
             return jsonify(resultado_final), 400
@@ -73,6 +232,9 @@ def comparar():
         logger.info("Análise de comparação processada com sucesso.")
         return jsonify(resultado_final), 200
 
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
     except Exception as e:
         logger.error("Erro inesperado na rota /comparar: %s", e)
         return jsonify({"erro": f"Falha no processamento: {e}"}), 500
@@ -92,17 +254,46 @@ def previsao():
         if not analise_req.dataPrevisao:
             return jsonify({"erro": "A análise de previsão exige 'dataPrevisao'."}), 400
 
-        resultado_final = processar_request_previsao(analise_req)
+        resultado_final = servir_com_pre_calculo("previsao", analise_req, processar_request_previsao)
         
         if "erro" in resultado_final:
             return jsonify(resultado_final), 400
             
         return jsonify(resultado_final), 200
 
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
     except Exception as e:
         logger.error("Erro inesperado na rota /previsao: %s", e)
         return jsonify({"erro": f"Falha no processamento da requisição: {e}"}), 500
     
+@ai_bp.route("/previsao/frota", methods=["POST"])
+def previsao_frota():
+    """Previsão da métrica para todas as máquinas da empresa, ordenadas por risco."""
+    try:
+        dados_entrada = request.get_json()
+        analise_req = mapear_dados_entrada(dados_entrada)
+
+        if not analise_req.fkEmpresa or not analise_req.metricaAnalisar:
+            return jsonify({"erro": "A previsão da frota exige 'fkEmpresa' e 'metricaAnalisar'."}), 400
+        if not analise_req.dataPrevisao:
+            return jsonify({"erro": "A análise de previsão exige 'dataPrevisao'."}), 400
+
+        resultado_final = processar_request_previsao_frota(analise_req)
+
+        if "erro" in resultado_final:
+            return jsonify(resultado_final), 400
+
+        return jsonify(resultado_final), 200
+
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    except Exception as e:
+        logger.error("Erro inesperado na rota /previsao/frota: %s", e)
+        return jsonify({"erro": f"Falha no processamento da requisição: {e}"}), 500
+
 @ai_bp.route("/responseIa", methods=["POST"])
 def responseIa():
     """
@@ -123,6 +314,93 @@ def responseIa():
             
         return jsonify(resultado_final), 200
 
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
     except Exception as e:
         logger.error("Erro inesperado na rota /responseIa: %s", e)
-        return jsonify({"erro": f"Falha no processamento da requisição: {e}"}), 500
\ No newline at end of file
+        return jsonify({"erro": f"Falha no processamento da requisição: {e}"}), 500
+
+
+@ai_bp.route("/insight/<insight_id>", methods=["GET"])
+def insight(insight_id):
+    """Consulta (polling) do insight gerado em segundo plano."""
+    resultado = obter_insight(insight_id)
+    if resultado is None:
+        return jsonify({"erro": "Insight não encontrado ou expirado."}), 404
+    return jsonify(resultado), 200
+
+
+@ai_bp.route("/insight/<insight_id>/stream", methods=["GET"])
+def insight_stream(insight_id):
+    """Server-Sent Events: envia o insight assim que ficar pronto (com heartbeats enquanto pendente)."""
+    if obter_insight(insight_id) is None:
+        return jsonify({"erro": "Insight não encontrado ou expirado."}), 404
+
+    def eventos():
+        restante = INSIGHT_SSE_TIMEOUT_S
+        while True:
+            espera = min(INSIGHT_SSE_HEARTBEAT_S, max(restante, 0))
+            resultado = aguardar_insight(insight_id, espera)
+            restante -= espera
+            if resultado is None:
+                yield "event: erro\ndata: {\"erro\": \"Insight expirado.\"}\n\n"
+                return
+            if resultado["status"] != "pendente" or restante <= 0:
+                yield f"event: insight\ndata: {json.dumps(resultado, ensure_ascii=False)}\n\n"
+                return
+            yield ": heartbeat\n\n"
+
+    return Response(
+        stream_with_context(eventos()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@ai_bp.route("/metricas", methods=["GET"])
+@exigir_admin
+def metricas():
+    """Métricas operacionais do serviço (pool de conexões do banco e caches)."""
+    try:
+        return jsonify({
+            "pool_db": obter_metricas_pool(),
+            "cache_series": obter_metricas_cache_series(),
+            "rollup": obter_metricas_rollup(),
+            "cache_disco": obter_metricas_cache_disco(),
+            "cache_insights": obter_metricas_cache_insights(),
+            "insights": obter_metricas_insights(),
+            "disjuntor_gemini": obter_metricas_disjuntor(),
+            "chamadas_gemini": obter_metricas_chamadas(),
+            "modelos_previsao": obter_metricas_modelos(),
+            "pre_calculo": obter_metricas_pre_calculo(),
+            "acumuladores": obter_metricas_acumuladores(),
+        }), 200
+    except Exception as e:
+        logger.error("Erro inesperado na rota /metricas: %s", e)
+        return jsonify({"erro": f"Falha ao obter métricas: {e}"}), 500
+
+
+@ai_bp.route("/cache/invalidar", methods=["POST"])
+@exigir_admin
+def invalidar_cache():
+    """Invalida um intervalo de datas nos caches de séries (memória, disco e rollup)."""
+    try:
+        dados_entrada = request.get_json()
+        data_inicio = ler_data(dados_entrada, "dataInicio")
+        data_fim = ler_data(dados_entrada, "dataFim")
+        if np.datetime64(data_fim, "s") < np.datetime64(data_inicio, "s"):
+            raise ParametroInvalido("'dataFim' deve ser igual ou posterior a 'dataInicio'.")
+
+        fk_empresa = ler_inteiro(dados_entrada, "fkEmpresa")
+        fk_maquina = ler_inteiro(dados_entrada, "fkMaquina")
+
+        resumo = invalidar_intervalo(data_inicio, data_fim, fkEmpresa=fk_empresa, fkMaquina=fk_maquina)
+        resumo["pre_calculo"] = invalidar_pre_calculo(fk_empresa, fk_maquina)
+        return jsonify({"invalidado": resumo}), 200
+
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+    except Exception as e:
+        logger.error("Erro inesperado na rota /cache/invalidar: %s", e)
+        return jsonify({"erro": f"Falha ao invalidar cache: {e}"}), 500
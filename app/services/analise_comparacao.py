@@ -1,14 +1,25 @@
-from .coleta_dados_service import coletar_dados_por_intervalo
-from .gemini_service import get_gemini_response
+from .coleta_dados_service import coletar_dados_periodos, agora_local, inicio_bucket
+from .insight_service import resolver_insight
 from app.models.dataModel import AnaliseRequest
+from app.utils.acumuladores import AcumuladorSerie, acumular_incremental
 from app.utils.helpers import calcular_agrupamento, formatar_resposta_frontend
+from app.utils.resumo_serie import resumo_serie_json
 from datetime import datetime, timedelta
+from dotenv import load_dotenv
 import logging
-import json
-import pandas as pd
+import os
 
 logger = logging.getLogger(__name__)
 
+load_dotenv()
+
+# Compactação do prompt: em vez dos registros brutos, vão estatísticas, extremos
+# e pontos de mudança de cada série, limitados a PROMPT_DADOS_LIMITE_CHARS no total.
+PROMPT_COMPACTO = os.getenv("PROMPT_COMPACTO", "1") == "1"
+PROMPT_DADOS_LIMITE_CHARS = int(os.getenv("PROMPT_DADOS_LIMITE_CHARS", "1600"))
+PROMPT_TOP_K = int(os.getenv("PROMPT_TOP_K", "3"))
+PROMPT_MAX_MUDANCAS = int(os.getenv("PROMPT_MAX_MUDANCAS", "3"))
+
 def calcular_periodo_anterior(data_inicio_str, data_fim_str):
     fmt = '%Y-%m-%d'
     try:
@@ -22,15 +33,27 @@ def calcular_periodo_anterior(data_inicio_str, data_fim_str):
         logger.error(f"Erro ao calcular datas: {e}")
         return None, None
 
-def preparar_dataframe_comparacao(dados_brutos):
-    if not dados_brutos:
-        return pd.DataFrame(columns=['data', 'valor'])
-    df = pd.DataFrame(dados_brutos, columns=['data', 'valor'])
-    df['data'] = pd.to_datetime(df['data'])
-    df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
-    if df['valor'].isnull().any():
-        df['valor'] = df['valor'].fillna(0)
-    return df
+def interpretacao_local_comparacao(nome_metrica, delta_str, total_atual, total_anterior):
+    """Texto determinístico (sem IA) a partir do delta já calculado; usado como fallback."""
+    if total_anterior <= 0:
+        return [
+            f"Sem histórico no período anterior para {nome_metrica}; total atual de {total_atual:.0f}.",
+            "Acompanhe os próximos períodos para estabelecer uma linha de base antes de concluir tendências.",
+        ]
+    delta_pct = (total_atual - total_anterior) / total_anterior * 100
+    if delta_pct > 5:
+        classificacao = "Aumento"
+        acao = "Verifique os dias de pico do período atual e os eventos associados (mudanças, deploys, carga)."
+    elif delta_pct < -5:
+        classificacao = "Redução"
+        acao = "Confirme se a queda decorre de correções aplicadas e mantenha o monitoramento."
+    else:
+        classificacao = "Estável"
+        acao = "Sem variação relevante; mantenha o monitoramento regular."
+    return [
+        f"{classificacao}: {nome_metrica} variou {delta_str} (Atual: {total_atual:.0f} vs Anterior: {total_anterior:.0f}).",
+        acao,
+    ]
 
 
 def processar_request_comparacao(analise_req: AnaliseRequest):
@@ -40,20 +63,39 @@ def processar_request_comparacao(analise_req: AnaliseRequest):
     data_inicio_ant, data_fim_ant = calcular_periodo_anterior(data_inicio_atual, data_fim_atual)
     agrupar_por = calcular_agrupamento(data_inicio_atual, data_fim_atual)
     
-    dados_atual = coletar_dados_por_intervalo(analise_req, data_inicio_atual, data_fim_atual, agrupar_por)
-    dados_anterior = coletar_dados_por_intervalo(analise_req, data_inicio_ant, data_fim_ant, agrupar_por)
+    # Atual e anterior saem de uma única ida ao banco
+    serie_atual, serie_anterior = coletar_dados_periodos(
+        analise_req,
+        (data_inicio_atual, data_fim_atual),
+        (data_inicio_ant, data_fim_ant),
+        agrupar_por
+    )
     
-    if not dados_atual:
+    if len(serie_atual) == 0:
         return {"analise_tipo": "comparacao", "erro": "Sem dados para o período atual selecionado."}
 
-    df_atual = preparar_dataframe_comparacao(dados_atual)
-    df_anterior = preparar_dataframe_comparacao(dados_anterior)
+    # Na comparação os nulos contam como 0 (totais e gráficos)
+    serie_atual = serie_atual.preencher_nulos("zero")
+    serie_anterior = serie_anterior.preencher_nulos("zero")
+    tem_anterior = len(serie_anterior) > 0
     
-    total_atual = df_atual['valor'].sum()
-    total_anterior = df_anterior['valor'].sum() if not df_anterior.empty else 0
+    # Totais e médias pelos acumuladores de cada período: só os buckets fechados
+    # desde a última comparação da mesma janela são somados
+    fechado_ate = inicio_bucket(agora_local(), agrupar_por)
+    chave_periodo = (analise_req.fkEmpresa, analise_req.fkMaquina, "comparacao",
+                     analise_req.metricaAnalisar, analise_req.componente, agrupar_por)
+    acumulado_atual = acumular_incremental(
+        chave_periodo + (data_inicio_atual, data_fim_atual), serie_atual.datas, (serie_atual.valores,), AcumuladorSerie, fechado_ate
+    )
+    acumulado_anterior = acumular_incremental(
+        chave_periodo + (data_inicio_ant, data_fim_ant), serie_anterior.datas, (serie_anterior.valores,), AcumuladorSerie, fechado_ate
+    ) if tem_anterior else AcumuladorSerie()
+
+    total_atual = acumulado_atual.soma
+    total_anterior = acumulado_anterior.soma if tem_anterior else 0
     
-    media_atual = df_atual['valor'].mean()
-    media_anterior = df_anterior['valor'].mean() if not df_anterior.empty else 0
+    media_atual = acumulado_atual.media
+    media_anterior = acumulado_anterior.media if tem_anterior else 0
     
     # Delta
     if total_anterior > 0:
@@ -71,18 +113,24 @@ def processar_request_comparacao(analise_req: AnaliseRequest):
         { "titulo": "Média Diária (Atual)", "valor": f"{media_atual:.1f}" }
     ]
     
-    valores_atual = [float(v) for v in df_atual['valor'].tolist()]
-    datas_atual = df_atual['data'].dt.strftime('%d/%m').tolist()
-    
-    if df_anterior.empty:
-        valores_anterior = []
-        datas_anterior = []
-    else:
-        valores_anterior = [float(v) for v in df_anterior['valor'].tolist()]
-        datas_anterior = df_anterior['data'].dt.strftime('%d/%m').tolist()
+    valores_atual = serie_atual.valores_lista()
+    datas_atual = serie_atual.rotulos()
+    valores_anterior = serie_anterior.valores_lista()
+    datas_anterior = serie_anterior.rotulos()
 
-    dados_atual_str = df_atual[['data', 'valor']].to_json(orient='records', date_format='iso')
-    dados_anterior_str = df_anterior[['data', 'valor']].to_json(orient='records', date_format='iso') if not df_anterior.empty else "[]"
+    if PROMPT_COMPACTO:
+        limite_serie = PROMPT_DADOS_LIMITE_CHARS // 2
+        dados_atual_str = resumo_serie_json(
+            serie_atual.datas, serie_atual.valores, limite_serie, PROMPT_TOP_K, PROMPT_MAX_MUDANCAS
+        )
+        dados_anterior_str = resumo_serie_json(
+            serie_anterior.datas, serie_anterior.valores, limite_serie, PROMPT_TOP_K, PROMPT_MAX_MUDANCAS
+        )
+        titulo_dados = "RESUMO DAS SÉRIES (JSON: estatísticas, extremos e pontos de mudança)"
+    else:
+        dados_atual_str = serie_atual.para_json()
+        dados_anterior_str = serie_anterior.para_json()
+        titulo_dados = "LOGS TEMPORAIS (JSON)"
 
     json_schema_ia = {
         "type": "object",
@@ -109,7 +157,7 @@ def processar_request_comparacao(analise_req: AnaliseRequest):
     - Métrica: {nome_metrica}
     - Delta: {delta_str} (Atual: {total_atual:.0f} vs Anterior: {total_anterior:.0f})
     
-    **LOGS TEMPORAIS (JSON):**
+    **{titulo_dados}:**
     - Atual: {dados_atual_str}
     - Anterior: {dados_anterior_str}
 
@@ -118,13 +166,8 @@ def processar_request_comparacao(analise_req: AnaliseRequest):
     2. **Ação Recomendada: dependenco da metrica e comportamento o que faria sentido o analista de ti fazer.
     """
     
-    try:
-        resposta_ia_json_str = get_gemini_response(prompt_gemini, json_schema_ia)
-        ia_data = json.loads(resposta_ia_json_str)
-        insight_ia = ia_data.get("interpretacao", ["Análise indisponível."])
-    except Exception as e:
-        logger.error("Falha Gemini Comparação: %s", e)
-        insight_ia = ["Erro na geração de análise."]
+    fallback = interpretacao_local_comparacao(nome_metrica, delta_str, total_atual, total_anterior)
+    insight_ia, insight_id = resolver_insight(analise_req, "comparacao", prompt_gemini, json_schema_ia, fallback)
 
     return formatar_resposta_frontend(
         analise_tipo="comparacao",
@@ -137,5 +180,6 @@ def processar_request_comparacao(analise_req: AnaliseRequest):
         data_antiga=valores_anterior, 
         data_futura=[], 
         tipo_modelo={"tipo": "Comparação Temporal", "metodo": "Delta Percentual"},
-        linha_regressao=[]
+        linha_regressao=[],
+        insight_id=insight_id
     )
\ No newline at end of file
@@ -1,46 +1,41 @@
-from .coleta_dados_service import coletar_dados_historicos
-from .gemini_service import get_gemini_response
+from .coleta_dados_service import coletar_dados_correlacao, coletar_multiplas_metricas, agora_local, inicio_bucket
+from .insight_service import resolver_insight
 from app.models.dataModel import AnaliseRequest
+from app.utils.acumuladores import AcumuladorPar, acumular_incremental
 from app.utils.helpers import calcular_agrupamento, formatar_resposta_frontend
+from app.utils.serie_temporal import SerieTemporal
+from dotenv import load_dotenv
 import logging
-import json
-import pandas as pd
+import os
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+load_dotenv()
 
-def preparar_datasets_correlacao(dados_a, dados_b):
-    """
-    Cria dois DataFrames e os alinha pela data (Inner Join).
-    Só mantemos registros onde temos dados de AMBAS as métricas.
-    """
-    if not dados_a or not dados_b:
-        return None
+# Matriz de correlação: limite de métricas por requisição e pares retornados por padrão
+CORRELACAO_MATRIZ_MAX_METRICAS = int(os.getenv("CORRELACAO_MATRIZ_MAX_METRICAS", "20"))
+CORRELACAO_MATRIZ_TOP_N = int(os.getenv("CORRELACAO_MATRIZ_TOP_N", "5"))
+# Correlação defasada: maior defasagem aceita (em buckets) e sobreposição mínima por defasagem
+CORRELACAO_DEFASAGEM_LIMITE = int(os.getenv("CORRELACAO_DEFASAGEM_LIMITE", "720"))
+CORRELACAO_DEFASAGEM_MIN_PONTOS = int(os.getenv("CORRELACAO_DEFASAGEM_MIN_PONTOS", "10"))
 
-    df_a = pd.DataFrame(dados_a, columns=['data', 'valor_a'])
-    df_b = pd.DataFrame(dados_b, columns=['data', 'valor_b'])
-    
-    df_a['data'] = pd.to_datetime(df_a['data'])
-    df_b['data'] = pd.to_datetime(df_b['data'])
-    
-    df_a['valor_a'] = pd.to_numeric(df_a['valor_a'], errors='coerce')
-    df_b['valor_b'] = pd.to_numeric(df_b['valor_b'], errors='coerce')
 
-    df_final = pd.merge(df_a, df_b, on='data', how='inner')
-    
-    df_final = df_final.sort_values('data')
-    
-    return df_final
+def _acumulador_par(dados) -> AcumuladorPar:
+    """
+    Aceita o acumulador do par ou, como antes, um DataFrame com as colunas
+    valor_a (Y, métrica principal) e valor_b (X, variável relacionada).
+    """
+    if isinstance(dados, AcumuladorPar):
+        return dados
+    return AcumuladorPar.de_valores(
+        np.asarray(dados['valor_b'], dtype=np.float64), np.asarray(dados['valor_a'], dtype=np.float64)
+    )
 
 
-def calcular_pearson(df):
-    """Calcula o coeficiente de correlação de Pearson."""
-    if len(df) < 2:
-        return 0
-    
-    correlacao = df['valor_a'].corr(df['valor_b'])
-    return correlacao if not np.isnan(correlacao) else 0
+def calcular_pearson(dados):
+    """Coeficiente de correlação de Pearson (O(1) a partir do acumulador do par)."""
+    return _acumulador_par(dados).pearson()
 
 def interpretar_correlacao(r):
     """Helper simples para dar um nome à força da correlação."""
@@ -51,30 +46,27 @@ def interpretar_correlacao(r):
     if abs_r > 0.3: return "Fraca"
     return "Inexistente/Desprezível"
 
-def calcular_regressao_linear(df):
+def calcular_regressao_linear(dados):
     """
     Calcula os coeficientes da regressão linear (Y = B0 + B1 * X)
     e gera dois pontos para desenhar a linha no frontend.
     Y = valor_a (Métrica Principal)
     X = valor_b (Variável Relacionada)
+    Os coeficientes e a extensão de X saem do acumulador do par, sem revisitar os pontos.
     """
-    if len(df) < 2:
+    acumulador = _acumulador_par(dados)
+    if acumulador.n < 2:
         return None, None, None
 
-    # Ajuste polinomial de grau 1: [B1 (inclinação), B0 (intercepto)]
-    # Usamos X = valor_b e Y = valor_a
-    coeficientes = np.polyfit(df['valor_b'], df['valor_a'], 1)
-    
-    # B1 (inclinação) e B0 (intercepto)
-    inclinacao_b1 = coeficientes[0] 
-    intercepto_b0 = coeficientes[1]
+    # B1 (inclinação) e B0 (intercepto): mínimos quadrados, como o polyfit de grau 1
+    inclinacao_b1, intercepto_b0 = acumulador.regressao()
     
     # -----------------------------------------------------------------
     # Geração dos Pontos para o Gráfico
     
     # Encontra os valores min/max de X (valor_b) para definir a extensão da linha
-    x_min = df['valor_b'].min()
-    x_max = df['valor_b'].max()
+    x_min = acumulador.min_x
+    x_max = acumulador.max_x
 
     # Se min e max forem iguais (como no seu exemplo), adicione uma pequena margem
     if x_min == x_max:
@@ -94,6 +86,88 @@ def calcular_regressao_linear(df):
     return inclinacao_b1, intercepto_b0, linha_regressao
 
 
+def calcular_correlacao_defasada(valores_a, valores_b, defasagem_maxima: int):
+    """
+    Pearson entre A(t) e B(t - k) para k em [-defasagem_maxima, defasagem_maxima],
+    em O(n log n): os produtos cruzados de todas as defasagens saem de uma
+    correlação cruzada por FFT e as somas de cada trecho sobreposto, de somas
+    acumuladas. k > 0 significa que B antecede A em k buckets.
+    Retorna (defasagens, r); r = 0 onde um dos trechos é constante.
+    """
+    n = len(valores_a)
+    defasagem_maxima = max(0, min(int(defasagem_maxima), n - 2))
+    # Centralizar reduz o cancelamento numérico nas somas
+    a = valores_a - valores_a.mean()
+    b = valores_b - valores_b.mean()
+
+    tamanho_fft = 1 << int(2 * n - 1).bit_length()
+    cruzada = np.fft.irfft(np.fft.rfft(a, tamanho_fft) * np.conj(np.fft.rfft(b, tamanho_fft)), tamanho_fft)
+
+    defasagens = np.arange(-defasagem_maxima, defasagem_maxima + 1)
+    soma_ab = cruzada[defasagens % tamanho_fft]
+    m = n - np.abs(defasagens)
+
+    acum_a = np.concatenate(([0.0], np.cumsum(a)))
+    acum_aa = np.concatenate(([0.0], np.cumsum(a * a)))
+    acum_b = np.concatenate(([0.0], np.cumsum(b)))
+    acum_bb = np.concatenate(([0.0], np.cumsum(b * b)))
+    # Trecho de A: [max(k, 0), n + min(k, 0)); trecho de B: [max(-k, 0), n - max(k, 0))
+    ini_a, fim_a = np.maximum(defasagens, 0), n + np.minimum(defasagens, 0)
+    ini_b, fim_b = np.maximum(-defasagens, 0), n - np.maximum(defasagens, 0)
+    soma_a, soma_aa = acum_a[fim_a] - acum_a[ini_a], acum_aa[fim_a] - acum_aa[ini_a]
+    soma_b, soma_bb = acum_b[fim_b] - acum_b[ini_b], acum_bb[fim_b] - acum_bb[ini_b]
+
+    covariancia = m * soma_ab - soma_a * soma_b
+    variancias = (m * soma_aa - soma_a ** 2) * (m * soma_bb - soma_b ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = covariancia / np.sqrt(variancias)
+    r = np.clip(np.nan_to_num(r, nan=0.0, posinf=0.0, neginf=0.0), -1.0, 1.0)
+    return defasagens, r
+
+
+def analisar_defasagem(serie_a, serie_b, agrupar_por: str, defasagem_maxima: int):
+    """
+    Leva as duas séries para uma grade regular (lacunas interpoladas) e procura
+    a defasagem de maior |r|. Retorna o dict da resposta ou None sem pontos suficientes.
+    """
+    grade_a, grade_b = SerieTemporal.em_grade([serie_a, serie_b], agrupar_por)
+    if len(grade_a) < CORRELACAO_DEFASAGEM_MIN_PONTOS:
+        return None
+    limite = min(defasagem_maxima, CORRELACAO_DEFASAGEM_LIMITE, len(grade_a) - CORRELACAO_DEFASAGEM_MIN_PONTOS)
+    defasagens, r = calcular_correlacao_defasada(grade_a.valores, grade_b.valores, max(limite, 0))
+
+    melhor = int(np.argmax(np.abs(r)))
+    return {
+        "melhorDefasagem": int(defasagens[melhor]),
+        "pearson": round(float(r[melhor]), 4),
+        "intensidade": interpretar_correlacao(r[melhor]),
+        "unidade": agrupar_por,
+        "pontos": len(grade_a),
+        "curva": {
+            "defasagens": defasagens.tolist(),
+            "r": np.round(r, 4).tolist(),
+        },
+    }
+
+
+def interpretacao_local_correlacao(var_a, var_b, pearson_r, intensidade):
+    """Texto determinístico (sem IA) a partir do r de Pearson; usado como fallback."""
+    if abs(pearson_r) > 0.7:
+        return [
+            f"Correlação {intensidade} (r={pearson_r:.2f}). '{var_b}' é a causa provável do comportamento de '{var_a}'.",
+            f"Gargalo provável. Analise o uso de '{var_b}' para provisionamento ou ajuste de software.",
+        ]
+    if abs(pearson_r) < 0.3:
+        return [
+            f"Correlação desprezível (r={pearson_r:.2f}). Hipótese de impacto de '{var_b}' em '{var_a}' descartada.",
+            "Descarte esta hipótese. Verifique a latência de rede ou o Event Viewer da máquina.",
+        ]
+    return [
+        f"Correlação {intensidade} (r={pearson_r:.2f}) entre '{var_b}' e '{var_a}'; relação parcial, não conclusiva.",
+        f"Cruze '{var_b}' com outras métricas antes de agir; a causa pode ser combinada.",
+    ]
+
+
 def processar_request_correlacao(analise_req: AnaliseRequest):
     """
     Orquestra a análise de correlação entre Métrica Principal e Variável Relacionada.
@@ -104,41 +178,54 @@ def processar_request_correlacao(analise_req: AnaliseRequest):
 
     agrupar_por = calcular_agrupamento(analise_req.dataIncio, analise_req.dataPrevisao)
     
-    dados_a = coletar_dados_historicos(analise_req, agrupar_por)
-    req_b = AnaliseRequest(
-        tipoAnalise=analise_req.tipoAnalise,
-        dataIncio=analise_req.dataIncio,
-        metricaAnalisar=analise_req.variavelRelacionada,
-        fkEmpresa=analise_req.fkEmpresa,
-        fkMaquina=analise_req.fkMaquina,
-        dataPrevisao=analise_req.dataPrevisao,
-        componente=analise_req.componente, 
-        variavelRelacionada=None
-    )
-    dados_b = coletar_dados_historicos(req_b, agrupar_por)
+    # Métrica principal e variável relacionada numa única ida ao banco
+    serie_a, serie_b = coletar_dados_correlacao(analise_req, agrupar_por)
     
-    if not dados_a or not dados_b:
+    if len(serie_a) == 0 or len(serie_b) == 0:
         return {"analise_tipo": "correlacao", "erro": "Sem dados suficientes para uma das variáveis."}
 
-    df = preparar_datasets_correlacao(dados_a, dados_b)
+    comum_a, comum_b = SerieTemporal.alinhar([serie_a, serie_b])
     
-    if df is None or len(df) < 2:
+    if len(comum_a) < 2:
         return {"analise_tipo": "correlacao", "erro": "Poucos dados em comum (datas não batem)."}
 
-    inclinacao_b1, intercepto_b0, linha_regressao = calcular_regressao_linear(df)
+    # Estatísticas do par: só os buckets fechados desde a última análise são somados
+    chave_par = (
+        analise_req.fkEmpresa, analise_req.fkMaquina, "correlacao", analise_req.metricaAnalisar,
+        analise_req.variavelRelacionada, analise_req.componente, agrupar_por, analise_req.dataIncio,
+    )
+    acumulador = acumular_incremental(
+        chave_par, comum_a.datas, (comum_b.valores, comum_a.valores), AcumuladorPar, inicio_bucket(agora_local(), agrupar_por)
+    )
+
+    inclinacao_b1, intercepto_b0, linha_regressao = calcular_regressao_linear(acumulador)
 
-    pearson_r = calcular_pearson(df)
+    pearson_r = calcular_pearson(acumulador)
     intensidade = interpretar_correlacao(pearson_r)
     
     lista_metricas = [
         { "titulo": "Coeficiente de Pearson (r)", "valor": f"{pearson_r:.2f}" },
         { "titulo": "Intensidade", "valor": intensidade },
-        { "titulo": "Pontos Analisados", "valor": f"{len(df)}" }
+        { "titulo": "Pontos Analisados", "valor": f"{acumulador.n}" }
     ]
+
+    defasagem = None
+    linha_defasagem = ""
+    if analise_req.defasagemMaxima:
+        defasagem = analisar_defasagem(serie_a, serie_b, agrupar_por, analise_req.defasagemMaxima)
+    if defasagem:
+        lista_metricas.append({
+            "titulo": "Melhor Defasagem",
+            "valor": f"{defasagem['melhorDefasagem']} ({agrupar_por}) r={defasagem['pearson']:.2f}"
+        })
+        linha_defasagem = (
+            f"- Maior correlação com defasagem de {defasagem['melhorDefasagem']} bucket(s) de {agrupar_por} "
+            f"(r={defasagem['pearson']:.2f}; positivo = '{analise_req.variavelRelacionada}' antecede '{analise_req.metricaAnalisar}')"
+        )
     
-    valores_a = [float(v) for v in df['valor_a'].tolist()]
-    valores_b = [float(v) for v in df['valor_b'].tolist()]
-    datas_comuns = df['data'].dt.strftime('%d/%m').tolist()
+    valores_a = comum_a.valores_lista()
+    valores_b = comum_b.valores_lista()
+    datas_comuns = comum_a.rotulos()
 
     json_schema_ia = {
         "type": "object",
@@ -164,21 +251,17 @@ def processar_request_correlacao(analise_req: AnaliseRequest):
     - Variável A (Y): '{var_a}' (Principal)
     - Variável B (X): '{var_b}' (Relacionada)
     - Coeficiente Pearson (r): {pearson_r:.2f} ({intensidade})
+    {linha_defasagem}
 
     **OUTPUT JSON (2 strings):**
     1. **Diagnóstico (Causa-Raiz):** Veredito final: A Variável B é a causa do problema na Variável A? (Se r > 0.7: "Correlação Forte. '{var_b}' é a causa principal de '{var_a}'." | Se r < 0.3: "Correlação desprezível. Hipótese de impacto de '{var_b}' descartada.").
     2. **Ação Técnica:** Instrução imediata de alguém que cria solução de problemas. (Se Forte: "Gargalo de hardware provável. Analisar o uso exato do componente B para provisionamento ou ajuste de software." | Se Fraca: "Descartar esta hipótese. Verifique a Latência de Rede ou o Event Viewer da máquina.").
     """
     
-    try:
-        resposta_ia_json_str = get_gemini_response(prompt_gemini, json_schema_ia)
-        ia_data = json.loads(resposta_ia_json_str)
-        insight_ia = ia_data.get("interpretacao", ["Análise indisponível."])
-    except Exception as e:
-        logger.error("Falha Gemini Correlação: %s", e)
-        insight_ia = ["Erro na geração de análise."]
-
-    return formatar_resposta_frontend(
+    fallback = interpretacao_local_correlacao(var_a, var_b, pearson_r, intensidade)
+    insight_ia, insight_id = resolver_insight(analise_req, "correlacao", prompt_gemini, json_schema_ia, fallback)
+
+    resposta = formatar_resposta_frontend(
         analise_tipo="correlacao",
         agrupamento=agrupar_por,
         insight_ia=insight_ia,
@@ -189,5 +272,90 @@ def processar_request_correlacao(analise_req: AnaliseRequest):
         data_futura=[],            
         data_antiga=valores_b,  
         tipo_modelo={"tipo": "Correlação Estatística", "metodo": "Pearson"},
-        linha_regressao=linha_regressao if linha_regressao else []
-    )
\ No newline at end of file
+        linha_regressao=linha_regressao if linha_regressao else [],
+        insight_id=insight_id
+    )
+    if defasagem:
+        resposta["defasagem"] = defasagem
+    return resposta
+
+
+def calcular_matriz_correlacao(valores):
+    """
+    Pearson e regressão linear de todos os pares de uma vez.
+    valores: matriz (métricas x pontos) já alinhada.
+    Retorna (r, inclinacao, intercepto), todos (k x k); na linha i, coluna j,
+    a regressão é Y = métrica i, X = métrica j. Séries constantes ficam com r = 0.
+    """
+    covariancia = np.atleast_2d(np.cov(valores))
+    variancias = np.diag(covariancia)
+    medias = valores.mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = covariancia / np.sqrt(np.outer(variancias, variancias))
+        inclinacao = covariancia / variancias[None, :]
+    r = np.clip(np.nan_to_num(r, nan=0.0, posinf=0.0, neginf=0.0), -1.0, 1.0)
+    inclinacao = np.nan_to_num(inclinacao, nan=0.0, posinf=0.0, neginf=0.0)
+    intercepto = medias[:, None] - inclinacao * medias[None, :]
+    return r, inclinacao, intercepto
+
+
+def processar_request_matriz_correlacao(analise_req: AnaliseRequest, metricas: list, top_n: int = None):
+    """
+    Correlação entre todas as métricas informadas na mesma máquina: uma coleta
+    em lote, alinhamento pelas datas comuns e a matriz de Pearson completa,
+    com os top_n pares mais fortes (|r|) e a regressão de cada par.
+    """
+    metricas = metricas or []
+    if not isinstance(metricas, (list, tuple)) or not all(isinstance(m, str) and m.strip() for m in metricas):
+        return {"analise_tipo": "correlacao_matriz", "erro": "'metricas' deve ser uma lista de nomes de métricas (texto)."}
+    metricas = list(dict.fromkeys(metricas))
+    if len(metricas) < 2:
+        return {"analise_tipo": "correlacao_matriz", "erro": "Informe ao menos 2 métricas em 'metricas'."}
+    if len(metricas) > CORRELACAO_MATRIZ_MAX_METRICAS:
+        return {"analise_tipo": "correlacao_matriz", "erro": f"Máximo de {CORRELACAO_MATRIZ_MAX_METRICAS} métricas por análise."}
+    top_n = CORRELACAO_MATRIZ_TOP_N if top_n is None else max(1, int(top_n))
+
+    agrupar_por = calcular_agrupamento(analise_req.dataIncio, analise_req.dataPrevisao)
+    _, valores_por_metrica = coletar_multiplas_metricas(analise_req, metricas, agrupar_por)
+
+    valores = np.vstack([valores_por_metrica[m] for m in metricas])
+    # Só os instantes com todas as métricas preenchidas
+    valores = valores[:, ~np.isnan(valores).any(axis=0)]
+    if valores.shape[1] < 2:
+        return {"analise_tipo": "correlacao_matriz", "erro": "Poucos dados em comum (datas não batem)."}
+
+    r, inclinacao, intercepto = calcular_matriz_correlacao(valores)
+
+    i, j = np.triu_indices(len(metricas), k=1)
+    ordem = np.argsort(-np.abs(r[i, j]), kind='stable')[:top_n]
+    pares = [
+        {
+            "variavelA": metricas[a],
+            "variavelB": metricas[b],
+            "pearson": round(float(r[a, b]), 4),
+            "intensidade": interpretar_correlacao(r[a, b]),
+            "inclinacao": round(float(inclinacao[a, b]), 4),
+            "intercepto": round(float(intercepto[a, b]), 4),
+        }
+        for a, b in zip(i[ordem], j[ordem])
+    ]
+
+    mais_forte = pares[0]
+    lista_metricas = [
+        { "titulo": "Métricas Analisadas", "valor": f"{len(metricas)}" },
+        { "titulo": "Pares Avaliados", "valor": f"{len(i)}" },
+        { "titulo": "Par Mais Forte (r)", "valor": f"{mais_forte['pearson']:.2f}" },
+        { "titulo": "Pontos Analisados", "valor": f"{valores.shape[1]}" }
+    ]
+    interpretacao = interpretacao_local_correlacao(
+        mais_forte["variavelA"], mais_forte["variavelB"], mais_forte["pearson"], mais_forte["intensidade"]
+    )
+
+    return {
+        "analise_tipo": "correlacao_matriz",
+        "agrupamento": agrupar_por,
+        "iaMetricas": {"interpretacao": interpretacao, "chave_metricas": lista_metricas},
+        "metricas": metricas,
+        "matriz": np.round(r, 4).tolist(),
+        "pares": pares,
+    }
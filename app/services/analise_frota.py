@@ -0,0 +1,431 @@
+from .coleta_dados_service import coletar_series_frota, coletar_pares_frota
+from .analise_previsao import classificar_risco
+from .analise_correlacao import interpretar_correlacao
+from .insight_service import resolver_insight
+from app.models.dataModel import AnaliseRequest
+from app.utils.helpers import calcular_agrupamento
+from app.utils.serie_temporal import SerieTemporal
+from dotenv import load_dotenv
+import itertools
+import json
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+PASSOS_PREVISAO_FROTA = 5
+MINIMO_PONTOS_FROTA = 5
+# Máquinas (as de maior risco) detalhadas no prompt do resumo da frota
+FROTA_MAQUINAS_NO_PROMPT = int(os.getenv("FROTA_MAQUINAS_NO_PROMPT", "10"))
+FROTA_TAMANHO_PAGINA = int(os.getenv("FROTA_TAMANHO_PAGINA", "20"))
+MINIMO_PONTOS_CORRELACAO_FROTA = 3
+
+# Grade de parâmetros (α, β, φ) do Holt amortecido avaliada em paralelo para todas as máquinas
+_GRADE_HOLT = np.array(list(itertools.product(
+    (0.1, 0.3, 0.5, 0.7, 0.9),
+    (0.01, 0.1, 0.2, 0.4),
+    (0.8, 0.9, 0.98),
+)))
+
+_ORDINAL_EPOCA = 719163
+_ORDEM_RISCO = {"CRÍTICO": 0, "ATENÇÃO": 1, "NORMAL": 2}
+
+
+def montar_matriz_frota(series: dict):
+    """
+    Empilha as séries das máquinas numa grade comum de datas.
+    Retorna (maquinas, datas_grade, Y) com Y (máquinas x datas) e NaN onde a
+    máquina não tem ponto (ou o valor veio nulo).
+    """
+    maquinas = list(series)
+    datas_grade = np.unique(np.concatenate([serie.datas for serie in series.values()]))
+    Y = np.full((len(maquinas), len(datas_grade)), np.nan)
+    for i, maquina in enumerate(maquinas):
+        serie = series[maquina]
+        Y[i, np.searchsorted(datas_grade, serie.datas)] = serie.valores
+    return maquinas, datas_grade, Y
+
+
+def ajustar_polinomios_frota(datas_grade, Y, grau, passos_futuros):
+    """
+    Mínimos quadrados ponderados (peso 0 onde falta ponto) de todas as máquinas
+    de uma vez: as equações normais (máquinas x (grau+1) x (grau+1)) são
+    montadas com einsum e resolvidas em lote. O eixo é o ordinal do dia, como
+    na previsão individual. Retorna (rmse, r2, projecao) por máquina.
+    """
+    ordinais = datas_grade.astype('datetime64[D]').astype(np.int64) + _ORDINAL_EPOCA
+    centro = ordinais.mean()
+    escala = max(float(ordinais.std()), 1.0)
+    x = (ordinais - centro) / escala
+
+    pesos = ~np.isnan(Y)
+    Y0 = np.where(pesos, Y, 0.0)
+    W = pesos.astype(np.float64)
+    V = np.vander(x, grau + 1)
+
+    A = np.einsum('mt,tj,tk->mjk', W, V, V)
+    b = np.einsum('mt,tj->mj', W * Y0, V)
+    # pinv resolve também máquinas com menos datas distintas que o grau
+    coeficientes = np.einsum('mjk,mk->mj', np.linalg.pinv(A), b)
+
+    ajustados = coeficientes @ V.T
+    n = W.sum(axis=1)
+    ss_res = (W * (Y0 - ajustados) ** 2).sum(axis=1)
+    medias = (W * Y0).sum(axis=1) / np.maximum(n, 1)
+    ss_tot = (W * (Y0 - medias[:, None]) ** 2).sum(axis=1)
+    r2 = np.where(ss_tot > 0, 1 - ss_res / np.where(ss_tot > 0, ss_tot, 1), np.where(ss_res == 0, 1.0, 0.0))
+    rmse = np.sqrt(ss_res / np.maximum(n, 1))
+
+    # Projeção a partir do último dia com dado de cada máquina
+    ultimo = np.array([ordinais[np.flatnonzero(linha)[-1]] for linha in pesos])
+    x_futuro = ((ultimo[:, None] + np.arange(1, passos_futuros + 1)) - centro) / escala
+    V_futuro = x_futuro[..., None] ** np.arange(grau, -1, -1)
+    projecao = np.einsum('mhj,mj->mh', V_futuro, coeficientes)
+    return rmse, r2, projecao
+
+
+def _alinhar_a_direita(Y):
+    """Valores de cada máquina em sequência (sem as lacunas da grade), alinhados pelo fim."""
+    sequencias = [linha[~np.isnan(linha)] for linha in Y]
+    comprimento = max(len(seq) for seq in sequencias)
+    H = np.full((len(sequencias), comprimento), np.nan)
+    for i, seq in enumerate(sequencias):
+        H[i, comprimento - len(seq):] = seq
+    return H
+
+
+def ajustar_holt_frota(Y, passos_futuros):
+    """
+    Holt amortecido para todas as máquinas ao mesmo tempo: a recursão avança
+    no tempo sobre uma matriz (máquinas x combinações da grade de α, β, φ) e
+    cada máquina fica com a combinação de menor erro um passo à frente.
+    Nível inicial = primeiro valor, tendência inicial = 0.
+    Retorna (rmse, r2, projecao) por máquina.
+    """
+    H = _alinhar_a_direita(Y)
+    m = H.shape[0]
+    alpha, beta, phi = (_GRADE_HOLT[:, j][None, :] for j in range(3))
+
+    nivel = np.full((m, len(_GRADE_HOLT)), np.nan)
+    tendencia = np.zeros_like(nivel)
+    sse = np.zeros_like(nivel)
+    iniciada = np.zeros(m, dtype=bool)
+    avaliados = np.zeros(m)
+
+    for t in range(H.shape[1]):
+        y = H[:, t][:, None]
+        primeira = ~np.isnan(H[:, t]) & ~iniciada
+        atualiza = ~np.isnan(H[:, t]) & iniciada
+
+        previsto = nivel + phi * tendencia
+        erro = np.where(atualiza[:, None], y - previsto, 0.0)
+        sse += erro ** 2
+        avaliados += atualiza
+        novo_nivel = alpha * y + (1 - alpha) * previsto
+        nova_tendencia = beta * (novo_nivel - nivel) + (1 - beta) * phi * tendencia
+
+        nivel = np.where(atualiza[:, None], novo_nivel, nivel)
+        tendencia = np.where(atualiza[:, None], nova_tendencia, tendencia)
+        nivel = np.where(primeira[:, None], y, nivel)
+        iniciada |= primeira
+
+    melhor = np.argmin(sse, axis=1)
+    linhas = np.arange(m)
+    nivel, tendencia, sse = nivel[linhas, melhor], tendencia[linhas, melhor], sse[linhas, melhor]
+    phi_melhor = _GRADE_HOLT[melhor, 2]
+
+    n = np.maximum(avaliados, 1)
+    rmse = np.sqrt(sse / n)
+    # O primeiro ponto de cada máquina só inicializa o nível; fica fora do R²
+    valores_avaliados = H.copy()
+    valores_avaliados[linhas, np.argmax(~np.isnan(H), axis=1)] = np.nan
+    medias = np.nanmean(valores_avaliados, axis=1)
+    ss_tot = np.nansum((valores_avaliados - medias[:, None]) ** 2, axis=1)
+    r2 = np.where(ss_tot > 0, 1 - sse / np.where(ss_tot > 0, ss_tot, 1), 0.0)
+
+    fatores = np.cumsum(phi_melhor[:, None] ** np.arange(1, passos_futuros + 1), axis=1)
+    projecao = nivel[:, None] + fatores * tendencia[:, None]
+    return rmse, r2, projecao
+
+
+def interpretacao_local_frota(nome_metrica, ranking, total_maquinas):
+    """Resumo determinístico (sem IA) da frota; usado como fallback."""
+    criticas = [str(m["fkMaquina"]) for m in ranking if m["risco"] == "CRÍTICO"]
+    atencao = [str(m["fkMaquina"]) for m in ranking if m["risco"] == "ATENÇÃO"]
+    if criticas:
+        primeiro = f"Risco CRÍTICO em {len(criticas)} de {total_maquinas} máquinas para {nome_metrica}: {', '.join(criticas[:10])}."
+    elif atencao:
+        primeiro = f"Nenhuma máquina crítica; {len(atencao)} de {total_maquinas} em ATENÇÃO para {nome_metrica}: {', '.join(atencao[:10])}."
+    else:
+        primeiro = f"Frota ESTÁVEL para {nome_metrica}: nenhuma das {total_maquinas} máquinas com risco projetado."
+    segundo = (
+        "Priorize as máquinas críticas (limpeza ou provisionamento) e reavalie as em atenção no próximo ciclo."
+        if criticas or atencao else "Manter monitoramento regular."
+    )
+    return [primeiro, segundo]
+
+
+def processar_request_previsao_frota(analise_req: AnaliseRequest):
+    """
+    Previsão para todas as máquinas da empresa: coleta em lote, ajuste linear,
+    polinomial e Holt empilhados (2-D), ranking por risco e um único resumo da IA.
+    """
+    agrupar_por = calcular_agrupamento(analise_req.dataIncio, analise_req.dataPrevisao)
+    series = coletar_series_frota(analise_req, agrupar_por)
+    if not series:
+        return {"analise_tipo": "previsao_frota", "erro": "Nenhuma máquina com dados para a empresa."}
+
+    suficientes = {
+        maquina: serie for maquina, serie in series.items()
+        if np.count_nonzero(~np.isnan(serie.valores)) >= MINIMO_PONTOS_FROTA
+    }
+    sem_dados = [maquina for maquina in series if maquina not in suficientes]
+    if not suficientes:
+        return {"analise_tipo": "previsao_frota", "erro": "Dados insuficientes (mínimo 5 pontos) em todas as máquinas."}
+
+    maquinas, datas_grade, Y = montar_matriz_frota(suficientes)
+    modelos = [
+        ("Regressão Linear",) + ajustar_polinomios_frota(datas_grade, Y, 1, PASSOS_PREVISAO_FROTA),
+        ("Polinomial (Grau 2)",) + ajustar_polinomios_frota(datas_grade, Y, 2, PASSOS_PREVISAO_FROTA),
+        ("Suavização Exponencial (Holt)",) + ajustar_holt_frota(Y, PASSOS_PREVISAO_FROTA),
+    ]
+    rmse = np.stack([m[1] for m in modelos])
+    vencedor = np.argmin(rmse, axis=0)
+
+    contexto_componente = f" ({analise_req.componente})" if analise_req.componente and analise_req.componente != 'TODOS' else ""
+    nome_metrica = f"{analise_req.metricaAnalisar}{contexto_componente}"
+
+    ranking = []
+    for i, maquina in enumerate(maquinas):
+        nome, rmse_m, r2_m, projecao_m = modelos[vencedor[i]]
+        validos = Y[i][~np.isnan(Y[i])]
+        projecao = [float(round(v, 2)) for v in projecao_m[i]]
+        ultimo_valor_real = float(validos[-1])
+        risco = classificar_risco(nome_metrica, ultimo_valor_real, projecao[-1])
+        ranking.append({
+            "fkMaquina": maquina,
+            "modelo": nome,
+            "rmse": float(rmse_m[i]),
+            "r2": float(r2_m[i]),
+            "pontos": int(len(validos)),
+            "ultimoValor": round(ultimo_valor_real, 2),
+            "projecao": projecao,
+            "variacao": round((projecao[-1] - ultimo_valor_real) / abs(ultimo_valor_real) * 100, 1) if ultimo_valor_real else None,
+            "risco": risco,
+        })
+    ranking.sort(key=lambda m: (_ORDEM_RISCO[m["risco"]], -m["projecao"][-1]))
+
+    contagem = {nivel: sum(1 for m in ranking if m["risco"] == nivel) for nivel in _ORDEM_RISCO}
+    lista_metricas = [
+        {"titulo": "Máquinas Analisadas", "valor": f"{len(ranking)}"},
+        {"titulo": "Risco CRÍTICO", "valor": f"{contagem['CRÍTICO']}"},
+        {"titulo": "Risco ATENÇÃO", "valor": f"{contagem['ATENÇÃO']}"},
+        {"titulo": "Sem Dados Suficientes", "valor": f"{len(sem_dados)}"},
+    ]
+
+    json_schema_ia = {
+        "type": "object",
+        "properties": {
+            "interpretacao": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Lista de 2 parágrafos curtos."
+            }
+        },
+        "required": ["interpretacao"]
+    }
+
+    destaque = [
+        {k: m[k] for k in ("fkMaquina", "risco", "ultimoValor", "variacao")} | {"projecaoFinal": m["projecao"][-1]}
+        for m in ranking[:FROTA_MAQUINAS_NO_PROMPT]
+    ]
+    prompt_gemini = f"""
+    **ROLE:** Engenheiro de Capacidade / SysAdmin.
+    **USUÁRIO:** Analista de TI. Use linguagem técnica.
+    **REGRAS:** Máximo 40 palavras por parágrafo. Sem introduções.
+
+    **PROJEÇÃO DA FROTA:**
+    - Métrica: {nome_metrica}
+    - Máquinas analisadas: {len(ranking)} (CRÍTICO: {contagem['CRÍTICO']}, ATENÇÃO: {contagem['ATENÇÃO']}, NORMAL: {contagem['NORMAL']})
+    - Maiores riscos (JSON): {json.dumps(destaque, ensure_ascii=False)}
+
+    **OUTPUT JSON (2 strings):**
+    1. **Panorama da Frota:** Quais máquinas exigem ação primeiro e por quê.
+    2. **Plano de Ação:** Recomendação técnica priorizada para a frota.
+    """
+
+    fallback = interpretacao_local_frota(nome_metrica, ranking, len(ranking))
+    insight_ia, insight_id = resolver_insight(analise_req, "frota", prompt_gemini, json_schema_ia, fallback)
+
+    ia_metricas = {"interpretacao": insight_ia, "chave_metricas": lista_metricas}
+    if insight_id:
+        ia_metricas["insight_id"] = insight_id
+        ia_metricas["insight_status"] = "pendente"
+    return {
+        "analise_tipo": "previsao_frota",
+        "agrupamento": agrupar_por,
+        "iaMetricas": ia_metricas,
+        "maquinas": ranking,
+        "maquinas_sem_dados": sem_dados,
+    }
+
+
+def correlacionar_frota(pares: list):
+    """
+    Pearson e regressão (Y = A, X = B) de várias máquinas de uma vez.
+    pares: lista de (valores_a, valores_b) já alinhados, de tamanhos diferentes;
+    são empilhados numa matriz com NaN à direita e as somas ignoram os NaN.
+    Retorna (r, inclinacao, intercepto, pontos) por máquina.
+    """
+    comprimento = max((len(a) for a, _ in pares), default=0)
+    A = np.full((len(pares), comprimento), np.nan)
+    B = np.full_like(A, np.nan)
+    for i, (valores_a, valores_b) in enumerate(pares):
+        A[i, :len(valores_a)] = valores_a
+        B[i, :len(valores_b)] = valores_b
+
+    validos = ~(np.isnan(A) | np.isnan(B))
+    A = np.where(validos, A, 0.0)
+    B = np.where(validos, B, 0.0)
+    pontos = validos.sum(axis=1)
+    n = np.maximum(pontos, 1)
+    media_a = A.sum(axis=1) / n
+    media_b = B.sum(axis=1) / n
+    desvio_a = np.where(validos, A - media_a[:, None], 0.0)
+    desvio_b = np.where(validos, B - media_b[:, None], 0.0)
+    cov = (desvio_a * desvio_b).sum(axis=1)
+    var_a = (desvio_a ** 2).sum(axis=1)
+    var_b = (desvio_b ** 2).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = cov / np.sqrt(var_a * var_b)
+        inclinacao = cov / var_b
+    r = np.clip(np.nan_to_num(r, nan=0.0, posinf=0.0, neginf=0.0), -1.0, 1.0)
+    inclinacao = np.nan_to_num(inclinacao, nan=0.0, posinf=0.0, neginf=0.0)
+    intercepto = media_a - inclinacao * media_b
+    return r, inclinacao, intercepto, pontos
+
+
+def interpretacao_local_correlacao_frota(var_a, var_b, ranking):
+    """Resumo determinístico (sem IA) do ranking de correlação da frota; usado como fallback."""
+    fortes = [str(m["fkMaquina"]) for m in ranking if abs(m["pearson"]) > 0.7]
+    if fortes:
+        primeiro = (
+            f"'{var_a}' acompanha '{var_b}' de forma forte em {len(fortes)} de {len(ranking)} máquinas: "
+            f"{', '.join(fortes[:10])}."
+        )
+        segundo = f"Nessas máquinas, investigue '{var_b}' como causa provável; nas demais a causa é outra."
+    else:
+        primeiro = f"Nenhuma das {len(ranking)} máquinas mostra correlação forte entre '{var_a}' e '{var_b}'."
+        segundo = f"Descarte '{var_b}' como causa comum da degradação de '{var_a}' na frota."
+    return [primeiro, segundo]
+
+
+def processar_request_correlacao_frota(analise_req: AnaliseRequest, pagina: int = 1,
+                                       tamanho_pagina: int = None, resumo_ia: bool = False):
+    """
+    Em quais máquinas da empresa metricaAnalisar acompanha variavelRelacionada:
+    as duas métricas de todas as máquinas vêm num único lote (2N séries), o r e a regressão de
+    cada máquina saem de operações vetorizadas e o ranking (por |r|) é paginado.
+    Com resumo_ia, um único insight da IA resume o ranking inteiro.
+    """
+    if not analise_req.variavelRelacionada:
+        return {"analise_tipo": "correlacao_frota", "erro": "Variável relacionada não fornecida."}
+    tamanho_pagina = max(1, int(tamanho_pagina or FROTA_TAMANHO_PAGINA))
+    pagina = max(1, int(pagina or 1))
+
+    agrupar_por = calcular_agrupamento(analise_req.dataIncio, analise_req.dataPrevisao)
+    series = coletar_pares_frota(analise_req, agrupar_por)
+    if not series:
+        return {"analise_tipo": "correlacao_frota", "erro": "Nenhuma máquina com dados para a empresa."}
+
+    maquinas, pares, sem_dados = [], [], []
+    for maquina, (serie_a, serie_b) in series.items():
+        if len(serie_a) == 0 or len(serie_b) == 0:
+            sem_dados.append(maquina)
+            continue
+        comum_a, comum_b = SerieTemporal.alinhar([serie_a, serie_b])
+        maquinas.append(maquina)
+        pares.append((comum_a.valores, comum_b.valores))
+    if not pares:
+        return {"analise_tipo": "correlacao_frota", "erro": "Sem dados em comum das duas métricas em nenhuma máquina."}
+
+    r, inclinacao, intercepto, pontos = correlacionar_frota(pares)
+    suficientes = pontos >= MINIMO_PONTOS_CORRELACAO_FROTA
+    sem_dados += [maquina for maquina, ok in zip(maquinas, suficientes) if not ok]
+
+    ordem = [i for i in np.argsort(-np.abs(r), kind='stable') if suficientes[i]]
+    ranking = [
+        {
+            "fkMaquina": maquinas[i],
+            "pearson": round(float(r[i]), 4),
+            "intensidade": interpretar_correlacao(r[i]),
+            "inclinacao": round(float(inclinacao[i]), 4),
+            "intercepto": round(float(intercepto[i]), 4),
+            "pontos": int(pontos[i]),
+        }
+        for i in ordem
+    ]
+    if not ranking:
+        return {"analise_tipo": "correlacao_frota", "erro": "Poucos dados em comum (datas não batem) em todas as máquinas."}
+
+    var_a, var_b = analise_req.metricaAnalisar, analise_req.variavelRelacionada
+    fortes = sum(1 for m in ranking if abs(m["pearson"]) > 0.7)
+    lista_metricas = [
+        {"titulo": "Máquinas Analisadas", "valor": f"{len(ranking)}"},
+        {"titulo": "Correlação Forte (|r| > 0.7)", "valor": f"{fortes}"},
+        {"titulo": "Maior |r|", "valor": f"{ranking[0]['pearson']:.2f} (máquina {ranking[0]['fkMaquina']})"},
+        {"titulo": "Sem Dados Suficientes", "valor": f"{len(sem_dados)}"},
+    ]
+
+    fallback = interpretacao_local_correlacao_frota(var_a, var_b, ranking)
+    insight_ia, insight_id = fallback, None
+    if resumo_ia:
+        json_schema_ia = {
+            "type": "object",
+            "properties": {
+                "interpretacao": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Lista de 2 parágrafos curtos."
+                }
+            },
+            "required": ["interpretacao"]
+        }
+        destaque = [
+            {k: m[k] for k in ("fkMaquina", "pearson", "inclinacao", "pontos")}
+            for m in ranking[:FROTA_MAQUINAS_NO_PROMPT]
+        ]
+        prompt_gemini = f"""
+        **ROLE:** Analista Sênior de Suporte N3 / SRE (Site Reliability Engineer).
+        **REGRAS:** Gere 2 parágrafos curtos. MÁXIMO 40 PALAVRAS por parágrafo. Sem introduções.
+
+        **CORRELAÇÃO NA FROTA:**
+        - Variável A (Y): '{var_a}' | Variável B (X): '{var_b}'
+        - Máquinas analisadas: {len(ranking)} (correlação forte em {fortes})
+        - Maiores |r| (JSON): {json.dumps(destaque, ensure_ascii=False)}
+
+        **OUTPUT JSON (2 strings):**
+        1. **Diagnóstico:** Em quais máquinas '{var_b}' explica '{var_a}' e se o padrão é geral ou localizado.
+        2. **Ação Técnica:** Próximo passo de investigação para a frota.
+        """
+        insight_ia, insight_id = resolver_insight(analise_req, "frota", prompt_gemini, json_schema_ia, fallback)
+
+    inicio = (pagina - 1) * tamanho_pagina
+    ia_metricas = {"interpretacao": insight_ia, "chave_metricas": lista_metricas}
+    if insight_id:
+        ia_metricas["insight_id"] = insight_id
+        ia_metricas["insight_status"] = "pendente"
+    return {
+        "analise_tipo": "correlacao_frota",
+        "agrupamento": agrupar_por,
+        "iaMetricas": ia_metricas,
+        "pagina": pagina,
+        "tamanhoPagina": tamanho_pagina,
+        "total": len(ranking),
+        "maquinas": ranking[inicio:inicio + tamanho_pagina],
+        "maquinas_sem_dados": sem_dados,
+    }
@@ -1,12 +1,17 @@
 from .coleta_dados_service import coletar_dados_historicos
-from .gemini_service import get_gemini_response
+from .insight_service import resolver_insight
 from app.models.dataModel import AnaliseRequest
-from app.utils.helpers import calcular_agrupamento, formatar_resposta_frontend, preparar_dataframe
+from app.utils.cache import CacheTTL
+from app.utils.helpers import calcular_agrupamento, formatar_resposta_frontend
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+import hashlib
 import logging
-import json
+import os
 import random
+import threading
+import time
 import numpy as np
-import pandas as pd
 
 # Modelos de Machine Learning
 from sklearn.linear_model import LinearRegression
@@ -18,27 +23,127 @@ from statsmodels.tsa.holtwinters import ExponentialSmoothing
 
 logger = logging.getLogger(__name__)
 
+load_dotenv()
 
-def treinar_regressao_linear(df, passos_futuros):
+# Torneio de modelos: quantos treinam em paralelo (por requisição) e o prazo (s) para decidir o vencedor
+PREVISAO_WORKERS = int(os.getenv("PREVISAO_WORKERS", "4"))
+PREVISAO_PRAZO_S = float(os.getenv("PREVISAO_PRAZO_S", "10"))
+
+# Seleção: "torneio" (todos em paralelo, padrão) ou "corrida" (ordem de custo com
+# parada antecipada: mais rápida, mas pode parar num modelo pior que o do torneio)
+PREVISAO_ESTRATEGIA = os.getenv("PREVISAO_ESTRATEGIA", "torneio").lower()
+# Parada antecipada quando RMSE / desvio padrão da série fica abaixo do limiar
+PREVISAO_LIMIAR_ERRO = float(os.getenv("PREVISAO_LIMIAR_ERRO", "0.1"))
+# Random Forest: pulada abaixo de RF_MIN_PONTOS e com menos árvores abaixo de RF_SERIE_CURTA
+PREVISAO_RF_MIN_PONTOS = int(os.getenv("PREVISAO_RF_MIN_PONTOS", "10"))
+PREVISAO_RF_SERIE_CURTA = int(os.getenv("PREVISAO_RF_SERIE_CURTA", "60"))
+PREVISAO_RF_ARVORES_CURTA = int(os.getenv("PREVISAO_RF_ARVORES_CURTA", "30"))
+PREVISAO_VENCEDOR_TTL_S = float(os.getenv("PREVISAO_VENCEDOR_TTL_S", "86400"))
+
+# Cache de modelos ajustados (resultados por impressão da série) e estado do Holt por série
+MODELOS_CACHE_LIMITE_BYTES = int(os.getenv("MODELOS_CACHE_LIMITE_BYTES", str(16 * 1024 * 1024)))
+MODELOS_CACHE_TTL_S = float(os.getenv("MODELOS_CACHE_TTL_S", "3600"))
+# Acima desse número de pontos novos o Holt é reajustado (parâmetros ficam velhos)
+HOLT_ONLINE_MAX_NOVOS = int(os.getenv("HOLT_ONLINE_MAX_NOVOS", "24"))
+
+_modelos_ajustados = CacheTTL(MODELOS_CACHE_LIMITE_BYTES, nome="modelos_ajustados")
+_estados_holt = CacheTTL(MODELOS_CACHE_LIMITE_BYTES // 4, nome="estados_holt")
+_metricas_modelos = {"holt_online": 0, "holt_reajustes": 0}
+_metricas_modelos_lock = threading.Lock()
+# Último modelo vencedor por série (chave da série -> chave do modelo)
+_vencedores = CacheTTL(1024 * 1024, nome="vencedores_previsao")
+
+
+# Ordinal (proleptic gregoriano, como date.toordinal) de 1970-01-01
+_ORDINAL_EPOCA = 719163
+
+
+class FeaturesPrevisao:
+    """
+    Matriz de features compartilhada (somente leitura) pelos candidatos do
+    torneio: X = data ordinal, y = valor e X_futuro = próximos dias. Guarda
+    também os ordinais centrados, usados pelos ajustes em forma fechada.
+    """
+
+    __slots__ = ("X", "y", "X_futuro", "centro", "x_centrado", "x_futuro_centrado", "distintos", "impressao")
+
+    def __init__(self, serie, passos_futuros):
+        # Mesmo valor de Timestamp.toordinal (descarta o horário), sem loop Python
+        datas = serie.datas.astype('datetime64[D]')
+        ordinais = datas.astype(np.int64) + _ORDINAL_EPOCA
+        self.X = ordinais.reshape(-1, 1)
+        self.y = serie.valores.copy()
+        # ultima_data + i dias tem ordinal ultimo_ordinal + i
+        self.X_futuro = (ordinais[-1] + np.arange(1, passos_futuros + 1, dtype=np.int64)).reshape(-1, 1)
+        self.centro = float(ordinais.mean())
+        self.x_centrado = ordinais - self.centro
+        self.x_futuro_centrado = self.X_futuro[:, 0] - self.centro
+        self.distintos = int(np.count_nonzero(np.diff(ordinais))) + 1
+        for arr in (self.X, self.y, self.X_futuro, self.x_centrado, self.x_futuro_centrado):
+            arr.setflags(write=False)
+        self.impressao = self.impressao_prefixo(len(self.y))
+
+    def impressao_prefixo(self, m: int) -> str:
+        """Impressão digital (datas + valores) dos primeiros m pontos da série."""
+        h = hashlib.sha1(self.X[:m].tobytes())
+        h.update(self.y[:m].tobytes())
+        return h.hexdigest()
+
+
+def _r2_rmse(y, y_pred):
+    """R² (mesma convenção do r2_score) e RMSE a partir dos mesmos resíduos."""
+    residuos = y - y_pred
+    ss_res = float(residuos @ residuos)
+    desvios = y - y.mean()
+    ss_tot = float(desvios @ desvios)
+    if ss_tot == 0:
+        r2 = 1.0 if ss_res == 0 else 0.0
+    else:
+        r2 = 1 - ss_res / ss_tot
+    return r2, np.sqrt(ss_res / len(y))
+
+
+def _ajuste_polinomial_numpy(features, grau):
+    """
+    Mínimos quadrados em forma fechada sobre os ordinais centrados.
+    Retorna (coeficientes, y_pred, y_futuro) ou None quando há menos datas
+    distintas que o necessário (aí o sklearn resolve o caso degenerado).
+    """
+    if features.distintos <= grau:
+        return None
+    x, y = features.x_centrado, features.y
+    if grau == 1:
+        inclinacao = float(x @ (y - y.mean())) / float(x @ x)
+        coeficientes = np.array([inclinacao, y.mean()])
+    else:
+        coeficientes = np.polyfit(x, y, grau)
+    return coeficientes, np.polyval(coeficientes, x), np.polyval(coeficientes, features.x_futuro_centrado)
+
+
+def treinar_regressao_linear(serie, passos_futuros, features=None):
     """Modelo 1: Linear (Tendências retas)."""
-    df['data_ordinal'] = df['data'].map(pd.Timestamp.toordinal)
-    X = df[['data_ordinal']].values
-    y = df['valor'].values
-    
-    modelo = LinearRegression()
-    modelo.fit(X, y)
-    y_pred = modelo.predict(X)
-    
-    r2 = r2_score(y, y_pred)
-    rmse = np.sqrt(mean_squared_error(y, y_pred))
-    
-    ultima_data = df['data'].iloc[-1]
-    datas_futuras = [ultima_data + pd.Timedelta(days=i) for i in range(1, passos_futuros + 1)]
-    X_futuro = np.array([d.toordinal() for d in datas_futuras]).reshape(-1, 1)
-    y_futuro = modelo.predict(X_futuro)
+    features = features or FeaturesPrevisao(serie, passos_futuros)
+    X = features.X
+    y = features.y
+
+    ajuste = _ajuste_polinomial_numpy(features, 1)
+    if ajuste is not None:
+        (coef, intercept_centrado), y_pred, y_futuro = ajuste
+        # Volta do eixo centrado para f(ordinal) = coef * ordinal + intercept
+        intercept = intercept_centrado - coef * features.centro
+        r2, rmse = _r2_rmse(y, y_pred)
+    else:
+        modelo = LinearRegression()
+        modelo.fit(X, y)
+        y_pred = modelo.predict(X)
+
+        r2 = r2_score(y, y_pred)
+        rmse = np.sqrt(mean_squared_error(y, y_pred))
+
+        y_futuro = modelo.predict(features.X_futuro)
 
-    coef = modelo.coef_[0]
-    intercept = modelo.intercept_
+        coef = modelo.coef_[0]
+        intercept = modelo.intercept_
     sinal = "+" if intercept >= 0 else "-"
     equacao = f"Equação para o gráfico:  f(x) = {coef:.2f}x {sinal} {abs(intercept):.2f}"
 
@@ -51,23 +156,25 @@ def treinar_regressao_linear(df, passos_futuros):
         "confiabilidade": min(max(r2 * 100, 0), 99)
     }
 
-def treinar_polinomial(df, passos_futuros, grau=2):
+def treinar_polinomial(serie, passos_futuros, grau=2, features=None):
     """Modelo 2: Polinomial (Curvas suaves)."""
-    df['data_ordinal'] = df['data'].map(pd.Timestamp.toordinal)
-    X = df[['data_ordinal']].values
-    y = df['valor'].values
+    features = features or FeaturesPrevisao(serie, passos_futuros)
+    X = features.X
+    y = features.y
 
-    modelo = make_pipeline(PolynomialFeatures(grau), LinearRegression())
-    modelo.fit(X, y)
-    y_pred = modelo.predict(X)
+    ajuste = _ajuste_polinomial_numpy(features, grau)
+    if ajuste is not None:
+        _, y_pred, y_futuro = ajuste
+        r2, rmse = _r2_rmse(y, y_pred)
+    else:
+        modelo = make_pipeline(PolynomialFeatures(grau), LinearRegression())
+        modelo.fit(X, y)
+        y_pred = modelo.predict(X)
 
-    r2 = r2_score(y, y_pred)
-    rmse = np.sqrt(mean_squared_error(y, y_pred))
+        r2 = r2_score(y, y_pred)
+        rmse = np.sqrt(mean_squared_error(y, y_pred))
 
-    ultima_data = df['data'].iloc[-1]
-    datas_futuras = [ultima_data + pd.Timedelta(days=i) for i in range(1, passos_futuros + 1)]
-    X_futuro = np.array([d.toordinal() for d in datas_futuras]).reshape(-1, 1)
-    y_futuro = modelo.predict(X_futuro)
+        y_futuro = modelo.predict(features.X_futuro)
 
     return {
         "nome": f"Polinomial (Grau {grau})",
@@ -78,25 +185,22 @@ def treinar_polinomial(df, passos_futuros, grau=2):
         "confiabilidade": min(max(r2 * 100, 0), 99)
     }
 
-def treinar_random_forest(df, passos_futuros):
+def treinar_random_forest(serie, passos_futuros, features=None, n_estimators=100):
     """Modelo 3: Random Forest (Padrões complexos/irregulares)."""
-    df['data_ordinal'] = df['data'].map(pd.Timestamp.toordinal)
-    X = df[['data_ordinal']].values
-    y = df['valor'].values
+    features = features or FeaturesPrevisao(serie, passos_futuros)
+    X = features.X
+    y = features.y
 
     # n_estimators=100: 100 arvores de decisão
     # random_state=42: como se fosse a semente no r
-    modelo = RandomForestRegressor(n_estimators=100, random_state=42)
+    modelo = RandomForestRegressor(n_estimators=n_estimators, random_state=42)
     modelo.fit(X, y)
     y_pred = modelo.predict(X)
 
     r2 = r2_score(y, y_pred)
     rmse = np.sqrt(mean_squared_error(y, y_pred))
 
-    ultima_data = df['data'].iloc[-1]
-    datas_futuras = [ultima_data + pd.Timedelta(days=i) for i in range(1, passos_futuros + 1)]
-    X_futuro = np.array([d.toordinal() for d in datas_futuras]).reshape(-1, 1)
-    y_futuro = modelo.predict(X_futuro)
+    y_futuro = modelo.predict(features.X_futuro)
 
     
     equacao = "Média de Árvores de Decisão (Não-Paramétrico)"
@@ -110,63 +214,366 @@ def treinar_random_forest(df, passos_futuros):
         "confiabilidade": min(max(r2 * 100, 0), 99)
     }
 
-def treinar_holt(df, passos_futuros):
+def _somar_metrica_modelos(**valores):
+    with _metricas_modelos_lock:
+        for nome, valor in valores.items():
+            _metricas_modelos[nome] += valor
+
+
+def obter_metricas_modelos() -> dict:
+    """Hit/miss dos modelos ajustados e do estado do Holt, e atualizações online x reajustes."""
+    with _metricas_modelos_lock:
+        dados = dict(_metricas_modelos)
+    dados["modelos_ajustados"] = _modelos_ajustados.metricas()
+    dados["estados_holt"] = _estados_holt.metricas()
+    return dados
+
+
+def _resultado_holt(y, ss_res, y_futuro):
+    rmse = np.sqrt(ss_res / len(y))
+    ss_tot = np.sum((y - np.mean(y)) ** 2)
+    r2 = 1 - (ss_res / ss_tot) if ss_tot != 0 else 0
+
+    return {
+        "nome": "Suavização Exponencial (Holt)",
+        "equacao": "Equação para o gráfico: Lt = αYt + (1-α)(Lt-1 + Tt-1)",
+        "rmse": float(rmse),
+        "r2": float(r2),
+        "projecao": [float(round(val, 2)) for val in y_futuro],
+        "confiabilidade": min(max(r2 * 100, 0), 99)
+    }
+
+
+class _EstadoHolt:
+    """
+    Parâmetros (α, β, φ) do último ajuste e o estado nível/tendência após os
+    primeiros m pontos da série. O último bucket fica de fora porque pode ainda
+    estar aberto (valor parcial) e mudar na próxima consulta.
+    """
+
+    __slots__ = ("alpha", "beta", "phi", "m", "impressao_m", "nivel", "tendencia", "ss_res")
+
+    def __init__(self, alpha, beta, phi, m, impressao_m, nivel, tendencia, ss_res):
+        self.alpha = alpha
+        self.beta = beta
+        self.phi = phi
+        self.m = m
+        self.impressao_m = impressao_m
+        self.nivel = nivel
+        self.tendencia = tendencia
+        self.ss_res = ss_res
+
+
+def _avancar_holt(estado, y):
+    """
+    Aplica a recursão do Holt amortecido (a mesma do statsmodels) de y[estado.m:]
+    em diante. Retorna (nivel, tendencia, ss_res) no fim da série e o estado
+    após o penúltimo ponto, para a próxima atualização.
+    """
+    alpha, beta, phi = estado.alpha, estado.beta, estado.phi
+    nivel, tendencia, ss_res = estado.nivel, estado.tendencia, estado.ss_res
+    penultimo = None
+    for t in range(estado.m, len(y)):
+        if t == len(y) - 1:
+            penultimo = (nivel, tendencia, ss_res)
+        previsto = nivel + phi * tendencia
+        ss_res += (y[t] - previsto) ** 2
+        novo_nivel = alpha * y[t] + (1 - alpha) * previsto
+        tendencia = beta * (novo_nivel - nivel) + (1 - beta) * phi * tendencia
+        nivel = novo_nivel
+    return nivel, tendencia, ss_res, penultimo
+
+
+def _projecao_holt(nivel, tendencia, phi, passos_futuros):
+    return nivel + np.cumsum(phi ** np.arange(1, passos_futuros + 1)) * tendencia
+
+
+def _treinar_holt_incremental(features, passos_futuros, chave_serie):
+    """
+    Holt com estado guardado por série: se a série só cresceu no fim (prefixo
+    igual e até HOLT_ONLINE_MAX_NOVOS pontos novos), nível e tendência são
+    atualizados com os parâmetros do último ajuste em vez de reajustar.
+    """
+    y = features.y
+    n = len(y)
+    estado = _estados_holt.obter(chave_serie)
+    if (
+        estado is not None
+        and estado.m < n
+        and n - estado.m <= HOLT_ONLINE_MAX_NOVOS
+        and features.impressao_prefixo(estado.m) == estado.impressao_m
+    ):
+        nivel, tendencia, ss_res, (nivel_m, tendencia_m, ss_res_m) = _avancar_holt(estado, y)
+        _estados_holt.guardar(chave_serie, _EstadoHolt(
+            estado.alpha, estado.beta, estado.phi, n - 1, features.impressao_prefixo(n - 1),
+            nivel_m, tendencia_m, ss_res_m,
+        ), MODELOS_CACHE_TTL_S, tamanho_bytes=256)
+        _somar_metrica_modelos(holt_online=1)
+        return _resultado_holt(y, ss_res, _projecao_holt(nivel, tendencia, estado.phi, passos_futuros))
+
+    modelo = ExponentialSmoothing(y, trend='add', seasonal=None, damped_trend=True).fit()
+    residuos = y - modelo.fittedvalues
+    m = n - 1
+    _estados_holt.guardar(chave_serie, _EstadoHolt(
+        float(modelo.params['smoothing_level']),
+        float(modelo.params['smoothing_trend']),
+        float(modelo.params['damping_trend']),
+        m,
+        features.impressao_prefixo(m),
+        float(modelo.level[m - 1]),
+        float(modelo.trend[m - 1]),
+        float(residuos[:m] @ residuos[:m]),
+    ), MODELOS_CACHE_TTL_S, tamanho_bytes=256)
+    _somar_metrica_modelos(holt_reajustes=1)
+    return _resultado_holt(y, float(residuos @ residuos), modelo.forecast(passos_futuros))
+
+
+def treinar_holt(serie, passos_futuros, features=None, chave_serie=None):
     """Modelo 4: Holt (Séries temporais com nível e tendência)."""
     try:
-        y = df['valor'].values
+        y = features.y if features is not None else serie.valores
         if len(y) < 4: return None
+
+        if features is not None and chave_serie is not None:
+            return _treinar_holt_incremental(features, passos_futuros, chave_serie)
              
         modelo = ExponentialSmoothing(y, trend='add', seasonal=None, damped_trend=True).fit()
         y_pred = modelo.fittedvalues
         
-        rmse = np.sqrt(mean_squared_error(y, y_pred))
         ss_res = np.sum((y - y_pred) ** 2)
-        ss_tot = np.sum((y - np.mean(y)) ** 2)
-        r2 = 1 - (ss_res / ss_tot) if ss_tot != 0 else 0
-        
         y_futuro = modelo.forecast(passos_futuros)
 
-        return {
-            "nome": "Suavização Exponencial (Holt)",
-            "equacao": "Equação para o gráfico: Lt = αYt + (1-α)(Lt-1 + Tt-1)",
-            "rmse": float(rmse),
-            "r2": float(r2),
-            "projecao": [float(round(val, 2)) for val in y_futuro],
-            "confiabilidade": min(max(r2 * 100, 0), 99)
-        }
+        return _resultado_holt(y, ss_res, y_futuro)
     except:
         return None
 
-def selecionar_melhor_modelo(df, passos_futuros=5):
-    candidatos = []
-    candidatos.append(treinar_regressao_linear(df.copy(), passos_futuros))
-    candidatos.append(treinar_polinomial(df.copy(), passos_futuros))
-    
-    candidatos.append(treinar_random_forest(df.copy(), passos_futuros))
-    res_holt = treinar_holt(df.copy(), passos_futuros)
-    if res_holt:
-        candidatos.append(res_holt)
-        
-    melhor_resultado = sorted(candidatos, key=lambda x: x['rmse'])[0]
-    return melhor_resultado
+
+# Candidatos em ordem crescente de custo de treino: (chave, treinador, ordem do desempate)
+CANDIDATOS_POR_CUSTO = [
+    ("linear", treinar_regressao_linear, 0),
+    ("polinomial", treinar_polinomial, 1),
+    ("holt", treinar_holt, 3),
+    ("random_forest", treinar_random_forest, 2),
+]
+
+
+def _treinar(chave, treinador, passos_futuros, features, chave_serie=None, **kwargs):
+    """
+    Treina um candidato passando pelo cache de modelos ajustados (impressão da
+    série + modelo + parâmetros). Retorna (resultado, tempo_ms, veio_do_cache).
+    """
+    inicio = time.perf_counter()
+    chave_cache = (features.impressao, chave, passos_futuros, tuple(sorted(kwargs.items())))
+    resultado = _modelos_ajustados.obter(chave_cache)
+    em_cache = resultado is not None
+    if not em_cache:
+        if chave == "holt" and chave_serie is not None:
+            kwargs["chave_serie"] = chave_serie
+        resultado = treinador(None, passos_futuros, features=features, **kwargs)
+        if resultado:
+            _modelos_ajustados.guardar(chave_cache, resultado, MODELOS_CACHE_TTL_S)
+    return resultado, (time.perf_counter() - inicio) * 1000, em_cache
+
+
+def _avaliacao(chave, status, resultado=None, tempo_ms=None, motivo=None, em_cache=False) -> dict:
+    avaliacao = {"modelo": chave, "status": status}
+    if resultado:
+        avaliacao["nome"] = resultado["nome"]
+        avaliacao["rmse"] = round(resultado["rmse"], 4)
+    if tempo_ms is not None:
+        avaliacao["tempo_ms"] = round(tempo_ms, 2)
+    if em_cache:
+        avaliacao["cache"] = True
+    if motivo:
+        avaliacao["motivo"] = motivo
+    return avaliacao
+
+
+def _erro_normalizado(resultado, features) -> float:
+    """RMSE relativo ao desvio padrão da série (0 = ajuste perfeito)."""
+    desvio = float(features.y.std())
+    return resultado["rmse"] / desvio if desvio > 0 else 0.0
+
+
+def _selecionar_torneio(features, passos_futuros, prazo_s, chave_serie=None):
+    """
+    Todos os candidatos em paralelo; passado o prazo, valem os que já terminaram.
+
+    Cada torneio tem o próprio pool: o prazo corre com os candidatos já em
+    execução, sem esperar na fila atrás de outras requisições, e um modelo que
+    estoura o prazo só ocupa a thread do próprio torneio até terminar.
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(PREVISAO_WORKERS, len(CANDIDATOS_POR_CUSTO))), thread_name_prefix="torneio"
+    )
+    try:
+        futuros = [
+            executor.submit(_treinar, chave, treinador, passos_futuros, features, chave_serie)
+            for chave, treinador, _ in CANDIDATOS_POR_CUSTO
+        ]
+
+        concluidos, pendentes = wait(futuros, timeout=prazo_s if prazo_s > 0 else None)
+        if not concluidos:
+            concluidos, pendentes = wait(futuros, return_when=FIRST_COMPLETED)
+        if pendentes:
+            logger.warning("Prazo do torneio (%.2fs) esgotado; %d modelo(s) descartado(s).", prazo_s, len(pendentes))
+            # Os que ainda estão na fila nem começam; os em execução terminam sozinhos
+            for futuro in pendentes:
+                futuro.cancel()
+    finally:
+        executor.shutdown(wait=False)
+
+    candidatos, avaliacoes = [], []
+    for (chave, _, ordem), futuro in zip(CANDIDATOS_POR_CUSTO, futuros):
+        if futuro not in concluidos:
+            avaliacoes.append(_avaliacao(chave, "descartado", motivo="prazo esgotado"))
+            continue
+        try:
+            resultado, tempo_ms, em_cache = futuro.result()
+        except Exception as e:
+            logger.error("Falha ao treinar %s: %s", chave, e)
+            avaliacoes.append(_avaliacao(chave, "falhou", motivo=str(e)))
+            continue
+        avaliacoes.append(_avaliacao(chave, "avaliado" if resultado else "falhou", resultado, tempo_ms, em_cache=em_cache))
+        if resultado:
+            candidatos.append((chave, ordem, resultado))
+    return candidatos, avaliacoes
+
+
+def _selecionar_corrida(features, passos_futuros, chave_serie):
+    """
+    Treina em ordem de custo (o vencedor anterior da série vai primeiro) e para
+    assim que um modelo fica abaixo de PREVISAO_LIMIAR_ERRO. A floresta é pulada
+    ou reduzida em séries curtas, e nunca é antecipada: seu erro é medido nos
+    próprios pontos de treino e quase sempre fica abaixo do limiar, o que a
+    faria vencer todas as corridas seguintes sem os modelos mais baratos.
+    """
+    ordem_treino = list(CANDIDATOS_POR_CUSTO)
+    vencedor_anterior = _vencedores.obter(chave_serie) if chave_serie is not None else None
+    if vencedor_anterior and vencedor_anterior != "random_forest":
+        ordem_treino.sort(key=lambda c: c[0] != vencedor_anterior)
+
+    n = len(features.y)
+    candidatos, avaliacoes = [], []
+    for posicao, (chave, treinador, ordem) in enumerate(ordem_treino):
+        kwargs = {}
+        if chave == "random_forest":
+            if n < PREVISAO_RF_MIN_PONTOS:
+                avaliacoes.append(_avaliacao(chave, "pulado", motivo=f"série curta ({n} pontos)"))
+                continue
+            if n < PREVISAO_RF_SERIE_CURTA:
+                kwargs["n_estimators"] = PREVISAO_RF_ARVORES_CURTA
+
+        try:
+            resultado, tempo_ms, em_cache = _treinar(chave, treinador, passos_futuros, features, chave_serie, **kwargs)
+        except Exception as e:
+            logger.error("Falha ao treinar %s: %s", chave, e)
+            avaliacoes.append(_avaliacao(chave, "falhou", motivo=str(e)))
+            continue
+        avaliacoes.append(_avaliacao(chave, "avaliado" if resultado else "falhou", resultado, tempo_ms, em_cache=em_cache))
+        if not resultado:
+            continue
+        candidatos.append((chave, ordem, resultado))
+
+        if _erro_normalizado(resultado, features) <= PREVISAO_LIMIAR_ERRO:
+            for chave_restante, _, _ in ordem_treino[posicao + 1:]:
+                avaliacoes.append(_avaliacao(chave_restante, "pulado", motivo="erro abaixo do limiar"))
+            break
+    return candidatos, avaliacoes
+
+
+def selecionar_melhor_modelo(serie, passos_futuros=5, prazo_s=None, estrategia=None, chave_serie=None):
+    """
+    Escolhe o modelo de menor RMSE treinando todos sobre a mesma matriz de features.
+
+    estrategia "torneio" (padrão): todos em paralelo, com prazo (PREVISAO_PRAZO_S).
+    estrategia "corrida" (opcional): em ordem de custo, com parada antecipada;
+    chave_serie identifica a série para lembrar o último vencedor e testá-lo
+    primeiro. Troca qualidade por tempo: o primeiro modelo abaixo do limiar
+    vence, mesmo que um dos pulados tivesse RMSE menor.
+
+    O resultado traz também 'candidatos' (modelos avaliados/pulados e tempos).
+    """
+    prazo_s = PREVISAO_PRAZO_S if prazo_s is None else prazo_s
+    estrategia = estrategia or PREVISAO_ESTRATEGIA
+    features = FeaturesPrevisao(serie, passos_futuros)
+
+    if estrategia == "torneio":
+        candidatos, avaliacoes = _selecionar_torneio(features, passos_futuros, prazo_s, chave_serie)
+    else:
+        candidatos, avaliacoes = _selecionar_corrida(features, passos_futuros, chave_serie)
+
+    if not candidatos:
+        raise RuntimeError("Nenhum modelo de previsão pôde ser treinado.")
+    # Desempate pela ordem original (linear, polinomial, floresta, holt)
+    chave_vencedora, _, melhor_resultado = min(candidatos, key=lambda c: (c[2]['rmse'], c[1]))
+    if chave_serie is not None:
+        _vencedores.guardar(chave_serie, chave_vencedora, PREVISAO_VENCEDOR_TTL_S)
+    return dict(melhor_resultado, candidatos=avaliacoes)
+
+
+def classificar_risco(nome_metrica, ultimo_valor_real, ultimo_valor_previsto):
+    """Risco da projeção: limites de DISCO/RAM/DOWNTIME ou alta de mais de 10%."""
+    risco = "NORMAL"
+    if nome_metrica.upper().find('DISCO') > -1 and ultimo_valor_previsto > 90:
+        risco = "CRÍTICO"
+    elif nome_metrica.upper().find('RAM') > -1 and ultimo_valor_previsto > 85:
+        risco = "CRÍTICO"
+    elif nome_metrica.upper().find('DOWNTIME') > -1 and ultimo_valor_previsto > 5:
+        risco = "CRÍTICO"
+    elif ultimo_valor_previsto > ultimo_valor_real * 1.10:
+        risco = "ATENÇÃO"
+    return risco
+
+
+def interpretacao_local_previsao(nome_metrica, risco, ultimo_valor_real, ultimo_valor_previsto, confianca):
+    """Texto determinístico (sem IA) a partir do risco já calculado; usado como fallback."""
+    tendencia = f"de {ultimo_valor_real:.1f} para {ultimo_valor_previsto:.1f}"
+    if risco == "CRÍTICO":
+        return [
+            f"Risco CRÍTICO. A projeção de {nome_metrica} ({tendencia}) excede o limite de segurança.",
+            "Agendar limpeza ou provisionamento de recurso antes do fim do horizonte projetado.",
+        ]
+    if risco == "ATENÇÃO":
+        return [
+            f"ATENÇÃO. {nome_metrica} tende a subir mais de 10% ({tendencia}).",
+            f"Revisar o consumo e planejar capacidade; confiabilidade do modelo de {confianca}%.",
+        ]
+    return [
+        f"Projeção ESTÁVEL para {nome_metrica} ({tendencia}), sem risco de saturação.",
+        f"Manter monitoramento; a confiabilidade é {confianca}%.",
+    ]
+
+
+def chave_serie_previsao(analise_req: AnaliseRequest, agrupar_por: str) -> tuple:
+    """
+    Identifica a série da previsão nos caches por série (estado do Holt e último
+    vencedor). Inclui o início da janela e o agrupamento: janelas diferentes da
+    mesma métrica são séries diferentes e não podem sobrescrever o estado uma da outra.
+    """
+    return (
+        analise_req.fkEmpresa, analise_req.fkMaquina, analise_req.metricaAnalisar,
+        analise_req.componente, agrupar_por, analise_req.dataIncio,
+    )
 
 
 def processar_request_previsao(analise_req: AnaliseRequest):
     agrupar_por = calcular_agrupamento(analise_req.dataIncio, analise_req.dataPrevisao)
-    dados_brutos = coletar_dados_historicos(analise_req, agrupar_por)
+    serie = coletar_dados_historicos(analise_req, agrupar_por, colunar=True)
     
-    if not dados_brutos:
+    if len(serie) == 0:
         return {"analise_tipo": "previsao", "erro": "Sem dados históricos."}
     
-    df = preparar_dataframe(dados_brutos)
-    if df is None or len(df) < 5:
+    serie = serie.ordenada().preencher_nulos()
+    if len(serie) < 5:
         return {"analise_tipo": "previsao", "erro": "Dados insuficientes (mínimo 5 pontos)."}
 
-    valores_historicos = [float(v) for v in df['valor'].tolist()]
-    datas_historico = df['data'].dt.strftime('%d/%m').tolist()
+    valores_historicos = serie.valores_lista()
+    datas_historico = serie.rotulos()
 
     passos_previsao = 5
-    resultado_modelo = selecionar_melhor_modelo(df, passos_previsao) 
+    chave_serie = chave_serie_previsao(analise_req, agrupar_por)
+    resultado_modelo = selecionar_melhor_modelo(serie, passos_previsao, chave_serie=chave_serie)
     projecao = resultado_modelo['projecao']
     
     ultimo_valor_real = valores_historicos[-1] if valores_historicos else 0
@@ -177,15 +584,7 @@ def processar_request_previsao(analise_req: AnaliseRequest):
     contexto_componente = f" ({analise_req.componente})" if analise_req.componente and analise_req.componente != 'TODOS' else ""
     nome_metrica = f"{analise_req.metricaAnalisar}{contexto_componente}"
     
-    risco = "NORMAL"
-    if nome_metrica.upper().find('DISCO') > -1 and ultimo_valor_previsto > 90:
-        risco = "CRÍTICO"
-    elif nome_metrica.upper().find('RAM') > -1 and ultimo_valor_previsto > 85:
-        risco = "CRÍTICO"
-    elif nome_metrica.upper().find('DOWNTIME') > -1 and ultimo_valor_previsto > 5:
-        risco = "CRÍTICO"
-    elif ultimo_valor_previsto > ultimo_valor_real * 1.10:
-        risco = "ATENÇÃO"
+    risco = classificar_risco(nome_metrica, ultimo_valor_real, ultimo_valor_previsto)
 
 
     lista_metricas = [
@@ -209,7 +608,8 @@ def processar_request_previsao(analise_req: AnaliseRequest):
     
     tipo_de_modelo = {
         "melhorModelo": nome_modelo,
-        "equacao": resultado_modelo['equacao']
+        "equacao": resultado_modelo['equacao'],
+        "candidatos": resultado_modelo['candidatos']
     }
 
     json_schema_ia = {
@@ -242,13 +642,8 @@ def processar_request_previsao(analise_req: AnaliseRequest):
     2. **Ação Preventiva:** Dê uma recomendação técnica imediata. (Se CRÍTICO: "Agendar limpeza dos discos ou provisionamento de recurso." Se NORMAL: "Manter monitoramento; a confiabilidade é {confianca}%.").
     """
     
-    try:
-        resposta_ia_json_str = get_gemini_response(prompt_gemini, json_schema_ia)
-        ia_data = json.loads(resposta_ia_json_str)
-        insight_ia = ia_data.get("interpretacao", ["Análise indisponível."])
-    except Exception as e:
-        logger.error("Falha Gemini: %s", e)
-        insight_ia = ["Erro na geração de insight."]
+    fallback = interpretacao_local_previsao(nome_metrica, risco, ultimo_valor_real, ultimo_valor_previsto, confianca)
+    insight_ia, insight_id = resolver_insight(analise_req, "previsao", prompt_gemini, json_schema_ia, fallback)
 
     labels_futuros = [f"Futuro {i+1}" for i in range(passos_previsao)]
     labels_totais = datas_historico + labels_futuros
@@ -264,5 +659,6 @@ def processar_request_previsao(analise_req: AnaliseRequest):
         data_antiga = [],
         data_futura=projecao, 
         tipo_modelo=tipo_de_modelo,
-        linha_regressao = []
+        linha_regressao = [],
+        insight_id=insight_id
     )
\ No newline at end of file
@@ -1,15 +1,349 @@
 # app/services/coleta_dados_service.py (Código Atualizado)
 
-from app.utils.database import fazer_consulta_banco
+from app.utils.database import fazer_consulta_banco, fazer_consultas_colunares
+from app.utils.cache import CacheTTL
+from app.utils.acumuladores import invalidar_acumuladores
+from app.utils.rollup import (
+    ROLLUP_GRANULARIDADES, rollup_habilitado, registrar_serie, listar_series,
+    obter_cobertura, ler_rollup, gravar_rollup, truncar_rollup
+)
+from app.utils.cache_disco import (
+    cache_disco_habilitado, ler_serie_disco, gravar_serie_disco, invalidar_intervalo_disco
+)
 from app.models.dataModel import AnaliseRequest
+from app.utils.serie_temporal import SerieTemporal
+from dataclasses import replace
+from datetime import datetime
 import logging 
+import os
+import threading
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 FK_MAQUINA_TODOS = None 
 
-def coletar_dados_historicos(dados_analise: AnaliseRequest, agrupar_por: str):
-    instrucao_sql = """
+# Cache das séries da SP (fetch colunar). TTL curto para HORA, longo para MES;
+# janelas totalmente fechadas (fim antes do bucket corrente) usam o TTL de "fechado".
+SERIE_CACHE_LIMITE_BYTES = int(os.getenv("SERIE_CACHE_LIMITE_BYTES", str(64 * 1024 * 1024)))
+SERIE_CACHE_TTL_S = {
+    "HORA": float(os.getenv("SERIE_CACHE_TTL_HORA_S", "60")),
+    "DIA": float(os.getenv("SERIE_CACHE_TTL_DIA_S", "300")),
+    "MES": float(os.getenv("SERIE_CACHE_TTL_MES_S", "3600")),
+}
+SERIE_CACHE_TTL_FECHADO_S = float(os.getenv("SERIE_CACHE_TTL_FECHADO_S", "86400"))
+
+# Modo incremental de coletar_dados_historicos: guarda os buckets fechados por série
+# e pede à SP apenas os buckets a partir do último fechado. O TTL limita por quanto
+# tempo dados que chegam atrasados ao banco podem ficar de fora.
+COLETA_INCREMENTAL = os.getenv("COLETA_INCREMENTAL", "1") == "1"
+COLETA_INCREMENTAL_LIMITE_BYTES = int(os.getenv("COLETA_INCREMENTAL_LIMITE_BYTES", str(64 * 1024 * 1024)))
+COLETA_INCREMENTAL_TTL_S = float(os.getenv("COLETA_INCREMENTAL_TTL_S", "21600"))
+
+_cache_series = CacheTTL(SERIE_CACHE_LIMITE_BYTES, nome="cache_series")
+_series_fechadas = CacheTTL(COLETA_INCREMENTAL_LIMITE_BYTES, nome="series_fechadas")
+_metricas_incremental = {"coletas_completas": 0, "coletas_delta": 0, "linhas_sp": 0, "linhas_reaproveitadas": 0}
+_metricas_incremental_lock = threading.Lock()
+_series_registradas_rollup = set()
+
+_UNIDADE_AGRUPAMENTO = {"HORA": "h", "DIA": "D", "MES": "M"}
+
+
+def serie_vazia() -> SerieTemporal:
+    """Série vazia no formato do fetch colunar."""
+    return SerieTemporal.vazia()
+
+
+def agora_local() -> np.datetime64:
+    """Horário local atual (mesma referência do NOW() do banco) como datetime64[s]."""
+    return np.datetime64(datetime.now(), 's')
+
+
+def inicio_bucket(data, agrupar_por: str) -> np.datetime64:
+    """Início do bucket (hora, dia ou mês) que contém a data."""
+    unidade = _UNIDADE_AGRUPAMENTO.get(agrupar_por, "D")
+    return np.datetime64(data, 's').astype(f'datetime64[{unidade}]').astype('datetime64[s]')
+
+
+def _ttl_serie(agrupar_por: str, data_fim: str = None) -> float:
+    """TTL da série: janelas que terminam antes do bucket aberto não mudam mais."""
+    if data_fim is not None:
+        if np.datetime64(data_fim, 's') < inicio_bucket(agora_local(), agrupar_por):
+            return SERIE_CACHE_TTL_FECHADO_S
+    return SERIE_CACHE_TTL_S.get(agrupar_por, SERIE_CACHE_TTL_S["DIA"])
+
+
+def _chave_serie(analise_req: AnaliseRequest, agrupar_por: str, data_inicio: str, data_fim: str = None):
+    return (
+        analise_req.fkEmpresa,
+        analise_req.fkMaquina,
+        analise_req.metricaAnalisar,
+        analise_req.componente,
+        agrupar_por,
+        data_inicio,
+        data_fim or "NOW",
+    )
+
+
+def _somar_metrica_incremental(**valores):
+    with _metricas_incremental_lock:
+        for nome, valor in valores.items():
+            _metricas_incremental[nome] += valor
+
+
+def _primeiro_bucket_cheio(inicio, agrupar_por: str) -> np.datetime64:
+    """Início do primeiro bucket inteiro a partir de `inicio` (o próprio, se for um limite de bucket)."""
+    bucket = inicio_bucket(inicio, agrupar_por)
+    if bucket == inicio:
+        return bucket
+    unidade = _UNIDADE_AGRUPAMENTO.get(agrupar_por, "D")
+    return (np.datetime64(inicio, 's').astype(f'datetime64[{unidade}]') + 1).astype('datetime64[s]')
+
+
+def _texto_sp(data) -> str:
+    return str(np.datetime64(data, 's')).replace("T", " ")
+
+
+def _pode_reaproveitar(guardada, inicio, agrupar_por: str) -> bool:
+    """
+    Buckets fechados guardados (memória, disco ou rollup) servem se a janela
+    pedida começar no mesmo ponto ou se cobrirem os buckets inteiros a partir
+    de `inicio`. No segundo caso, quando `inicio` cai no meio de um bucket, só
+    esse primeiro bucket parcial é pedido à SP (ver _primeiro_bucket_parcial).
+    """
+    if guardada is None:
+        return False
+    if guardada[0] == inicio:
+        return guardada[1] > inicio
+    fronteira = _primeiro_bucket_cheio(inicio, agrupar_por)
+    return guardada[0] <= fronteira < guardada[1]
+
+
+def _primeiro_bucket_parcial(guardada, inicio, agrupar_por: str) -> bool:
+    """Se o primeiro bucket da janela tem de vir da SP, por não ser o mesmo que está guardado."""
+    return guardada[0] != inicio and _primeiro_bucket_cheio(inicio, agrupar_por) != inicio
+
+
+def _registrar_no_rollup(analise_req: AnaliseRequest) -> None:
+    chave = (analise_req.fkEmpresa, analise_req.fkMaquina, analise_req.metricaAnalisar, analise_req.componente)
+    if chave in _series_registradas_rollup:
+        return
+    try:
+        registrar_serie(*chave)
+        _series_registradas_rollup.add(chave)
+    except Exception as e:
+        logger.warning("Não foi possível registrar a série no rollup: %s", e)
+
+
+def _planejar_historico(dados_analise: AnaliseRequest, agrupar_por: str):
+    """
+    Define as chamadas da SP para uma coleta dataIncio..NOW().
+
+    No modo incremental reaproveita os buckets já fechados da mesma série (da
+    memória, do cache em disco ou do rollup, nessa ordem) e pede à SP apenas o
+    trecho a partir do bucket que ainda estava aberto, mais o primeiro bucket
+    quando dataIncio cai no meio dele (ex.: dia 15 em MES). Retorna (lista de
+    configs das consultas, contexto para _concluir_historico).
+    """
+    params = _params_historico(dados_analise, agrupar_por)
+    usar_rollup = rollup_habilitado(agrupar_por)
+    usar_disco = COLETA_INCREMENTAL and cache_disco_habilitado()
+    if not COLETA_INCREMENTAL and not usar_rollup:
+        return [{"query": SQL_COLETA_HISTORICO, "params": params}], None
+
+    chave = (
+        dados_analise.fkEmpresa,
+        dados_analise.fkMaquina,
+        dados_analise.metricaAnalisar,
+        dados_analise.componente,
+        agrupar_por,
+    )
+    inicio = np.datetime64(params[0], 's')
+    guardada = _series_fechadas.obter(chave) if COLETA_INCREMENTAL else None
+    reaproveitar = _pode_reaproveitar(guardada, inicio, agrupar_por)
+
+    if usar_disco and not reaproveitar:
+        try:
+            lida = ler_serie_disco(chave)
+        except Exception as e:
+            logger.warning("Falha ao ler o cache em disco: %s", e)
+            lida = None
+        if _pode_reaproveitar(lida, inicio, agrupar_por):
+            guardada = lida
+            reaproveitar = True
+
+    if usar_rollup:
+        _registrar_no_rollup(dados_analise)
+        if not reaproveitar:
+            # O rollup só tem buckets inteiros: a leitura começa no primeiro deles
+            fronteira = _primeiro_bucket_cheio(inicio, agrupar_por)
+            try:
+                lida = ler_rollup(*chave[:4], agrupar_por, fronteira)
+            except Exception as e:
+                logger.warning("Falha ao ler o rollup; seguindo direto para a SP: %s", e)
+                lida = None
+            if lida is not None:
+                # A leitura começa na fronteira, então a cobertura guardada também
+                lida = (fronteira,) + tuple(lida[1:])
+                if _pode_reaproveitar(lida, inicio, agrupar_por):
+                    guardada = lida
+                    reaproveitar = True
+
+    parcial = reaproveitar and _primeiro_bucket_parcial(guardada, inicio, agrupar_por)
+    contexto = {
+        "chave": chave,
+        "inicio": inicio,
+        "bucket_aberto": inicio_bucket(agora_local(), agrupar_por),
+        "guardada": guardada if reaproveitar else None,
+        "parcial": parcial,
+    }
+    configs = []
+    if parcial:
+        # [dataIncio, fronteira): o BETWEEN da SP é inclusivo, daí o segundo a menos
+        fronteira = _primeiro_bucket_cheio(inicio, agrupar_por)
+        configs.append({
+            "query": SQL_COLETA_INTERVALO,
+            "params": (_texto_sp(inicio), _texto_sp(fronteira - np.timedelta64(1, 's'))) + tuple(params[1:]),
+        })
+    if reaproveitar:
+        params = (_texto_sp(guardada[1]),) + tuple(params[1:])
+    configs.append({"query": SQL_COLETA_HISTORICO, "params": params})
+    return configs, contexto
+
+
+def _concluir_historico(contexto, buscadas: list):
+    """
+    Junta o resultado das chamadas da SP (buscadas, na ordem de _planejar_historico)
+    aos buckets fechados guardados e avança a cobertura da série.
+    """
+    datas, valores = buscadas[-1]
+    if contexto is None:
+        return datas, valores
+
+    guardada = contexto["guardada"]
+    if guardada is not None:
+        inicio_cobertura, fim_cobertura, datas_fechadas, valores_fechados = guardada
+        novos = datas >= fim_cobertura
+        datas_delta, valores_delta = datas[novos], valores[novos]
+
+        datas_base = np.concatenate([datas_fechadas, datas_delta])
+        valores_base = np.concatenate([valores_fechados, valores_delta])
+        linhas_parcial = len(buscadas[0][0]) if contexto["parcial"] else 0
+        _somar_metrica_incremental(
+            coletas_delta=1, linhas_sp=len(datas_delta) + linhas_parcial, linhas_reaproveitadas=len(datas_fechadas)
+        )
+    else:
+        inicio_cobertura = contexto["inicio"]
+        datas_base, valores_base = datas, valores
+        _somar_metrica_incremental(coletas_completas=1, linhas_sp=len(datas_base))
+
+    if COLETA_INCREMENTAL:
+        bucket_aberto = contexto["bucket_aberto"]
+        fechados = datas_base < bucket_aberto
+        datas_fechadas, valores_fechados = datas_base[fechados], valores_base[fechados]
+        _series_fechadas.guardar(
+            contexto["chave"],
+            (inicio_cobertura, bucket_aberto, datas_fechadas, valores_fechados),
+            COLETA_INCREMENTAL_TTL_S,
+        )
+        # Só regrava o disco quando há bucket novo fechado (ou a cobertura mudou)
+        if cache_disco_habilitado() and (guardada is None or bucket_aberto > guardada[1]):
+            try:
+                gravar_serie_disco(contexto["chave"], inicio_cobertura, bucket_aberto, datas_fechadas, valores_fechados)
+            except Exception as e:
+                logger.warning("Falha ao gravar o cache em disco: %s", e)
+
+    if contexto["parcial"]:
+        # Primeiro bucket (parcial) da SP e, depois dele, os buckets inteiros guardados
+        datas_parcial, valores_parcial = buscadas[0]
+        cheios = datas_base >= _primeiro_bucket_cheio(contexto["inicio"], contexto["chave"][4])
+        return (
+            np.concatenate([datas_parcial, datas_base[cheios]]),
+            np.concatenate([valores_parcial, valores_base[cheios]]),
+        )
+    na_janela = datas_base >= contexto["inicio"]
+    return datas_base[na_janela], valores_base[na_janela]
+
+
+def _coletar_historicos_lote(requisicoes: list, agrupar_por: str) -> list:
+    """
+    Coleta dataIncio..NOW() de várias séries: as que estão no cache saem dele e
+    as demais vão ao banco juntas, em uma única conexão (uma CALL por série).
+    Retorna a lista de SerieTemporal (arrays somente leitura), na ordem das requisições.
+    """
+    resultados = [None] * len(requisicoes)
+    pendentes = []
+    for i, req in enumerate(requisicoes):
+        chave = _chave_serie(req, agrupar_por, req.dataIncio)
+        serie = _cache_series.obter(chave)
+        if serie is not None:
+            resultados[i] = serie
+        else:
+            pendentes.append((i, chave) + _planejar_historico(req, agrupar_por))
+
+    if pendentes:
+        buscadas = fazer_consultas_colunares([config for _, _, configs, _ in pendentes for config in configs])
+        ttl_s = _ttl_serie(agrupar_por)
+        posicao = 0
+        for i, chave, configs, contexto in pendentes:
+            datas, valores = _concluir_historico(contexto, buscadas[posicao:posicao + len(configs)])
+            posicao += len(configs)
+            datas.flags.writeable = False
+            valores.flags.writeable = False
+            if len(datas) > 0:
+                _cache_series.guardar(chave, (datas, valores), ttl_s)
+            resultados[i] = (datas, valores)
+    return [SerieTemporal(datas, valores) for datas, valores in resultados]
+
+
+def invalidar_cache_series(fkEmpresa=None, fkMaquina=None) -> int:
+    """Remove dos caches as séries de uma empresa/máquina (ou todas, sem filtros)."""
+    if fkEmpresa is None and fkMaquina is None:
+        _series_fechadas.invalidar()
+        return _cache_series.invalidar()
+
+    def pertence(chave):
+        return (fkEmpresa is None or chave[0] == fkEmpresa) and (fkMaquina is None or chave[1] == fkMaquina)
+
+    _series_fechadas.invalidar(pertence)
+    return _cache_series.invalidar(pertence)
+
+
+def invalidar_intervalo(data_inicio: str, data_fim: str, fkEmpresa=None, fkMaquina=None) -> dict:
+    """
+    Invalida o trecho [data_inicio, data_fim] (AAAA-MM-DD) em todas as camadas:
+    caches em memória (as séries afetadas saem inteiras), cache em disco e rollup
+    (truncados no início do trecho). Usado quando dados brutos são corrigidos
+    ou chegam com atraso.
+    """
+    def pertence(chave):
+        return (fkEmpresa is None or chave[0] == fkEmpresa) and (fkMaquina is None or chave[1] == fkMaquina)
+
+    resumo = {
+        "cache_series": _cache_series.invalidar(pertence),
+        "series_fechadas": _series_fechadas.invalidar(pertence),
+        "disco": invalidar_intervalo_disco(data_inicio, data_fim, pertence),
+        "rollup": truncar_rollup(data_inicio, data_fim, fkEmpresa, fkMaquina) if rollup_habilitado() else 0,
+        "acumuladores": invalidar_acumuladores(pertence),
+    }
+    logger.info("Intervalo %s a %s invalidado: %s", data_inicio, data_fim, resumo)
+    return resumo
+
+
+def obter_metricas_cache_series() -> dict:
+    """Hit/miss, ocupação e despejos do cache de séries e da coleta incremental."""
+    metricas = _cache_series.metricas()
+    with _metricas_incremental_lock:
+        metricas["incremental"] = dict(_metricas_incremental)
+    metricas["incremental"]["series_fechadas"] = _series_fechadas.metricas()
+    return metricas
+
+
+# Máquinas de uma empresa (ajuste se o schema usar outros nomes de tabela/coluna)
+SQL_MAQUINAS_EMPRESA = os.getenv("SQL_MAQUINAS_EMPRESA", "SELECT idMaquina FROM Maquina WHERE fkEmpresa = %s")
+SQL_EMPRESAS = os.getenv("SQL_EMPRESAS", "SELECT idEmpresa FROM Empresa")
+
+SQL_COLETA_HISTORICO = """
     CALL sp_coleta_dados_brutos(
         %s,    -- p_data_inicio
         NOW(),    -- p_data_fim
@@ -20,7 +354,10 @@ def coletar_dados_historicos(dados_analise: AnaliseRequest, agrupar_por: str):
         %s     -- p_tipo_componente
     );
     """
-    params = (
+
+
+def _params_historico(dados_analise: AnaliseRequest, agrupar_por: str) -> tuple:
+    return (
         dados_analise.dataIncio + " 00:00:00",
         dados_analise.fkEmpresa,
         dados_analise.fkMaquina if dados_analise.fkMaquina is not None else FK_MAQUINA_TODOS,
@@ -29,8 +366,27 @@ def coletar_dados_historicos(dados_analise: AnaliseRequest, agrupar_por: str):
         dados_analise.componente
     )
 
+
+def coletar_dados_historicos(dados_analise: AnaliseRequest, agrupar_por: str, colunar: bool = False):
+    """
+    Coleta a série da SP de dataIncio até NOW().
+    Com colunar=True retorna uma SerieTemporal em vez da lista de tuplas.
+    """
+    instrucao_sql = SQL_COLETA_HISTORICO
+    params = _params_historico(dados_analise, agrupar_por)
+
     logger.info("Parâmetros da SP coletar_dados_historicos sendo enviados: %s", params)
     
+    if colunar:
+        try:
+            serie = _coletar_historicos_lote([dados_analise], agrupar_por)[0]
+            if len(serie) == 0:
+                logger.warning("Coleta de dados retornou 0 resultados. Verificar  os filtros e o DB.")
+            return serie
+        except RuntimeError as e:
+            logger.error("Falha ao coletar dados históricos devido a erro de DB: %s", e)
+            return serie_vazia()
+
     try:
         dados_brutos = fazer_consulta_banco({"query": instrucao_sql, "params": params})
         
@@ -42,12 +398,7 @@ def coletar_dados_historicos(dados_analise: AnaliseRequest, agrupar_por: str):
         logger.error("Falha ao coletar dados históricos devido a erro de DB: %s", e)
         return []
     
-def coletar_dados_por_intervalo(analise_req: AnaliseRequest, data_inicio: str, data_fim: str, agrupar_por: str):
-    """
-    Coleta dados para um intervalo específico
-    """
-    
-    instrucao_sql = """
+SQL_COLETA_INTERVALO = """
     CALL sp_coleta_dados_brutos(
         %s,    -- p_data_inicio
         %s,    -- p_data_fim
@@ -58,8 +409,10 @@ def coletar_dados_por_intervalo(analise_req: AnaliseRequest, data_inicio: str, d
         %s     -- p_tipo_componente
     );
     """
-    
-    params = (
+
+
+def _params_intervalo(analise_req: AnaliseRequest, data_inicio: str, data_fim: str, agrupar_por: str) -> tuple:
+    return (
         data_inicio + " 00:00:00",
         data_fim + " 00:00:00",
         analise_req.fkEmpresa,
@@ -68,9 +421,97 @@ def coletar_dados_por_intervalo(analise_req: AnaliseRequest, data_inicio: str, d
         analise_req.metricaAnalisar,
         analise_req.componente
     )
+
+
+def _partes_intervalo_rollup(chave):
+    """
+    Divide uma janela fechada (chave de _chave_serie com data_fim) para servi-la
+    do rollup: os buckets inteiros saem dele e só as pontas vão à SP — o primeiro
+    bucket quando data_inicio cai no meio dele (ex.: dia 15 em MES) e o bucket
+    de data_fim, que o BETWEEN da SP corta em data_fim 00:00:00.
+    Retorna a lista de partes, na ordem das datas: config da SP ou (datas, valores)
+    do rollup. None se o rollup não cobrir os buckets inteiros da janela.
+    """
+    fkEmpresa, fkMaquina, metrica, componente, agrupar_por, data_inicio, data_fim = chave
+    if data_fim == "NOW" or not rollup_habilitado(agrupar_por):
+        return None
+    inicio = np.datetime64(data_inicio, 's')
+    fim = np.datetime64(data_fim, 's')
+    fronteira = _primeiro_bucket_cheio(inicio, agrupar_por)
+    bucket_fim = inicio_bucket(fim, agrupar_por)
+    if fronteira >= bucket_fim:
+        return None
+    try:
+        lida = ler_rollup(fkEmpresa, fkMaquina, metrica, componente, agrupar_por,
+                          fronteira, bucket_fim - np.timedelta64(1, 's'))
+    except Exception as e:
+        logger.warning("Falha ao ler o rollup; seguindo direto para a SP: %s", e)
+        return None
+    if lida is None or bucket_fim > lida[1]:
+        return None
+
+    def ponta(de, ate):
+        params = (_texto_sp(de), _texto_sp(ate), fkEmpresa, fkMaquina, agrupar_por, metrica, componente)
+        return {"query": SQL_COLETA_INTERVALO, "params": params}
+
+    partes = [ponta(inicio, fronteira - np.timedelta64(1, 's'))] if fronteira != inicio else []
+    return partes + [(lida[2], lida[3]), ponta(bucket_fim, fim)]
+
+
+def _consultas_colunares_cacheadas(itens: list) -> list:
+    """
+    Consultas colunares com o cache de séries na frente. itens: lista de (chave, ttl_s, config).
+    Os hits saem do cache; nas janelas fechadas cobertas pelo rollup só as
+    pontas vão à SP. As consultas restantes vão ao banco juntas, numa única
+    conexão. Retorna SerieTemporal com arrays somente leitura.
+    """
+    resultados = [None] * len(itens)
+    pendentes = []
+    for i, (chave, _, config) in enumerate(itens):
+        serie = _cache_series.obter(chave)
+        if serie is not None:
+            resultados[i] = serie
+        else:
+            pendentes.append((i, _partes_intervalo_rollup(chave) or [config]))
+
+    if pendentes:
+        configs = [parte for _, partes in pendentes for parte in partes if isinstance(parte, dict)]
+        buscadas = iter(fazer_consultas_colunares(configs))
+        for i, partes in pendentes:
+            partes = [next(buscadas) if isinstance(parte, dict) else parte for parte in partes]
+            if len(partes) == 1:
+                datas, valores = partes[0]
+            else:
+                datas = np.concatenate([datas for datas, _ in partes])
+                valores = np.concatenate([valores for _, valores in partes])
+            datas.flags.writeable = False
+            valores.flags.writeable = False
+            if len(datas) > 0:
+                _cache_series.guardar(itens[i][0], (datas, valores), itens[i][1])
+            resultados[i] = (datas, valores)
+    return [SerieTemporal(datas, valores) for datas, valores in resultados]
+
+
+def coletar_dados_por_intervalo(analise_req: AnaliseRequest, data_inicio: str, data_fim: str, agrupar_por: str, colunar: bool = False):
+    """
+    Coleta dados para um intervalo específico
+    Com colunar=True retorna uma SerieTemporal em vez da lista de tuplas.
+    """
+    
+    instrucao_sql = SQL_COLETA_INTERVALO
+    params = _params_intervalo(analise_req, data_inicio, data_fim, agrupar_por)
     logger.info("coletar_dados_por_intervalo")
     logger.info(f"Coletando dados intervalo: {data_inicio} a {data_fim}")
     
+    if colunar:
+        try:
+            chave = _chave_serie(analise_req, agrupar_por, data_inicio, data_fim)
+            config = {"query": instrucao_sql, "params": params}
+            return _consultas_colunares_cacheadas([(chave, _ttl_serie(agrupar_por, data_fim), config)])[0]
+        except RuntimeError as e:
+            logger.error(f"Erro coleta intervalo: {e}")
+            return serie_vazia()
+
     try:
         dados_brutos = fazer_consulta_banco({"query": instrucao_sql, "params": params})
         return dados_brutos if dados_brutos else []
@@ -78,18 +519,236 @@ def coletar_dados_por_intervalo(analise_req: AnaliseRequest, data_inicio: str, d
         logger.error(f"Erro coleta intervalo: {e}")
         return []
 
-def coletar_dados_correlacao(dados_analise: AnaliseRequest, agrupar_por: str, fk_maquina: int = None):
-    # ainda a ser realizadpo
-    dados_a = coletar_dados_historicos(dados_analise, agrupar_por, fk_maquina)
-
-    # 2. Série B (Variável Relacionada)
-    analise_b = AnaliseRequest(
-        tipoAnalise=dados_analise.tipoAnalise,
-        dataIncio=dados_analise.dataIncio,
-        metricaAnalisar=dados_analise.variavelRelacionada,
-        dataPrevisao=dados_analise.dataPrevisao,
-        componente=dados_analise.componente
+
+def coletar_dados_periodos(analise_req: AnaliseRequest, periodo_atual: tuple, periodo_anterior: tuple, agrupar_por: str):
+    """
+    Coleta o período atual e o anterior numa única ida ao banco: uma conexão,
+    duas chamadas da SP (uma por janela, no mesmo lote).
+
+    Uma chamada só não reproduz as janelas separadas: cada uma termina em
+    data_fim 00:00:00 (BETWEEN inclusivo), então o bucket de data_fim_ant só
+    tem esse instante na chamada isolada, e não dá para tirá-lo do bucket
+    inteiro que uma janela unificada traria. Cada janela passa pelo cache de
+    séries e pelo rollup separadamente.
+
+    periodo_atual / periodo_anterior: (data_inicio, data_fim) no formato AAAA-MM-DD.
+    Retorna (serie_atual, serie_anterior) como SerieTemporal.
+    """
+    data_inicio_atual, data_fim_atual = periodo_atual
+    data_inicio_ant, data_fim_ant = periodo_anterior
+    logger.info(
+        "Coletando períodos: atual %s a %s, anterior %s a %s",
+        data_inicio_atual, data_fim_atual, data_inicio_ant, data_fim_ant
     )
-    dados_b = coletar_dados_historicos(analise_b, agrupar_por, fk_maquina)
-    
-    return dados_a, dados_b
\ No newline at end of file
+
+    try:
+        series = _consultas_colunares_cacheadas(_itens_periodos(analise_req, periodo_atual, periodo_anterior, agrupar_por))
+    except RuntimeError as e:
+        logger.error(f"Erro coleta períodos: {e}")
+        return serie_vazia(), serie_vazia()
+
+    if data_inicio_ant is None or data_fim_ant is None:
+        return series[0], serie_vazia()
+    return series[0], series[1]
+
+
+def _itens_periodos(analise_req: AnaliseRequest, periodo_atual: tuple, periodo_anterior: tuple, agrupar_por: str) -> list:
+    """Itens de _consultas_colunares_cacheadas para coletar_dados_periodos (atual e, se houver, anterior)."""
+
+    def item(data_inicio, data_fim):
+        return (
+            _chave_serie(analise_req, agrupar_por, data_inicio, data_fim),
+            _ttl_serie(agrupar_por, data_fim),
+            {"query": SQL_COLETA_INTERVALO, "params": _params_intervalo(analise_req, data_inicio, data_fim, agrupar_por)},
+        )
+
+    itens = [item(*periodo_atual)]
+    if periodo_anterior[0] is not None and periodo_anterior[1] is not None:
+        itens.append(item(*periodo_anterior))
+    return itens
+
+
+def pre_carregar_periodos(requisicoes: list, periodo_atual: tuple, periodo_anterior: tuple, agrupar_por: str) -> int:
+    """
+    Aquece o cache de séries com as janelas de coletar_dados_periodos de várias
+    requisições numa única conexão (ex.: todas as máquinas de uma empresa).
+    Retorna quantas séries foram carregadas.
+    """
+    itens = [
+        item for req in requisicoes
+        for item in _itens_periodos(req, periodo_atual, periodo_anterior, agrupar_por)
+    ]
+    try:
+        return len(_consultas_colunares_cacheadas(itens))
+    except RuntimeError as e:
+        logger.error("Falha ao pré-carregar períodos: %s", e)
+        return 0
+
+def coletar_multiplas_metricas(analise_req: AnaliseRequest, metricas: list, agrupar_por: str, componentes: list = None, alinhar: bool = True):
+    """
+    Coleta várias métricas da mesma máquina/empresa e janela (dataIncio..NOW())
+    em uma única ida ao banco: as séries fora do cache são buscadas juntas, numa
+    só conexão, uma CALL da SP por métrica.
+
+    componentes: lista paralela a metricas (None usa analise_req.componente para todas).
+    Com alinhar=True as séries são alinhadas pela interseção ordenada das datas.
+
+    Retorna (datas, {nome: valores}) se alinhar, senão {nome: SerieTemporal}.
+    O nome é a métrica, ou "métrica (componente)" quando componentes é informado.
+    """
+    if componentes is None:
+        componentes = [analise_req.componente] * len(metricas)
+        nomes = list(metricas)
+    else:
+        nomes = [f"{m} ({c})" if c else m for m, c in zip(metricas, componentes)]
+
+    requisicoes = [
+        replace(analise_req, metricaAnalisar=metrica, componente=componente, variavelRelacionada=None)
+        for metrica, componente in zip(metricas, componentes)
+    ]
+    logger.info("Coletando %d métricas em lote: %s", len(requisicoes), nomes)
+
+    try:
+        series = _coletar_historicos_lote(requisicoes, agrupar_por)
+    except RuntimeError as e:
+        logger.error("Falha na coleta em lote de métricas: %s", e)
+        series = [serie_vazia() for _ in requisicoes]
+
+    if not alinhar:
+        return dict(zip(nomes, series))
+
+    alinhadas = SerieTemporal.alinhar(series)
+    datas = alinhadas[0].datas if alinhadas else serie_vazia().datas
+    return datas, {nome: serie.valores for nome, serie in zip(nomes, alinhadas)}
+
+
+def listar_empresas() -> list:
+    """IDs de todas as empresas (consulta em SQL_EMPRESAS)."""
+    try:
+        linhas = fazer_consulta_banco({"query": SQL_EMPRESAS, "params": ()})
+    except RuntimeError as e:
+        logger.error("Falha ao listar empresas: %s", e)
+        return []
+    return [linha[0] for linha in linhas]
+
+
+def listar_maquinas_empresa(fk_empresa: int) -> list:
+    """IDs das máquinas da empresa (consulta em SQL_MAQUINAS_EMPRESA)."""
+    try:
+        linhas = fazer_consulta_banco({"query": SQL_MAQUINAS_EMPRESA, "params": (fk_empresa,)})
+    except RuntimeError as e:
+        logger.error("Falha ao listar máquinas da empresa %s: %s", fk_empresa, e)
+        return []
+    return [linha[0] for linha in linhas]
+
+
+def coletar_series_frota(analise_req: AnaliseRequest, agrupar_por: str, maquinas: list = None) -> dict:
+    """
+    Coleta a mesma métrica (dataIncio..NOW()) de todas as máquinas da empresa
+    numa única passada: as séries fora do cache vão ao banco juntas, numa só
+    conexão. Retorna {fkMaquina: SerieTemporal}.
+    """
+    if maquinas is None:
+        maquinas = listar_maquinas_empresa(analise_req.fkEmpresa)
+    if not maquinas:
+        return {}
+
+    requisicoes = [replace(analise_req, fkMaquina=maquina, variavelRelacionada=None) for maquina in maquinas]
+    logger.info("Coletando %s de %d máquinas em lote.", analise_req.metricaAnalisar, len(maquinas))
+    try:
+        series = _coletar_historicos_lote(requisicoes, agrupar_por)
+    except RuntimeError as e:
+        logger.error("Falha na coleta da frota: %s", e)
+        return {}
+    return dict(zip(maquinas, series))
+
+
+def coletar_pares_frota(analise_req: AnaliseRequest, agrupar_por: str, maquinas: list = None) -> dict:
+    """
+    Coleta metricaAnalisar e variavelRelacionada de todas as máquinas da empresa
+    num único lote de 2N séries (uma só conexão, como em coletar_series_frota).
+    Retorna {fkMaquina: (serie_a, serie_b)}.
+    """
+    if maquinas is None:
+        maquinas = listar_maquinas_empresa(analise_req.fkEmpresa)
+    if not maquinas:
+        return {}
+
+    requisicoes = []
+    for maquina in maquinas:
+        principal = replace(analise_req, fkMaquina=maquina, variavelRelacionada=None)
+        requisicoes += [principal, replace(principal, metricaAnalisar=analise_req.variavelRelacionada)]
+    logger.info("Coletando %s e %s de %d máquinas em lote.",
+                analise_req.metricaAnalisar, analise_req.variavelRelacionada, len(maquinas))
+    try:
+        series = _coletar_historicos_lote(requisicoes, agrupar_por)
+    except RuntimeError as e:
+        logger.error("Falha na coleta da correlação da frota: %s", e)
+        return {}
+    return {maquina: (series[2 * i], series[2 * i + 1]) for i, maquina in enumerate(maquinas)}
+
+
+def coletar_dados_correlacao(dados_analise: AnaliseRequest, agrupar_por: str, fk_maquina: int = None):
+    """
+    Coleta a métrica principal e a variável relacionada numa única ida ao banco.
+    Retorna (serie_a, serie_b) como SerieTemporal, sem alinhar.
+    """
+    if fk_maquina is not None:
+        dados_analise = replace(dados_analise, fkMaquina=fk_maquina)
+
+    requisicoes = [
+        dados_analise,
+        replace(dados_analise, metricaAnalisar=dados_analise.variavelRelacionada, variavelRelacionada=None),
+    ]
+    try:
+        serie_a, serie_b = _coletar_historicos_lote(requisicoes, agrupar_por)
+    except RuntimeError as e:
+        logger.error("Falha na coleta da correlação: %s", e)
+        return serie_vazia(), serie_vazia()
+    return serie_a, serie_b
+
+
+def atualizar_rollups(data_inicio: str, granularidades: list = None, series: list = None, tamanho_lote: int = 20) -> dict:
+    """
+    Job de manutenção do rollup: para cada série registrada (ou as informadas) e
+    cada granularidade, pede à SP só os buckets depois do fim da cobertura atual
+    (ou desde data_inicio, na primeira vez) e grava os que já fecharam.
+
+    series: lista de (fkEmpresa, fkMaquina, metrica, componente).
+    Retorna um resumo com a quantidade de séries atualizadas e buckets gravados.
+    """
+    if not rollup_habilitado():
+        raise RuntimeError("Rollup desabilitado: defina ROLLUP_DB_PATH.")
+
+    series = series if series is not None else listar_series()
+    granularidades = granularidades or list(ROLLUP_GRANULARIDADES)
+    resumo = {"series": 0, "buckets": 0, "consultas": 0}
+
+    for agrupar_por in granularidades:
+        bucket_aberto = inicio_bucket(agora_local(), agrupar_por)
+        planos = []
+        for fkEmpresa, fkMaquina, metrica, componente in series:
+            cobertura = obter_cobertura(fkEmpresa, fkMaquina, metrica, componente, agrupar_por)
+            if cobertura is None:
+                inicio_cobertura = inicio = inicio_bucket(np.datetime64(data_inicio, 's'), agrupar_por)
+            else:
+                inicio_cobertura, inicio = cobertura
+            if inicio >= bucket_aberto:
+                continue
+            params = (str(inicio).replace("T", " "), fkEmpresa, fkMaquina, agrupar_por, metrica, componente)
+            planos.append(((fkEmpresa, fkMaquina, metrica, componente), inicio_cobertura, inicio, params))
+
+        for i in range(0, len(planos), tamanho_lote):
+            lote = planos[i:i + tamanho_lote]
+            resultados = fazer_consultas_colunares(
+                [{"query": SQL_COLETA_HISTORICO, "params": params} for _, _, _, params in lote]
+            )
+            resumo["consultas"] += len(lote)
+            for (serie, inicio_cobertura, inicio, _), (datas, valores) in zip(lote, resultados):
+                novos = datas >= inicio
+                gravar_rollup(*serie, agrupar_por, datas[novos], valores[novos], inicio_cobertura, bucket_aberto)
+                resumo["series"] += 1
+                resumo["buckets"] += int(np.count_nonzero(datas[novos] < bucket_aberto))
+
+    logger.info("Rollup atualizado: %s", resumo)
+    return resumo
@@ -1,40 +1,258 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from app.utils.cache import CacheTTL
+from app.utils.disjuntor import DisjuntorCircuito
+from collections import deque
 from dotenv import load_dotenv
+import hashlib
+import json
 import os
+import re
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-def get_gemini_response(prompt: str, response_schema: dict = None) -> str:
+# Modelo e parâmetros padrão de geração (sobrescrevíveis pelo ambiente)
+GEMINI_MODELO = os.getenv("GEMINI_MODELO", "gemini-2.5-flash")
+GEMINI_TEMPERATURA = os.getenv("GEMINI_TEMPERATURA", "")
+GEMINI_MAX_TOKENS = os.getenv("GEMINI_MAX_TOKENS", "")
+# Transporte do cliente: "rest" ou "grpc" (vazio = padrão da biblioteca)
+GEMINI_TRANSPORTE = os.getenv("GEMINI_TRANSPORTE", "")
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "60"))
+GEMINI_TENTATIVAS = int(os.getenv("GEMINI_TENTATIVAS", "2"))
+GEMINI_ESPERA_INICIAL_S = float(os.getenv("GEMINI_ESPERA_INICIAL_S", "0.5"))
+
+# Cache de insights: prompts idênticos (mesmos números exibidos) reaproveitam a resposta
+GEMINI_CACHE_TTL_S = float(os.getenv("GEMINI_CACHE_TTL_S", "900"))
+GEMINI_CACHE_LIMITE_BYTES = int(os.getenv("GEMINI_CACHE_LIMITE_BYTES", str(8 * 1024 * 1024)))
+
+# Circuit breaker: após N falhas/timeouts seguidos a API deixa de ser chamada por um tempo
+GEMINI_DISJUNTOR_FALHAS = int(os.getenv("GEMINI_DISJUNTOR_FALHAS", "5"))
+GEMINI_DISJUNTOR_PAUSA_S = float(os.getenv("GEMINI_DISJUNTOR_PAUSA_S", "60"))
+
+# Erros em que vale tentar de novo (rede, sobrecarga, limite de taxa)
+_ERROS_TRANSITORIOS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    ConnectionError,
+    TimeoutError,
+)
+
+_modelo = None
+_modelo_lock = threading.Lock()
+
+_cache_insights = CacheTTL(GEMINI_CACHE_LIMITE_BYTES, nome="cache_insights")
+disjuntor_gemini = DisjuntorCircuito(GEMINI_DISJUNTOR_FALHAS, GEMINI_DISJUNTOR_PAUSA_S, nome="disjuntor_gemini")
+# Tamanho do prompt e latência de cada chamada real à API (para medir a compactação)
+_metricas_chamadas = {
+    "chamadas": 0,
+    "falhas": 0,
+    "prompt_chars_total": 0,
+    "prompt_chars_max": 0,
+    "latencia_total_s": 0.0,
+    "latencia_max_s": 0.0,
+}
+_ultimas_chamadas = deque(maxlen=50)
+_metricas_chamadas_lock = threading.Lock()
+_RE_ESPACOS = re.compile(r"\s+")
+_RE_DECIMAL = re.compile(r"-?\d+\.\d{3,}")
+
+
+class GeminiIndisponivel(Exception):
+    """Circuito aberto: a API Gemini não está sendo chamada no momento."""
+
+
+def _config_geracao_padrao() -> dict:
+    config = {}
+    if GEMINI_TEMPERATURA:
+        config["temperature"] = float(GEMINI_TEMPERATURA)
+    if GEMINI_MAX_TOKENS:
+        config["max_output_tokens"] = int(GEMINI_MAX_TOKENS)
+    return config
+
+
+def obter_modelo():
+    """
+    Retorna o GenerativeModel compartilhado, configurando a API na primeira chamada.
+    O modelo reaproveita o cliente (e a conexão) entre as requisições.
+    """
+    global _modelo
+    if _modelo is not None:
+        return _modelo
+    with _modelo_lock:
+        if _modelo is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                logger.error("Chave GEMINI_API_KEY não encontrada no ambiente.")
+                raise Exception("Chave GEMINI_API_KEY não configurada.")
+
+            opcoes = {"api_key": api_key}
+            if GEMINI_TRANSPORTE:
+                opcoes["transport"] = GEMINI_TRANSPORTE
+            genai.configure(**opcoes)
+            _modelo = genai.GenerativeModel(GEMINI_MODELO, generation_config=_config_geracao_padrao())
+            logger.info("Cliente Gemini inicializado (modelo %s).", GEMINI_MODELO)
+    return _modelo
+
+
+def reiniciar_cliente() -> None:
+    """Descarta o modelo compartilhado; o próximo uso reconfigura a API (ex.: troca de chave)."""
+    global _modelo
+    with _modelo_lock:
+        _modelo = None
+
+
+def definir_cliente(modelo) -> None:
+    """
+    Substitui o modelo compartilhado por outro objeto com generate_content
+    (ex.: um stub lento ou que falha, para exercitar o fallback).
+    """
+    global _modelo
+    with _modelo_lock:
+        _modelo = modelo
+
+
+def normalizar_prompt(prompt: str) -> str:
+    """Colapsa espaços e arredonda decimais longos para 2 casas (precisão exibida)."""
+    texto = _RE_ESPACOS.sub(" ", prompt).strip()
+    return _RE_DECIMAL.sub(lambda m: f"{float(m.group()):.2f}", texto)
+
+
+def chave_insight(prompt: str, response_schema: dict = None) -> str:
+    """Hash do modelo + prompt normalizado + schema, usado como chave do cache de insights."""
+    conteudo = json.dumps(
+        [GEMINI_MODELO, normalizar_prompt(prompt), response_schema],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def invalidar_cache_insights() -> int:
+    return _cache_insights.invalidar()
+
+
+def obter_metricas_cache_insights() -> dict:
+    dados = _cache_insights.metricas()
+    dados["ttl_s"] = GEMINI_CACHE_TTL_S
+    return dados
+
+
+def _registrar_chamada(prompt_chars: int, latencia_s: float, sucesso: bool) -> None:
+    logger.info("Gemini: prompt de %d caracteres, %.2fs (%s).", prompt_chars, latencia_s, "ok" if sucesso else "falha")
+    with _metricas_chamadas_lock:
+        _metricas_chamadas["chamadas"] += 1
+        _metricas_chamadas["falhas"] += 0 if sucesso else 1
+        _metricas_chamadas["prompt_chars_total"] += prompt_chars
+        _metricas_chamadas["prompt_chars_max"] = max(_metricas_chamadas["prompt_chars_max"], prompt_chars)
+        _metricas_chamadas["latencia_total_s"] += latencia_s
+        _metricas_chamadas["latencia_max_s"] = max(_metricas_chamadas["latencia_max_s"], latencia_s)
+        _ultimas_chamadas.append({
+            "prompt_chars": prompt_chars,
+            "latencia_s": round(latencia_s, 3),
+            "sucesso": sucesso,
+        })
+
+
+def obter_metricas_chamadas() -> dict:
+    """Totais de chamadas à API (tamanho de prompt e latência) e as últimas chamadas."""
+    with _metricas_chamadas_lock:
+        dados = dict(_metricas_chamadas)
+        dados["ultimas"] = list(_ultimas_chamadas)
+    chamadas = dados["chamadas"]
+    dados["prompt_chars_medio"] = dados["prompt_chars_total"] / chamadas if chamadas else 0.0
+    dados["latencia_media_s"] = dados["latencia_total_s"] / chamadas if chamadas else 0.0
+    return dados
+
+
+def obter_metricas_disjuntor() -> dict:
+    return disjuntor_gemini.metricas()
+
+
+def get_gemini_response(prompt: str, response_schema: dict = None,
+                        timeout_s: float = None, tentativas: int = None,
+                        usar_cache: bool = True) -> str:
     """
     Gera conteúdo usando a API Gemini. Pode solicitar resposta JSON estruturada.
+
+    timeout_s limita cada tentativa; tentativas é o total de chamadas permitidas
+    (erros transitórios são repetidos com espera exponencial).
+    Com usar_cache=False a API é chamada mesmo com resposta em cache, e a nova
+    resposta substitui a anterior.
+    Com o circuito aberto levanta GeminiIndisponivel sem chamar a API. Falhas e
+    respostas que chegam depois do timeout contam para abrir o circuito.
     """
-    api_key = os.getenv("GEMINI_API_KEY") 
-    
-    if not api_key:
-        logger.error("Chave GEMINI_API_KEY não encontrada no ambiente.")
-        raise Exception("Chave GEMINI_API_KEY não configurada.")
-        
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    
+    chave = chave_insight(prompt, response_schema)
+    if usar_cache:
+        resposta_cache = _cache_insights.obter(chave)
+        if resposta_cache is not None:
+            return resposta_cache
+
+    if not disjuntor_gemini.permitir():
+        raise GeminiIndisponivel("Circuito da API Gemini aberto; chamada não realizada.")
+
+    timeout_s = GEMINI_TIMEOUT_S if timeout_s is None else timeout_s
+    tentativas = max(1, GEMINI_TENTATIVAS if tentativas is None else tentativas)
+    inicio = time.monotonic()
+    try:
+        texto = _gerar_conteudo(prompt, response_schema, timeout_s, tentativas)
+    except Exception:
+        _registrar_chamada(len(prompt), time.monotonic() - inicio, False)
+        disjuntor_gemini.registrar_falha()
+        raise
+    latencia_s = time.monotonic() - inicio
+    _registrar_chamada(len(prompt), latencia_s, True)
+    if latencia_s > timeout_s * tentativas:
+        logger.warning("Resposta da API Gemini chegou após o timeout de %.1fs.", timeout_s * tentativas)
+        disjuntor_gemini.registrar_falha()
+    else:
+        disjuntor_gemini.registrar_sucesso()
+    if response_schema:
+        try:
+            json.loads(texto)
+        except ValueError:
+            # Resposta malformada não vai para o cache; o chamador trata o erro
+            return texto
+    _cache_insights.guardar(chave, texto, GEMINI_CACHE_TTL_S)
+    return texto
+
+
+def _gerar_conteudo(prompt: str, response_schema: dict, timeout_s: float, tentativas: int) -> str:
+    model = obter_modelo()
+
     generation_config = {}
     if response_schema:
         generation_config = {
             "response_mime_type": "application/json",
             "response_schema": response_schema
         }
-    
-    try:
-        response = model.generate_content(
-            prompt, 
-            generation_config=generation_config 
-        )
-        
-        return response.text
-        
-    except Exception as e:
-        logger.error("Erro na chamada da API Gemini: %s", e)
-        raise Exception(f"Falha na API Gemini: {e}")
\ No newline at end of file
+
+    espera = GEMINI_ESPERA_INICIAL_S
+    for tentativa in range(1, tentativas + 1):
+        try:
+            response = model.generate_content(
+                prompt,
+                generation_config=generation_config,
+                # O retry fica por nossa conta para respeitar o orçamento de tentativas
+                request_options={"timeout": timeout_s, "retry": None},
+            )
+
+            return response.text
+
+        except _ERROS_TRANSITORIOS as e:
+            if tentativa == tentativas:
+                logger.error("Erro na chamada da API Gemini após %d tentativa(s): %s", tentativa, e)
+                raise Exception(f"Falha na API Gemini: {e}")
+            logger.warning("Erro transitório na API Gemini (tentativa %d/%d): %s", tentativa, tentativas, e)
+            time.sleep(espera)
+            espera *= 2
+        except Exception as e:
+            logger.error("Erro na chamada da API Gemini: %s", e)
+            raise Exception(f"Falha na API Gemini: {e}")
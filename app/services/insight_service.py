@@ -0,0 +1,211 @@
+from .gemini_service import get_gemini_response, GeminiIndisponivel, GEMINI_TIMEOUT_S
+from app.utils.cache import CacheTTL
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from dotenv import load_dotenv
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Execução do insight em segundo plano (modo assíncrono das rotas de análise)
+INSIGHT_WORKERS = int(os.getenv("INSIGHT_WORKERS", "4"))
+INSIGHT_TTL_S = float(os.getenv("INSIGHT_TTL_S", "600"))
+INSIGHT_LIMITE_BYTES = int(os.getenv("INSIGHT_LIMITE_BYTES", str(4 * 1024 * 1024)))
+
+# Orçamento de latência (s) da etapa de insight por rota; estourado, vale o texto local.
+# Sobrescreva com INSIGHT_ORCAMENTO_S_<TIPO> (ex.: INSIGHT_ORCAMENTO_S_PREVISAO=5).
+INSIGHT_ORCAMENTO_PADRAO_S = {"previsao": 8.0, "comparacao": 8.0, "correlacao": 6.0, "pergunta": 20.0, "frota": 10.0}
+# Pool próprio das chamadas com orçamento: uma chamada estourada segue até o timeout
+# da API sem ocupar os workers dos insights assíncronos
+INSIGHT_ORCAMENTO_WORKERS = int(os.getenv("INSIGHT_ORCAMENTO_WORKERS", "8"))
+
+# Com 0 as análises usam só a interpretação local (ex.: processamento em lote)
+INSIGHT_IA_ATIVO = os.getenv("INSIGHT_IA_ATIVO", "1") == "1"
+
+STATUS_PENDENTE = "pendente"
+STATUS_PRONTO = "pronto"
+
+ORIGEM_IA = "ia"
+ORIGEM_LOCAL = "local"
+
+_executor = None
+_executor_orcamento = None
+_executor_lock = threading.Lock()
+_insights = CacheTTL(INSIGHT_LIMITE_BYTES, nome="insights")
+_metricas = {"geradas_ia": 0, "fallbacks": 0, "estouros_orcamento": 0, "circuito_aberto": 0}
+_metricas_lock = threading.Lock()
+
+
+class _EstadoInsight:
+    """Estado de um insight agendado; `concluido` libera quem está aguardando (SSE)."""
+
+    __slots__ = ("status", "origem", "interpretacao", "criado_em", "concluido")
+
+    def __init__(self):
+        self.status = STATUS_PENDENTE
+        self.origem = None
+        self.interpretacao = []
+        self.criado_em = time.time()
+        self.concluido = threading.Event()
+
+    def como_dict(self, insight_id: str) -> dict:
+        return {
+            "insight_id": insight_id,
+            "status": self.status,
+            "origem": self.origem,
+            "interpretacao": self.interpretacao,
+        }
+
+
+def _somar(**valores):
+    with _metricas_lock:
+        for nome, valor in valores.items():
+            _metricas[nome] += valor
+
+
+def _obter_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=INSIGHT_WORKERS, thread_name_prefix="insight")
+    return _executor
+
+
+def _obter_executor_orcamento() -> ThreadPoolExecutor:
+    global _executor_orcamento
+    if _executor_orcamento is None:
+        with _executor_lock:
+            if _executor_orcamento is None:
+                _executor_orcamento = ThreadPoolExecutor(
+                    max_workers=INSIGHT_ORCAMENTO_WORKERS, thread_name_prefix="insight_orcamento"
+                )
+    return _executor_orcamento
+
+
+def orcamento_insight(tipo: str) -> float:
+    """Orçamento de latência (s) do insight para o tipo de análise."""
+    valor = os.getenv(f"INSIGHT_ORCAMENTO_S_{tipo.upper()}")
+    if valor:
+        return float(valor)
+    return INSIGHT_ORCAMENTO_PADRAO_S.get(tipo, GEMINI_TIMEOUT_S)
+
+
+def _interpretacao(prompt: str, response_schema: dict, usar_cache: bool, timeout_s: float = None) -> list:
+    # Dentro de um orçamento não sobra tempo para novas tentativas
+    tentativas = 1 if timeout_s is not None else None
+    resposta_ia_json_str = get_gemini_response(
+        prompt, response_schema, timeout_s=timeout_s, tentativas=tentativas, usar_cache=usar_cache
+    )
+    ia_data = json.loads(resposta_ia_json_str)
+    return ia_data.get("interpretacao", ["Análise indisponível."])
+
+
+def _registrar_falha(e: Exception, contexto: str) -> None:
+    if isinstance(e, GeminiIndisponivel):
+        _somar(fallbacks=1, circuito_aberto=1)
+        logger.info("Insight local (%s): %s", contexto, e)
+    else:
+        _somar(fallbacks=1)
+        logger.error("Falha Gemini (%s): %s", contexto, e)
+
+
+def gerar_insight(prompt: str, response_schema: dict, usar_cache: bool = True,
+                  fallback: list = None, orcamento_s: float = None) -> list:
+    """
+    Chama o Gemini e extrai a lista 'interpretacao' da resposta JSON.
+
+    Com orcamento_s a espera é limitada: estourado o orçamento (ou com o circuito
+    aberto / falha da API) devolve `fallback`, o texto local montado pelo serviço
+    com os números já calculados. A chamada estourada segue em segundo plano, no
+    pool das chamadas com orçamento e limitada pelo mesmo prazo no timeout da
+    API; se concluir, alimenta o cache de insights.
+    """
+    fallback = fallback or ["Erro na geração de análise."]
+    try:
+        if orcamento_s is None:
+            interpretacao = _interpretacao(prompt, response_schema, usar_cache)
+        else:
+            futuro = _obter_executor_orcamento().submit(_interpretacao, prompt, response_schema, usar_cache, orcamento_s)
+            interpretacao = futuro.result(timeout=orcamento_s)
+    except FuturesTimeout:
+        _somar(fallbacks=1, estouros_orcamento=1)
+        logger.warning("Insight excedeu o orçamento de %.1fs; usando texto local.", orcamento_s)
+        return fallback
+    except Exception as e:
+        _registrar_falha(e, "síncrono")
+        return fallback
+    _somar(geradas_ia=1)
+    return interpretacao
+
+
+def agendar_insight(prompt: str, response_schema: dict, usar_cache: bool = True,
+                    fallback: list = None) -> str:
+    """Agenda a geração do insight em segundo plano e retorna o insight_id para consulta."""
+    fallback = fallback or ["Erro na geração de análise."]
+    insight_id = uuid.uuid4().hex
+    estado = _EstadoInsight()
+    _insights.guardar(insight_id, estado, INSIGHT_TTL_S, tamanho_bytes=len(prompt) + 512)
+
+    def _executar():
+        try:
+            estado.interpretacao = _interpretacao(prompt, response_schema, usar_cache)
+            estado.origem = ORIGEM_IA
+            _somar(geradas_ia=1)
+        except Exception as e:
+            _registrar_falha(e, f"insight {insight_id}")
+            estado.interpretacao = fallback
+            estado.origem = ORIGEM_LOCAL
+        finally:
+            estado.status = STATUS_PRONTO
+            estado.concluido.set()
+
+    _obter_executor().submit(_executar)
+    return insight_id
+
+
+def resolver_insight(analise_req, tipo: str, prompt: str, response_schema: dict, fallback: list) -> tuple:
+    """
+    Gera o insight conforme o modo da requisição. Retorna (insight_ia, insight_id):
+    no modo assíncrono insight_ia vem vazio e o texto é consultado depois pelo id;
+    no síncrono a espera respeita o orçamento de latência do tipo de análise.
+    """
+    if not INSIGHT_IA_ATIVO:
+        _somar(fallbacks=1)
+        return fallback, None
+    usar_cache = not analise_req.ignorarCacheIa
+    if analise_req.insightAssincrono:
+        return [], agendar_insight(prompt, response_schema, usar_cache, fallback)
+    return gerar_insight(prompt, response_schema, usar_cache, fallback, orcamento_insight(tipo)), None
+
+
+def obter_insight(insight_id: str):
+    """Retorna {insight_id, status, interpretacao} ou None se o id não existe/expirou."""
+    estado = _insights.obter(insight_id)
+    if estado is None:
+        return None
+    return estado.como_dict(insight_id)
+
+
+def aguardar_insight(insight_id: str, timeout_s: float):
+    """Bloqueia até o insight concluir (ou o timeout) e retorna o mesmo formato de obter_insight."""
+    estado = _insights.obter(insight_id)
+    if estado is None:
+        return None
+    estado.concluido.wait(timeout_s)
+    return estado.como_dict(insight_id)
+
+
+def obter_metricas_insights() -> dict:
+    dados = _insights.metricas()
+    with _metricas_lock:
+        dados.update(_metricas)
+    dados["workers"] = INSIGHT_WORKERS
+    dados["workers_orcamento"] = INSIGHT_ORCAMENTO_WORKERS
+    return dados
@@ -0,0 +1,219 @@
+from app.models.dataModel import AnaliseRequest
+from app.utils.cache import CacheTTL
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, replace
+from dotenv import load_dotenv
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Refresh-ahead: resultados de /previsao e /comparar das combinações mais pedidas
+# ficam em memória e são recalculados em segundo plano antes de expirar.
+PRECALCULO_ATIVO = os.getenv("PRECALCULO_ATIVO", "1") == "1"
+PRECALCULO_TTL_S = float(os.getenv("PRECALCULO_TTL_S", "300"))
+# Com o resultado mais velho que TTL - ANTECEDENCIA, chaves quentes são recalculadas
+PRECALCULO_ANTECEDENCIA_S = float(os.getenv("PRECALCULO_ANTECEDENCIA_S", "60"))
+PRECALCULO_LIMITE_BYTES = int(os.getenv("PRECALCULO_LIMITE_BYTES", str(16 * 1024 * 1024)))
+# Chave quente: ao menos MIN_ACESSOS pedidos dentro da janela
+PRECALCULO_JANELA_S = float(os.getenv("PRECALCULO_JANELA_S", "900"))
+PRECALCULO_MIN_ACESSOS = int(os.getenv("PRECALCULO_MIN_ACESSOS", "3"))
+PRECALCULO_MAX_CHAVES = int(os.getenv("PRECALCULO_MAX_CHAVES", "256"))
+PRECALCULO_INTERVALO_S = float(os.getenv("PRECALCULO_INTERVALO_S", "15"))
+# Limites para não disputar recursos com as requisições ao vivo
+PRECALCULO_WORKERS = int(os.getenv("PRECALCULO_WORKERS", "1"))
+PRECALCULO_MAX_AO_VIVO = int(os.getenv("PRECALCULO_MAX_AO_VIVO", "4"))
+
+_resultados = CacheTTL(PRECALCULO_LIMITE_BYTES, nome="pre_calculo")
+# chave -> {"acessos": deque de instantes, "tipo", "req", "processar"}
+_chaves = {}
+_em_recalculo = set()
+_ao_vivo = 0
+_lock = threading.Lock()
+_executor = None
+_agendador = None
+_metricas = {"hits": 0, "misses": 0, "recalculos": 0, "falhas_recalculo": 0, "adiados": 0}
+
+
+def _somar(**valores):
+    with _lock:
+        for nome, valor in valores.items():
+            _metricas[nome] += valor
+
+
+def chave_pre_calculo(tipo: str, analise_req: AnaliseRequest) -> tuple:
+    """Tipo de análise + campos da requisição que definem o resultado (sem as opções de entrega)."""
+    return (tipo,) + astuple(replace(analise_req, ignorarCacheIa=False, insightAssincrono=False))
+
+
+def _registrar_acesso(chave, tipo, analise_req, processar) -> None:
+    agora = time.monotonic()
+    with _lock:
+        info = _chaves.get(chave)
+        if info is None:
+            if len(_chaves) >= PRECALCULO_MAX_CHAVES:
+                # Descarta a chave acessada há mais tempo
+                antiga = min(_chaves, key=lambda c: _chaves[c]["acessos"][-1])
+                del _chaves[antiga]
+            info = _chaves[chave] = {"acessos": deque(maxlen=64), "tipo": tipo}
+        info["acessos"].append(agora)
+        # O recálculo repete o pedido sem as opções de entrega: sempre síncrono e com o cache da IA
+        info["req"] = replace(analise_req, ignorarCacheIa=False, insightAssincrono=False)
+        info["processar"] = processar
+
+
+def _quente(info, agora) -> bool:
+    limite = agora - PRECALCULO_JANELA_S
+    return sum(1 for t in info["acessos"] if t >= limite) >= PRECALCULO_MIN_ACESSOS
+
+
+def _chave_quente(chave) -> bool:
+    with _lock:
+        info = _chaves.get(chave)
+        return info is not None and _quente(info, time.monotonic())
+
+
+def _guardar(chave, resultado) -> None:
+    if "erro" in resultado:
+        return
+    _resultados.guardar(chave, (resultado, time.monotonic()), PRECALCULO_TTL_S)
+
+
+def _obter_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PRECALCULO_WORKERS, thread_name_prefix="pre_calculo")
+    return _executor
+
+
+def _recalcular(chave, analise_req, processar) -> None:
+    try:
+        inicio = time.monotonic()
+        _guardar(chave, processar(analise_req))
+        _somar(recalculos=1)
+        logger.debug("Pré-cálculo de %s renovado em %.2fs.", chave[:2], time.monotonic() - inicio)
+    except Exception as e:
+        _somar(falhas_recalculo=1)
+        logger.error("Falha no pré-cálculo de %s: %s", chave[:2], e)
+    finally:
+        with _lock:
+            _em_recalculo.discard(chave)
+
+
+def _agendar_recalculo(chave) -> bool:
+    """Envia a chave para recálculo se houver vaga; False quando adiada."""
+    with _lock:
+        info = _chaves.get(chave)
+        if info is None or chave in _em_recalculo:
+            return False
+        if len(_em_recalculo) >= PRECALCULO_WORKERS or _ao_vivo >= PRECALCULO_MAX_AO_VIVO:
+            _metricas["adiados"] += 1
+            return False
+        _em_recalculo.add(chave)
+        analise_req, processar = info["req"], info["processar"]
+    _obter_executor().submit(_recalcular, chave, analise_req, processar)
+    return True
+
+
+def _varrer() -> None:
+    """Uma passada do agendador: renova as chaves quentes perto de expirar e esquece as frias."""
+    agora = time.monotonic()
+    with _lock:
+        frias = [c for c, info in _chaves.items() if info["acessos"][-1] < agora - PRECALCULO_JANELA_S]
+        for chave in frias:
+            del _chaves[chave]
+        quentes = [c for c, info in _chaves.items() if _quente(info, agora)]
+
+    for chave in quentes:
+        entrada = _resultados.obter(chave)
+        if entrada is None or agora - entrada[1] >= PRECALCULO_TTL_S - PRECALCULO_ANTECEDENCIA_S:
+            _agendar_recalculo(chave)
+
+
+def _laco_agendador() -> None:
+    while True:
+        time.sleep(PRECALCULO_INTERVALO_S)
+        try:
+            _varrer()
+        except Exception as e:
+            logger.error("Erro no agendador de pré-cálculo: %s", e)
+
+
+def _iniciar_agendador() -> None:
+    global _agendador
+    if _agendador is not None:
+        return
+    with _lock:
+        if _agendador is None:
+            _agendador = threading.Thread(target=_laco_agendador, name="pre_calculo_agendador", daemon=True)
+            _agendador.start()
+            logger.info("Agendador de pré-cálculo iniciado (intervalo de %.0fs).", PRECALCULO_INTERVALO_S)
+
+
+def servir_com_pre_calculo(tipo: str, analise_req: AnaliseRequest, processar):
+    """
+    Executa processar(analise_req) passando pelo cache de pré-cálculo.
+
+    Cada pedido conta para a frequência da chave; as chaves quentes são
+    recalculadas em segundo plano (seleção de modelo e insight incluídos) antes
+    de o resultado expirar, e passam a ser servidas da memória. Pedidos com
+    ignorarCacheIa ou insightAssincrono são sempre calculados na hora; só o
+    resultado síncrono de uma chave quente é guardado.
+    """
+    if not PRECALCULO_ATIVO:
+        return processar(analise_req)
+    global _ao_vivo
+
+    chave = chave_pre_calculo(tipo, analise_req)
+    _registrar_acesso(chave, tipo, analise_req, processar)
+    _iniciar_agendador()
+
+    if not (analise_req.ignorarCacheIa or analise_req.insightAssincrono):
+        entrada = _resultados.obter(chave)
+        if entrada is not None:
+            _somar(hits=1)
+            return entrada[0]
+    _somar(misses=1)
+
+    with _lock:
+        _ao_vivo += 1
+    try:
+        resultado = processar(analise_req)
+    finally:
+        with _lock:
+            _ao_vivo -= 1
+    if not analise_req.insightAssincrono and _chave_quente(chave):
+        _guardar(chave, resultado)
+    return resultado
+
+
+def invalidar_pre_calculo(fkEmpresa=None, fkMaquina=None) -> int:
+    """Descarta os resultados pré-calculados da empresa/máquina (todos se ambos None)."""
+    campos = [f for f in AnaliseRequest.__dataclass_fields__]
+    i_empresa = 1 + campos.index("fkEmpresa")
+    i_maquina = 1 + campos.index("fkMaquina")
+
+    def pertence(chave):
+        return (fkEmpresa is None or chave[i_empresa] == fkEmpresa) and (fkMaquina is None or chave[i_maquina] == fkMaquina)
+
+    return _resultados.invalidar(pertence)
+
+
+def obter_metricas_pre_calculo() -> dict:
+    dados = _resultados.metricas()
+    agora = time.monotonic()
+    with _lock:
+        dados.update(_metricas)
+        dados["chaves_monitoradas"] = len(_chaves)
+        dados["chaves_quentes"] = sum(1 for info in _chaves.values() if _quente(info, agora))
+        dados["em_recalculo"] = len(_em_recalculo)
+        dados["ao_vivo"] = _ao_vivo
+    dados["ativo"] = PRECALCULO_ATIVO
+    return dados
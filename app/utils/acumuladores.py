@@ -0,0 +1,197 @@
+# app/utils/acumuladores.py
+
+from app.utils.cache import CacheTTL
+from dotenv import load_dotenv
+import hashlib
+import os
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Estatísticas acumuladas dos buckets fechados de cada série (ou par de séries)
+ACUMULADORES_TTL_S = float(os.getenv("ACUMULADORES_TTL_S", "3600"))
+ACUMULADORES_LIMITE_BYTES = int(os.getenv("ACUMULADORES_LIMITE_BYTES", str(2 * 1024 * 1024)))
+# Pontos finais do trecho acumulado conferidos antes de reaproveitá-lo
+ACUMULADORES_CAUDA = int(os.getenv("ACUMULADORES_CAUDA", "8"))
+
+_acumulados = CacheTTL(ACUMULADORES_LIMITE_BYTES, nome="acumuladores")
+_metricas = {"reaproveitados": 0, "recalculados": 0, "pontos_novos": 0, "pontos_reaproveitados": 0}
+_metricas_lock = threading.Lock()
+
+
+class AcumuladorSerie:
+    """
+    Contagem, média e soma dos quadrados dos desvios (Welford) de uma série.
+    Dois acumuladores de trechos disjuntos se combinam com mesclar (Chan et al.).
+    """
+
+    __slots__ = ("n", "media", "m2")
+
+    def __init__(self, n: int = 0, media: float = 0.0, m2: float = 0.0):
+        self.n = n
+        self.media = media
+        self.m2 = m2
+
+    @classmethod
+    def de_valores(cls, valores) -> "AcumuladorSerie":
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return cls()
+        media = float(valores.mean())
+        return cls(len(valores), media, float(((valores - media) ** 2).sum()))
+
+    def mesclar(self, outro: "AcumuladorSerie") -> "AcumuladorSerie":
+        if outro.n == 0:
+            return self
+        if self.n == 0:
+            return outro
+        n = self.n + outro.n
+        delta = outro.media - self.media
+        return AcumuladorSerie(
+            n,
+            self.media + delta * outro.n / n,
+            self.m2 + outro.m2 + delta * delta * self.n * outro.n / n,
+        )
+
+    @property
+    def soma(self) -> float:
+        return self.media * self.n
+
+    @property
+    def variancia(self) -> float:
+        return self.m2 / self.n if self.n else 0.0
+
+
+class AcumuladorPar:
+    """
+    Médias, somas dos quadrados dos desvios e co-momento de um par (X, Y), mais
+    o mínimo/máximo de X, mescláveis como em AcumuladorSerie. Dão o Pearson e a
+    regressão Y = B0 + B1 * X sem revisitar os pontos.
+    """
+
+    __slots__ = ("n", "media_x", "media_y", "m2_x", "m2_y", "c_xy", "min_x", "max_x")
+
+    def __init__(self, n=0, media_x=0.0, media_y=0.0, m2_x=0.0, m2_y=0.0, c_xy=0.0,
+                 min_x=np.inf, max_x=-np.inf):
+        self.n = n
+        self.media_x = media_x
+        self.media_y = media_y
+        self.m2_x = m2_x
+        self.m2_y = m2_y
+        self.c_xy = c_xy
+        self.min_x = min_x
+        self.max_x = max_x
+
+    @classmethod
+    def de_valores(cls, valores_x, valores_y) -> "AcumuladorPar":
+        validos = ~(np.isnan(valores_x) | np.isnan(valores_y))
+        x, y = valores_x[validos], valores_y[validos]
+        if len(x) == 0:
+            return cls()
+        media_x, media_y = float(x.mean()), float(y.mean())
+        dx, dy = x - media_x, y - media_y
+        return cls(
+            len(x), media_x, media_y,
+            float((dx * dx).sum()), float((dy * dy).sum()), float((dx * dy).sum()),
+            float(x.min()), float(x.max()),
+        )
+
+    def mesclar(self, outro: "AcumuladorPar") -> "AcumuladorPar":
+        if outro.n == 0:
+            return self
+        if self.n == 0:
+            return outro
+        n = self.n + outro.n
+        dx = outro.media_x - self.media_x
+        dy = outro.media_y - self.media_y
+        fator = self.n * outro.n / n
+        return AcumuladorPar(
+            n,
+            self.media_x + dx * outro.n / n,
+            self.media_y + dy * outro.n / n,
+            self.m2_x + outro.m2_x + dx * dx * fator,
+            self.m2_y + outro.m2_y + dy * dy * fator,
+            self.c_xy + outro.c_xy + dx * dy * fator,
+            min(self.min_x, outro.min_x),
+            max(self.max_x, outro.max_x),
+        )
+
+    def pearson(self) -> float:
+        """r de Pearson; 0 com menos de 2 pontos ou uma das séries constante."""
+        if self.n < 2 or self.m2_x <= 0 or self.m2_y <= 0:
+            return 0.0
+        return max(-1.0, min(1.0, self.c_xy / np.sqrt(self.m2_x * self.m2_y)))
+
+    def regressao(self) -> tuple:
+        """(B1 inclinação, B0 intercepto) de Y = B0 + B1 * X por mínimos quadrados."""
+        inclinacao = self.c_xy / self.m2_x if self.m2_x > 0 else 0.0
+        return inclinacao, self.media_y - inclinacao * self.media_x
+
+
+def _impressao_cauda(datas, colunas: tuple, m: int) -> str:
+    """Impressão digital (datas + valores) dos últimos ACUMULADORES_CAUDA pontos antes de m."""
+    inicio = max(0, m - ACUMULADORES_CAUDA)
+    h = hashlib.sha1(np.ascontiguousarray(datas[inicio:m]).tobytes())
+    for coluna in colunas:
+        h.update(np.ascontiguousarray(coluna[inicio:m], dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def acumular_incremental(chave, datas, colunas: tuple, classe, fechado_ate):
+    """
+    Acumulador (classe AcumuladorSerie ou AcumuladorPar) de `colunas` alinhadas
+    a `datas` (ordenadas), reaproveitando o que já foi acumulado para `chave`.
+
+    Só os buckets anteriores a fechado_ate (o bucket em andamento) são guardados:
+    numa nova chamada apenas os buckets fechados desde então são somados, e o
+    trecho ainda aberto entra numa cópia. A série é tratada como só-acréscimo,
+    como em _series_fechadas: o reaproveitamento confere, em O(1), a primeira
+    data, a quantidade já acumulada e a impressão digital dos últimos
+    ACUMULADORES_CAUDA pontos dela. Se não bater (janela diferente, buckets
+    recentes refeitos) a chave é recalculada do zero; correções mais antigas
+    chegam por invalidar_intervalo, que descarta os acumuladores afetados.
+    """
+    fechados = int(np.searchsorted(datas, fechado_ate, side='left'))
+    base, usados = None, 0
+    guardado = _acumulados.obter(chave)
+    if guardado is not None:
+        acumulador, primeira, quantidade, cauda = guardado
+        if (0 < quantidade <= fechados and datas[0] == primeira
+                and _impressao_cauda(datas, colunas, quantidade) == cauda):
+            base, usados = acumulador, quantidade
+
+    novos = classe.de_valores(*(coluna[usados:fechados] for coluna in colunas))
+    fechado = base.mesclar(novos) if base is not None else novos
+    if fechados > usados:
+        _acumulados.guardar(
+            chave, (fechado, datas[0], fechados, _impressao_cauda(datas, colunas, fechados)),
+            ACUMULADORES_TTL_S, tamanho_bytes=512,
+        )
+
+    with _metricas_lock:
+        if base is not None:
+            _metricas["reaproveitados"] += 1
+            _metricas["pontos_reaproveitados"] += usados
+        else:
+            _metricas["recalculados"] += 1
+        _metricas["pontos_novos"] += len(datas) - usados
+
+    aberto = classe.de_valores(*(coluna[fechados:] for coluna in colunas))
+    return fechado.mesclar(aberto)
+
+
+def invalidar_acumuladores(predicado=None) -> int:
+    """Descarta os acumuladores (todos ou os cujas chaves satisfazem o predicado)."""
+    return _acumulados.invalidar(predicado)
+
+
+def obter_metricas_acumuladores() -> dict:
+    dados = _acumulados.metricas()
+    with _metricas_lock:
+        dados.update(_metricas)
+    return dados
@@ -0,0 +1,107 @@
+# app/utils/cache.py
+
+from collections import OrderedDict
+import sys
+import threading
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def estimar_tamanho_bytes(valor) -> int:
+    """Estimativa do tamanho em memória de um valor cacheado (arrays NumPy contam nbytes)."""
+    if isinstance(valor, np.ndarray):
+        return int(valor.nbytes)
+    if isinstance(valor, (tuple, list)):
+        return sys.getsizeof(valor) + sum(estimar_tamanho_bytes(v) for v in valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(
+            estimar_tamanho_bytes(k) + estimar_tamanho_bytes(v) for k, v in valor.items()
+        )
+    return sys.getsizeof(valor)
+
+
+class CacheTTL:
+    """
+    Cache em memória, thread-safe, com TTL por entrada, limite total em bytes
+    e despejo LRU. Mantém contadores de hit/miss para observabilidade.
+    """
+
+    def __init__(self, limite_bytes: int, nome: str = "cache"):
+        self.nome = nome
+        self._limite_bytes = max(0, int(limite_bytes))
+        # chave -> (valor, tamanho_bytes, expira_em)
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expirados = 0
+        self._despejos = 0
+
+    def obter(self, chave):
+        """Retorna o valor ou None (ausente/expirado). Um hit move a entrada para o fim da fila LRU."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self._misses += 1
+                return None
+            valor, tamanho, expira_em = entrada
+            if expira_em <= time.monotonic():
+                del self._entradas[chave]
+                self._bytes -= tamanho
+                self._expirados += 1
+                self._misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self._hits += 1
+            return valor
+
+    def guardar(self, chave, valor, ttl_s: float, tamanho_bytes: int = None):
+        """Armazena o valor por ttl_s segundos, despejando as entradas menos usadas se faltar espaço."""
+        if ttl_s <= 0:
+            return
+        tamanho = estimar_tamanho_bytes(valor) if tamanho_bytes is None else int(tamanho_bytes)
+        if tamanho > self._limite_bytes:
+            logger.debug("%s: entrada de %d bytes excede o limite; não cacheada.", self.nome, tamanho)
+            return
+        with self._lock:
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            while self._entradas and self._bytes + tamanho > self._limite_bytes:
+                _, (_, tamanho_despejado, _) = self._entradas.popitem(last=False)
+                self._bytes -= tamanho_despejado
+                self._despejos += 1
+            self._entradas[chave] = (valor, tamanho, time.monotonic() + ttl_s)
+            self._bytes += tamanho
+
+    def invalidar(self, predicado=None) -> int:
+        """Remove todas as entradas (ou só as cujas chaves satisfazem o predicado)."""
+        with self._lock:
+            if predicado is None:
+                removidas = len(self._entradas)
+                self._entradas.clear()
+                self._bytes = 0
+                return removidas
+            chaves = [k for k in self._entradas if predicado(k)]
+            for k in chaves:
+                self._bytes -= self._entradas.pop(k)[1]
+            return len(chaves)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            consultas = self._hits + self._misses
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "limite_bytes": self._limite_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "taxa_acerto": (self._hits / consultas) if consultas else 0.0,
+                "expirados": self._expirados,
+                "despejos": self._despejos,
+            }
@@ -0,0 +1,293 @@
+# app/utils/cache_disco.py
+
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+
+# Trava entre processos: flock no Linux/macOS, msvcrt.locking no Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Cache em disco das séries (buckets fechados) em arquivos .npy lidos com mmap:
+# sobrevive a restarts/deploys e os workers compartilham as páginas do page cache.
+# Sem CACHE_DISCO_DIR (ou sem trava de arquivo na plataforma) o cache em disco fica desligado.
+CACHE_DISCO_DIR = os.getenv("CACHE_DISCO_DIR", "")
+# Buckets que fecharam menos de ASSENTAMENTO_S antes da gravação ainda podem
+# receber linhas atrasadas: na leitura ficam de fora e voltam a ser pedidos à SP.
+CACHE_DISCO_ASSENTAMENTO_S = float(os.getenv("CACHE_DISCO_ASSENTAMENTO_S", "3600"))
+
+# Tentativas (a cada CACHE_DISCO_TRAVA_ESPERA_S) de obter a trava com msvcrt;
+# esgotadas, o cache em disco é desligado como nas plataformas sem trava.
+CACHE_DISCO_TRAVA_TENTATIVAS = int(os.getenv("CACHE_DISCO_TRAVA_TENTATIVAS", "100"))
+CACHE_DISCO_TRAVA_ESPERA_S = float(os.getenv("CACHE_DISCO_TRAVA_ESPERA_S", "0.05"))
+
+# Cada série tem o próprio diretório, com os .npy, o metadados.json e a trava
+_METADADOS = "metadados.json"
+_TRAVA = "metadados.lock"
+
+_UNIDADES = {"HORA": "h", "DIA": "D", "MES": "M"}
+
+_metricas = {"leituras": 0, "acertos": 0, "gravacoes": 0, "invalidacoes": 0, "buckets_reabertos": 0}
+_metricas_lock = threading.Lock()
+_aviso_sem_trava = False
+_trava_esgotada = False
+
+
+def cache_disco_habilitado() -> bool:
+    global _aviso_sem_trava
+    if not CACHE_DISCO_DIR or _trava_esgotada:
+        return False
+    if fcntl is None and msvcrt is None:
+        if not _aviso_sem_trava:
+            _aviso_sem_trava = True
+            logger.warning("Sem trava de arquivo nesta plataforma; cache em disco desligado.")
+        return False
+    return True
+
+
+def _agora_local() -> np.datetime64:
+    """Horário local (mesma referência dos buckets da SP) como datetime64[s]."""
+    return np.datetime64(datetime.now(), "s")
+
+
+def _somar(**valores):
+    with _metricas_lock:
+        for nome, valor in valores.items():
+            _metricas[nome] += valor
+
+
+def _id_chave(chave: tuple) -> str:
+    return hashlib.sha1(repr(chave).encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _travar_chave(id_chave: str):
+    """
+    Trava exclusiva (entre processos) de uma série enquanto seus arquivos e
+    metadados são trocados; séries diferentes não disputam a mesma trava.
+    """
+    global _trava_esgotada
+    base = os.path.join(CACHE_DISCO_DIR, id_chave)
+    os.makedirs(base, exist_ok=True)
+    with open(os.path.join(base, _TRAVA), "a+") as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        else:
+            # msvcrt trava bytes a partir da posição atual
+            trava.seek(0)
+            for _ in range(CACHE_DISCO_TRAVA_TENTATIVAS):
+                try:
+                    msvcrt.locking(trava.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(CACHE_DISCO_TRAVA_ESPERA_S)
+            else:
+                _trava_esgotada = True
+                logger.error("Trava do cache em disco indisponível após %d tentativas; cache em disco desligado.",
+                             CACHE_DISCO_TRAVA_TENTATIVAS)
+                raise TimeoutError(f"Trava do cache em disco indisponível para {id_chave}")
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_UN)
+            else:
+                trava.seek(0)
+                msvcrt.locking(trava.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _ler_metadados(id_chave: str):
+    caminho = os.path.join(CACHE_DISCO_DIR, id_chave, _METADADOS)
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("Metadados do cache em disco corrompidos em %s; série ignorada.", id_chave)
+        return None
+
+
+def _gravar_metadados(id_chave: str, metadados: dict) -> None:
+    caminho = os.path.join(CACHE_DISCO_DIR, id_chave, _METADADOS)
+    temporario = caminho + f".{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(metadados, f)
+    os.replace(temporario, caminho)
+
+
+def _remover_metadados(id_chave: str) -> None:
+    try:
+        os.remove(os.path.join(CACHE_DISCO_DIR, id_chave, _METADADOS))
+    except FileNotFoundError:
+        pass
+
+
+def _ids_gravados() -> list:
+    try:
+        with os.scandir(CACHE_DISCO_DIR) as entradas:
+            return [e.name for e in entradas if e.is_dir() and os.path.exists(os.path.join(e.path, _METADADOS))]
+    except FileNotFoundError:
+        return []
+
+
+def _arquivos(id_chave: str, versao: int) -> tuple:
+    base = os.path.join(CACHE_DISCO_DIR, id_chave)
+    return os.path.join(base, f"{versao}_datas.npy"), os.path.join(base, f"{versao}_valores.npy")
+
+
+def _remover_arquivos(id_chave: str, versao: int) -> None:
+    # Leitores que já mapearam a versão antiga continuam válidos (o inode só some depois)
+    for caminho in _arquivos(id_chave, versao):
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+def _corte_assentado(entrada: dict, agrupar_por: str) -> np.datetime64:
+    """
+    Início do primeiro bucket que ainda não tinha assentado quando a série foi
+    gravada (terminou a menos de CACHE_DISCO_ASSENTAMENTO_S da gravação).
+    """
+    unidade = _UNIDADES.get(agrupar_por, "D")
+    gravado_em = np.datetime64(entrada.get("gravado_em") or entrada["fim"], "s")
+    limite = gravado_em - np.timedelta64(int(CACHE_DISCO_ASSENTAMENTO_S), "s")
+    # Um bucket assentou se terminou até o limite: o corte é o bucket que contém o limite
+    return limite.astype(f"datetime64[{unidade}]").astype("datetime64[s]")
+
+
+def ler_serie_disco(chave: tuple):
+    """
+    Lê a série do disco com mmap (somente leitura, sem cópia).
+    Os buckets ainda não assentados na gravação ficam de fora (a cobertura
+    devolvida termina antes deles), para serem pedidos de novo à SP.
+    Retorna (inicio_cobertura, fim_cobertura, datas, valores) ou None.
+    """
+    _somar(leituras=1)
+    entrada = _ler_metadados(_id_chave(chave))
+    if entrada is None:
+        return None
+    inicio = np.datetime64(entrada["inicio"], "s")
+    fim = min(np.datetime64(entrada["fim"], "s"), _corte_assentado(entrada, chave[4]))
+    if fim <= inicio:
+        return None
+    caminho_datas, caminho_valores = _arquivos(_id_chave(chave), entrada["versao"])
+    try:
+        datas = np.load(caminho_datas, mmap_mode="r")
+        valores = np.load(caminho_valores, mmap_mode="r")
+    except (FileNotFoundError, ValueError) as e:
+        logger.warning("Arquivos do cache em disco indisponíveis para %s: %s", chave, e)
+        return None
+    assentados = int(np.searchsorted(datas, fim, side="left"))
+    _somar(acertos=1, buckets_reabertos=len(datas) - assentados)
+    return inicio, fim, datas[:assentados], valores[:assentados]
+
+
+def gravar_serie_disco(chave: tuple, inicio_cobertura, fim_cobertura, datas, valores) -> None:
+    """Grava uma nova versão da série e aponta os metadados dela para a nova versão (troca atômica)."""
+    id_chave = _id_chave(chave)
+
+    with _travar_chave(id_chave):
+        anterior = _ler_metadados(id_chave)
+        versao = (anterior["versao"] + 1) if anterior else 1
+
+        caminho_datas, caminho_valores = _arquivos(id_chave, versao)
+        np.save(caminho_datas, np.asarray(datas, dtype="datetime64[s]"))
+        np.save(caminho_valores, np.asarray(valores, dtype=np.float64))
+
+        _gravar_metadados(id_chave, {
+            "chave": list(chave),
+            "inicio": str(np.datetime64(inicio_cobertura, "s")),
+            "fim": str(np.datetime64(fim_cobertura, "s")),
+            "versao": versao,
+            "atualizado_em": time.time(),
+            "gravado_em": str(_agora_local()),
+        })
+        if anterior:
+            _remover_arquivos(id_chave, anterior["versao"])
+    _somar(gravacoes=1)
+
+
+def _truncar_serie(id_chave: str, inicio, fim, predicado) -> bool:
+    """Trunca (ou remove) uma série sob a trava dela; True se ela cruzava o trecho."""
+    with _travar_chave(id_chave):
+        entrada = _ler_metadados(id_chave)
+        if entrada is None or (predicado is not None and not predicado(tuple(entrada["chave"]))):
+            return False
+        inicio_cobertura = np.datetime64(entrada["inicio"], "s")
+        fim_cobertura = np.datetime64(entrada["fim"], "s")
+        if fim_cobertura <= inicio or inicio_cobertura > fim:
+            return False
+
+        unidade = _UNIDADES.get(entrada["chave"][4], "D")
+        corte = inicio.astype(f"datetime64[{unidade}]").astype("datetime64[s]")
+        if corte <= inicio_cobertura:
+            _remover_metadados(id_chave)
+            _remover_arquivos(id_chave, entrada["versao"])
+            return True
+
+        caminho_datas, caminho_valores = _arquivos(id_chave, entrada["versao"])
+        datas = np.load(caminho_datas)
+        valores = np.load(caminho_valores)
+        manter = datas < corte
+        nova_versao = entrada["versao"] + 1
+        novo_datas, novo_valores = _arquivos(id_chave, nova_versao)
+        np.save(novo_datas, datas[manter])
+        np.save(novo_valores, valores[manter])
+        _gravar_metadados(id_chave, dict(entrada, fim=str(corte), versao=nova_versao, atualizado_em=time.time()))
+        _remover_arquivos(id_chave, entrada["versao"])
+        return True
+
+
+def invalidar_intervalo_disco(data_inicio, data_fim, predicado=None) -> int:
+    """
+    Invalida o trecho [data_inicio, data_fim] das séries em disco (opcionalmente só
+    as cujas chaves satisfazem o predicado). Como a cobertura é contígua, a série
+    é truncada no início do bucket que contém data_inicio (o agrupamento é o
+    5º elemento da chave); se a cobertura começava dentro do trecho, é removida.
+    Cada série é tratada sob a sua própria trava.
+    Retorna a quantidade de séries afetadas.
+    """
+    if not cache_disco_habilitado():
+        return 0
+    inicio = np.datetime64(data_inicio, "s")
+    fim = np.datetime64(data_fim, "s")
+    afetadas = 0
+
+    for id_chave in _ids_gravados():
+        try:
+            afetadas += _truncar_serie(id_chave, inicio, fim, predicado)
+        except TimeoutError:
+            # Sem trava o disco fica desligado e nada mais é lido dele
+            break
+    _somar(invalidacoes=afetadas)
+    return afetadas
+
+
+def obter_metricas_cache_disco() -> dict:
+    with _metricas_lock:
+        dados = dict(_metricas)
+    dados["habilitado"] = cache_disco_habilitado()
+    dados["assentamento_s"] = CACHE_DISCO_ASSENTAMENTO_S
+    if cache_disco_habilitado():
+        dados["series"] = len(_ids_gravados())
+    return dados
@@ -2,76 +2,387 @@
 
 import mysql.connector
 from mysql.connector import Error
+from contextlib import contextmanager
 from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
 import os
-import logging 
+import queue
+import threading
+import time
+import logging
 
 logger = logging.getLogger(__name__)
 
-load_dotenv() 
+load_dotenv()
+
+# Configuração do pool de conexões (sobrescrevível via .env)
+DB_POOL_TAMANHO = int(os.getenv("DB_POOL_TAMANHO", "5"))
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "10"))
+DB_POOL_RECICLAR_S = float(os.getenv("DB_POOL_RECICLAR_S", "1800"))
+DB_POOL_PING_OCIOSO_S = float(os.getenv("DB_POOL_PING_OCIOSO_S", "30"))
+
+# Quantidade de linhas lidas por vez no fetch colunar
+COLUNAR_TAMANHO_LOTE = int(os.getenv("COLUNAR_TAMANHO_LOTE", "5000"))
+
+
+def obter_config_banco() -> dict:
+    """Monta as credenciais de acesso ao banco a partir do ambiente."""
+    return {
+        'user': os.getenv("USER_DB"),
+        'password': os.getenv("PASSWORD_DB"),
+        'host': os.getenv("HOST_DB"),
+        'database': os.getenv("DATABASE_DB")
+    }
+
+
+class PoolConexoes:
+    """
+    Pool de conexões MySQL compartilhado pelo processo.
+
+    - Reaproveita conexões já autenticadas (evita handshake TCP+auth por consulta).
+    - Faz health check (ping) nas conexões que ficaram ociosas por muito tempo.
+    - Recicla conexões mais antigas que DB_POOL_RECICLAR_S.
+    - Registra métricas de checkouts, tempo de espera e esgotamentos.
+    """
+
+    def __init__(self, db_config: dict, tamanho: int, timeout_s: float,
+                 reciclar_s: float, ping_ocioso_s: float):
+        self._db_config = db_config
+        self._tamanho = max(1, tamanho)
+        self._timeout_s = timeout_s
+        self._reciclar_s = reciclar_s
+        self._ping_ocioso_s = ping_ocioso_s
+        # Cada item é (conexao, criada_em, devolvida_em)
+        self._livres = queue.LifoQueue()
+        self._abertas = 0
+        self._lock = threading.Lock()
+        self._metricas = {
+            "checkouts": 0,
+            "espera_total_s": 0.0,
+            "espera_max_s": 0.0,
+            "esgotamentos": 0,
+            "conexoes_criadas": 0,
+            "conexoes_recicladas": 0,
+            "conexoes_descartadas": 0,
+        }
+
+    def _criar_conexao(self):
+        config = dict(self._db_config)
+        # Usa a extensão C do conector quando disponível (fetch bem mais barato)
+        if mysql.connector.HAVE_CEXT:
+            config.setdefault("use_pure", False)
+        conn = mysql.connector.connect(**config)
+        # autocommit evita que uma conexão reaproveitada fique presa a um snapshot antigo
+        conn.autocommit = True
+        with self._lock:
+            self._metricas["conexoes_criadas"] += 1
+        return conn
+
+    def _fechar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._abertas -= 1
+
+    def _validar(self, item):
+        """Devolve uma conexão utilizável, reciclando ou reconectando se necessário."""
+        conn, criada_em, devolvida_em = item
+        agora = time.monotonic()
+
+        if agora - criada_em > self._reciclar_s:
+            self._fechar(conn)
+            with self._lock:
+                self._abertas += 1
+                self._metricas["conexoes_recicladas"] += 1
+            try:
+                return self._criar_conexao(), time.monotonic()
+            except Exception:
+                with self._lock:
+                    self._abertas -= 1
+                raise
+
+        if agora - devolvida_em > self._ping_ocioso_s:
+            try:
+                conn.ping(reconnect=True, attempts=1, delay=0)
+            except Error:
+                self._fechar(conn)
+                with self._lock:
+                    self._abertas += 1
+                    self._metricas["conexoes_descartadas"] += 1
+                try:
+                    return self._criar_conexao(), time.monotonic()
+                except Exception:
+                    with self._lock:
+                        self._abertas -= 1
+                    raise
+
+        return conn, criada_em
+
+    def obter(self):
+        """Retira uma conexão do pool (criando uma nova se houver vaga)."""
+        inicio = time.perf_counter()
+        item = None
+        try:
+            item = self._livres.get_nowait()
+        except queue.Empty:
+            criar = False
+            with self._lock:
+                if self._abertas < self._tamanho:
+                    self._abertas += 1
+                    criar = True
+                else:
+                    self._metricas["esgotamentos"] += 1
+
+            if criar:
+                try:
+                    conn = self._criar_conexao()
+                except Exception:
+                    with self._lock:
+                        self._abertas -= 1
+                    raise
+                agora = time.monotonic()
+                item = (conn, agora, agora)
+            else:
+                try:
+                    item = self._livres.get(timeout=self._timeout_s)
+                except queue.Empty:
+                    raise RuntimeError(
+                        f"Pool de conexões esgotado após {self._timeout_s:.1f}s de espera."
+                    )
+
+        conn, criada_em = self._validar(item)
+
+        espera = time.perf_counter() - inicio
+        with self._lock:
+            self._metricas["checkouts"] += 1
+            self._metricas["espera_total_s"] += espera
+            self._metricas["espera_max_s"] = max(self._metricas["espera_max_s"], espera)
+        return conn, criada_em
+
+    def devolver(self, conn, criada_em: float, descartar: bool = False):
+        """Devolve a conexão ao pool. Conexões com erro são descartadas."""
+        if descartar or not conn.is_connected():
+            self._fechar(conn)
+            with self._lock:
+                self._metricas["conexoes_descartadas"] += 1
+            return
+        self._livres.put((conn, criada_em, time.monotonic()))
+
+    @contextmanager
+    def conexao(self):
+        """Context manager: `with pool.conexao() as conn: ...`"""
+        conn, criada_em = self.obter()
+        descartar = False
+        try:
+            yield conn
+        except Exception:
+            descartar = True
+            raise
+        finally:
+            self.devolver(conn, criada_em, descartar=descartar)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            dados = dict(self._metricas)
+            dados["conexoes_abertas"] = self._abertas
+        dados["conexoes_livres"] = self._livres.qsize()
+        dados["tamanho"] = self._tamanho
+        dados["espera_media_s"] = (
+            dados["espera_total_s"] / dados["checkouts"] if dados["checkouts"] else 0.0
+        )
+        return dados
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def obter_pool() -> PoolConexoes:
+    """
+    Retorna o pool do processo, criando-o na primeira chamada.
+    Após um fork o pool é recriado, pois sockets não podem ser compartilhados.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = PoolConexoes(
+                obter_config_banco(),
+                tamanho=DB_POOL_TAMANHO,
+                timeout_s=DB_POOL_TIMEOUT_S,
+                reciclar_s=DB_POOL_RECICLAR_S,
+                ping_ocioso_s=DB_POOL_PING_OCIOSO_S,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def obter_metricas_pool() -> dict:
+    """Métricas do pool de conexões (checkouts, espera, esgotamentos)."""
+    return obter_pool().metricas()
+
 
 def fazer_consulta_banco(config):
     """
-    Função de utilidade que centraliza a execução de consultas SQL, 
-    incluindo CALL de Stored Procedures. Gerencia a conexão e o cursor internamente.
+    Função de utilidade que centraliza a execução de consultas SQL,
+    incluindo CALL de Stored Procedures. Usa uma conexão do pool do processo.
 
     config (dict): Deve conter:
         - "query" (str): A instrução SQL ou CALL da Stored Procedure.
         - "params" (tuple/list, opcional): Os parâmetros para a instrução SQL.
-    
+
     Retorna: Lista de tuplas do resultado (ou lastrowid/rowcount para comandos DML).
     Lança RuntimeError em caso de falha.
     """
     instrucao_sql = config.get("query")
     valores = config.get("params", None)
 
-    db_config = {
-        'user': os.getenv("USER_DB"),
-        'password': os.getenv("PASSWORD_DB"),
-        'host': os.getenv("HOST_DB"),
-        'database': os.getenv("DATABASE_DB")
-    }
-    
-    conn = None
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-
-        # Execução da Query
-        if valores:
-            cursor.execute(instrucao_sql, valores if isinstance(valores, (tuple, list)) else (valores,))
-        else:
-            cursor.execute(instrucao_sql)
-
-        sql_tipo = instrucao_sql.strip().lower()
-        
-        # ... (lógica de SELECT/CALL/INSERT/UPDATE/DELETE inalterada) ...
-        if sql_tipo.startswith("select") or sql_tipo.startswith("call"):
-            resultado = cursor.fetchall()
-            
-            if sql_tipo.startswith("call"):
-                while cursor.nextset():
-                    pass 
-            
-            return resultado
-        else:
-            conn.commit()
-            
-            if sql_tipo.startswith("insert"):
-                return cursor.lastrowid
-            else:
-                return cursor.rowcount
+        with obter_pool().conexao() as conn:
+            cursor = conn.cursor()
+            try:
+                # Execução da Query
+                if valores:
+                    cursor.execute(instrucao_sql, valores if isinstance(valores, (tuple, list)) else (valores,))
+                else:
+                    cursor.execute(instrucao_sql)
+
+                sql_tipo = instrucao_sql.strip().lower()
+
+                if sql_tipo.startswith("select") or sql_tipo.startswith("call"):
+                    resultado = cursor.fetchall()
+
+                    # Consome os result sets restantes para a conexão voltar limpa ao pool
+                    if sql_tipo.startswith("call"):
+                        while cursor.nextset():
+                            pass
+
+                    return resultado
+                else:
+                    conn.commit()
+
+                    if sql_tipo.startswith("insert"):
+                        return cursor.lastrowid
+                    else:
+                        return cursor.rowcount
+            finally:
+                cursor.close()
 
     except Error as e:
         error_message = f"Erro no MySQL: {e}"
-        # logger.error em vez de print
-        logger.error(error_message) 
+        logger.error(error_message)
         raise RuntimeError(error_message)
+    except RuntimeError as e:
+        logger.error("Erro ao obter conexão: %s", e)
+        raise
     except Exception as e:
         error_message = f"Erro ao executar consulta: {e}"
-        # logger.error em vez de print
         logger.error(error_message)
         raise RuntimeError(error_message)
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
\ No newline at end of file
+
+
+def _converter_datas(valores_data) -> np.ndarray:
+    """Converte a coluna de datas de um lote para datetime64[s]."""
+    try:
+        return np.array(valores_data, dtype='datetime64[s]')
+    except (ValueError, TypeError):
+        # Formatos fora do ISO: delega ao parser do pandas
+        return pd.to_datetime(pd.Series(valores_data)).to_numpy().astype('datetime64[s]')
+
+
+def _ler_colunar(cursor, instrucao_sql, valores_params, tamanho_lote: int):
+    """Executa a instrução no cursor e lê as linhas (data, valor) em lotes para arrays pré-alocados."""
+    if valores_params:
+        cursor.execute(instrucao_sql, valores_params if isinstance(valores_params, (tuple, list)) else (valores_params,))
+    else:
+        cursor.execute(instrucao_sql)
+
+    capacidade = tamanho_lote
+    datas = np.empty(capacidade, dtype='datetime64[s]')
+    valores = np.empty(capacidade, dtype=np.float64)
+    total = 0
+
+    while True:
+        lote = cursor.fetchmany(tamanho_lote)
+        if not lote:
+            break
+        n = len(lote)
+        if total + n > capacidade:
+            capacidade = max(capacidade * 2, total + n)
+            datas = np.resize(datas, capacidade)
+            valores = np.resize(valores, capacidade)
+
+        coluna_data, coluna_valor = zip(*((linha[0], linha[1]) for linha in lote))
+        datas[total:total + n] = _converter_datas(coluna_data)
+        valores[total:total + n] = np.array(coluna_valor, dtype=np.float64)
+        total += n
+
+    # Consome os result sets restantes do CALL para a conexão seguir utilizável
+    if instrucao_sql.strip().lower().startswith("call"):
+        while cursor.nextset():
+            pass
+
+    datas = datas[:total]
+    valores = valores[:total]
+    if total > 1 and not np.all(datas[:-1] <= datas[1:]):
+        ordem = np.argsort(datas, kind='stable')
+        datas = datas[ordem]
+        valores = valores[ordem]
+    return datas, valores
+
+
+def fazer_consultas_colunares(configs: list, tamanho_lote: int = COLUNAR_TAMANHO_LOTE) -> list:
+    """
+    Executa várias consultas colunares em sequência usando uma única conexão do
+    pool (um checkout só), como um lote de múltiplos resultados.
+
+    configs (list[dict]): cada item no formato de fazer_consulta_banco ("query" e "params").
+
+    Retorna: lista de tuplas (datas, valores), na mesma ordem de configs.
+    Lança RuntimeError em caso de falha.
+    """
+    tamanho_lote = max(1, tamanho_lote)
+    resultados = []
+
+    try:
+        with obter_pool().conexao() as conn:
+            cursor = conn.cursor()
+            try:
+                for config in configs:
+                    resultados.append(
+                        _ler_colunar(cursor, config.get("query"), config.get("params", None), tamanho_lote)
+                    )
+            finally:
+                cursor.close()
+
+    except Error as e:
+        error_message = f"Erro no MySQL: {e}"
+        logger.error(error_message)
+        raise RuntimeError(error_message)
+    except RuntimeError as e:
+        logger.error("Erro ao obter conexão: %s", e)
+        raise
+    except Exception as e:
+        error_message = f"Erro ao executar consulta colunar: {e}"
+        logger.error(error_message)
+        raise RuntimeError(error_message)
+
+    return resultados
+
+
+def fazer_consulta_colunar(config, tamanho_lote: int = COLUNAR_TAMANHO_LOTE):
+    """
+    Executa uma consulta/CALL que retorna linhas (data, valor) e lê o resultado
+    em lotes (fetchmany) direto para arrays NumPy pré-alocados, sem montar a
+    lista de tuplas completa.
+
+    config (dict): mesmo formato de fazer_consulta_banco ("query" e "params").
+
+    Retorna: tupla (datas: datetime64[s], valores: float64), ordenada por data.
+    Valores nulos/não numéricos viram NaN.
+    Lança RuntimeError em caso de falha.
+    """
+    return fazer_consultas_colunares([config], tamanho_lote)[0]
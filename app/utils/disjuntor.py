@@ -0,0 +1,76 @@
+# app/utils/disjuntor.py
+
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+
+class DisjuntorCircuito:
+    """
+    Circuit breaker thread-safe. Após `limite_falhas` falhas consecutivas o
+    circuito abre e as chamadas são recusadas por `pausa_s` segundos; depois
+    disso uma única chamada de teste é liberada (meio aberto): sucesso fecha o
+    circuito, falha o abre de novo.
+    """
+
+    def __init__(self, limite_falhas: int, pausa_s: float, nome: str = "disjuntor"):
+        self.nome = nome
+        self._limite_falhas = max(1, int(limite_falhas))
+        self._pausa_s = float(pausa_s)
+        self._estado = FECHADO
+        self._falhas_seguidas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+        self._lock = threading.Lock()
+        self._aberturas = 0
+        self._recusadas = 0
+
+    def permitir(self) -> bool:
+        """True se a chamada pode seguir; False se o circuito está aberto."""
+        with self._lock:
+            if self._estado == FECHADO:
+                return True
+            if self._estado == ABERTO and time.monotonic() >= self._aberto_ate:
+                self._estado = MEIO_ABERTO
+                self._testando = False
+            if self._estado == MEIO_ABERTO and not self._testando:
+                self._testando = True
+                return True
+            self._recusadas += 1
+            return False
+
+    def registrar_sucesso(self) -> None:
+        with self._lock:
+            if self._estado != FECHADO:
+                logger.info("%s: circuito fechado novamente.", self.nome)
+            self._estado = FECHADO
+            self._falhas_seguidas = 0
+            self._testando = False
+
+    def registrar_falha(self) -> None:
+        with self._lock:
+            self._falhas_seguidas += 1
+            if self._estado == MEIO_ABERTO or self._falhas_seguidas >= self._limite_falhas:
+                if self._estado != ABERTO:
+                    self._aberturas += 1
+                    logger.warning("%s: circuito aberto após %d falha(s) seguidas.", self.nome, self._falhas_seguidas)
+                self._estado = ABERTO
+                self._aberto_ate = time.monotonic() + self._pausa_s
+                self._testando = False
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "estado": self._estado,
+                "falhas_seguidas": self._falhas_seguidas,
+                "limite_falhas": self._limite_falhas,
+                "pausa_s": self._pausa_s,
+                "aberturas": self._aberturas,
+                "recusadas": self._recusadas,
+            }
@@ -1,6 +1,5 @@
 from datetime import datetime
 import logging
-import pandas as pd
 
 logger = logging.getLogger(__name__)
 def calcular_agrupamento(data_inicio_str: str, data_fim_str: str) -> str:
@@ -42,18 +41,25 @@ def formatar_resposta_frontend(
     data_antiga: list,
     data_futura: list = None,
     tipo_modelo: dict = None,
-    linha_regressao: list = None
+    linha_regressao: list = None,
+    insight_id: str = None
 ) -> dict:
     """
     Padroniza a resposta JSON para o Front-End conforme estrutura solicitada.
+    Com insight_id (modo assíncrono) a interpretação vem vazia e deve ser
+    consultada em /ai/insight/<insight_id>.
     """
+    ia_metricas = {
+        "interpretacao": insight_ia,
+        "chave_metricas": metricas 
+    }
+    if insight_id:
+        ia_metricas["insight_id"] = insight_id
+        ia_metricas["insight_status"] = "pendente"
     return {
         "analise_tipo": analise_tipo,
         "agrupamento": agrupamento,
-        "iaMetricas": {
-            "interpretacao": insight_ia,
-            "chave_metricas": metricas 
-        },
+        "iaMetricas": ia_metricas,
         "graficoData": {
             "labels_Data": labels,
             "labels_Data_Antiga": labels_antiga if labels_antiga else [],
@@ -66,19 +72,6 @@ def formatar_resposta_frontend(
     }
 
 
-def preparar_dataframe(dados_brutos):
-    """ preparar dads em um data frame para um tratamento melhor de dados"""
-    if not dados_brutos:
-        return None
-    df = pd.DataFrame(dados_brutos, columns=['data', 'valor'])
-    df['data'] = pd.to_datetime(df['data'])
-    df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
-    df = df.sort_values('data')
-    if df['valor'].isnull().any():
-        df['valor'] = df['valor'].interpolate(method='linear').fillna(method='bfill').fillna(method='ffill')
-    return df
-
-
 def formatar_resposta_frontend_ia(
     resposta: str, 
 ) -> dict:
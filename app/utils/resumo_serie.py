@@ -0,0 +1,111 @@
+# app/utils/resumo_serie.py
+
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _rotulo(datas) -> list:
+    # Séries HORA precisam do horário; DIA/MES só da data
+    tem_horario = bool(len(datas)) and bool((datas.astype('datetime64[D]') != datas).any())
+    return np.datetime_as_string(datas, unit='m' if tem_horario else 'D').tolist()
+
+
+def _ponto(rotulos, valores, i) -> dict:
+    return {"data": rotulos[i], "valor": round(float(valores[i]), 2)}
+
+
+def pontos_de_mudanca(valores, maximo: int, tamanho_minimo: int = 3) -> list:
+    """
+    Segmentação binária por mudança de média: a cada passo divide o segmento
+    onde a diferença de médias (ponderada pelos tamanhos) é maior. Para quando
+    a diferença não se destaca do ruído. Retorna os índices de início dos novos
+    trechos, em ordem.
+    """
+    n = len(valores)
+    if maximo <= 0 or n < 2 * tamanho_minimo:
+        return []
+    desvio = float(np.std(valores))
+    if desvio == 0:
+        return []
+    limiar = desvio * np.sqrt(2 * np.log(n))
+
+    segmentos = [(0, n)]
+    pontos = []
+    for _ in range(maximo):
+        melhor = None
+        for inicio, fim in segmentos:
+            m = fim - inicio
+            if m < 2 * tamanho_minimo:
+                continue
+            acumulado = np.cumsum(valores[inicio:fim])
+            k = np.arange(tamanho_minimo, m - tamanho_minimo + 1)
+            media_esq = acumulado[k - 1] / k
+            media_dir = (acumulado[-1] - acumulado[k - 1]) / (m - k)
+            estatistica = np.abs(media_esq - media_dir) * np.sqrt(k * (m - k) / m)
+            i = int(np.argmax(estatistica))
+            if melhor is None or estatistica[i] > melhor[0]:
+                melhor = (estatistica[i], inicio, fim, inicio + int(k[i]))
+        if melhor is None or melhor[0] <= limiar:
+            break
+        _, inicio, fim, corte = melhor
+        segmentos.remove((inicio, fim))
+        segmentos += [(inicio, corte), (corte, fim)]
+        pontos.append(corte)
+    return sorted(pontos)
+
+
+def resumir_serie(datas, valores, top_k: int = 3, max_mudancas: int = 3) -> dict:
+    """
+    Resumo compacto de uma série para o prompt: estatísticas, os top_k maiores
+    e menores pontos e os pontos de mudança (média antes/depois).
+    """
+    n = len(valores)
+    if n == 0:
+        return {"pontos": 0}
+    rotulos = _rotulo(datas)
+    ordem = np.argsort(valores, kind='stable')
+    k = min(top_k, n)
+
+    mudancas = []
+    cortes = pontos_de_mudanca(valores, max_mudancas)
+    limites = [0] + cortes + [n]
+    for j, corte in enumerate(cortes):
+        mudancas.append({
+            "data": rotulos[corte],
+            "media_antes": round(float(valores[limites[j]:corte].mean()), 2),
+            "media_depois": round(float(valores[corte:limites[j + 2]].mean()), 2),
+        })
+
+    return {
+        "pontos": n,
+        "inicio": rotulos[0],
+        "fim": rotulos[-1],
+        "total": round(float(valores.sum()), 2),
+        "media": round(float(valores.mean()), 2),
+        "mediana": round(float(np.median(valores)), 2),
+        "desvio": round(float(valores.std()), 2),
+        "maiores": [_ponto(rotulos, valores, i) for i in ordem[::-1][:k]],
+        "menores": [_ponto(rotulos, valores, i) for i in ordem[:k]],
+        "mudancas": mudancas,
+    }
+
+
+def resumo_serie_json(datas, valores, limite_chars: int, top_k: int = 3, max_mudancas: int = 3) -> str:
+    """
+    JSON do resumo da série dentro de limite_chars: reduz extremos e pontos de
+    mudança até caber; no limite extremo sobram só as estatísticas.
+    """
+    while True:
+        texto = json.dumps(resumir_serie(datas, valores, top_k, max_mudancas), ensure_ascii=False)
+        if len(texto) <= limite_chars or (top_k == 0 and max_mudancas == 0):
+            if len(texto) > limite_chars:
+                logger.debug("Resumo da série (%d caracteres) acima do limite de %d.", len(texto), limite_chars)
+            return texto
+        if top_k >= max_mudancas and top_k > 0:
+            top_k -= 1
+        else:
+            max_mudancas -= 1
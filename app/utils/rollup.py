@@ -0,0 +1,253 @@
+# app/utils/rollup.py
+
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Armazenamento local dos agregados HORA/DIA/MES já fechados de cada série.
+# Sem ROLLUP_DB_PATH o rollup fica desligado e a coleta vai sempre à SP.
+ROLLUP_DB_PATH = os.getenv("ROLLUP_DB_PATH", "")
+ROLLUP_GRANULARIDADES = tuple(
+    g.strip().upper() for g in os.getenv("ROLLUP_GRANULARIDADES", "HORA,DIA,MES").split(",") if g.strip()
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_serie (
+    fkEmpresa INTEGER NOT NULL,
+    fkMaquina TEXT NOT NULL,
+    metrica TEXT NOT NULL,
+    componente TEXT NOT NULL,
+    registrada_em REAL NOT NULL,
+    PRIMARY KEY (fkEmpresa, fkMaquina, metrica, componente)
+);
+CREATE TABLE IF NOT EXISTS rollup_cobertura (
+    fkEmpresa INTEGER NOT NULL,
+    fkMaquina TEXT NOT NULL,
+    metrica TEXT NOT NULL,
+    componente TEXT NOT NULL,
+    granularidade TEXT NOT NULL,
+    inicio INTEGER NOT NULL,
+    fim INTEGER NOT NULL,
+    atualizada_em REAL NOT NULL,
+    PRIMARY KEY (fkEmpresa, fkMaquina, metrica, componente, granularidade)
+);
+CREATE TABLE IF NOT EXISTS rollup_bucket (
+    fkEmpresa INTEGER NOT NULL,
+    fkMaquina TEXT NOT NULL,
+    metrica TEXT NOT NULL,
+    componente TEXT NOT NULL,
+    granularidade TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    valor REAL,
+    PRIMARY KEY (fkEmpresa, fkMaquina, metrica, componente, granularidade, bucket)
+);
+"""
+
+_schema_criado = False
+_schema_lock = threading.Lock()
+_metricas = {"leituras": 0, "acertos": 0, "buckets_lidos": 0, "buckets_gravados": 0}
+_metricas_lock = threading.Lock()
+
+
+def rollup_habilitado(granularidade: str = None) -> bool:
+    """True se o rollup está configurado (e mantém a granularidade, quando informada)."""
+    if not ROLLUP_DB_PATH:
+        return False
+    return granularidade is None or granularidade in ROLLUP_GRANULARIDADES
+
+
+@contextmanager
+def _conectar():
+    global _schema_criado
+    conn = sqlite3.connect(ROLLUP_DB_PATH, timeout=30)
+    try:
+        if not _schema_criado:
+            with _schema_lock:
+                if not _schema_criado:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                    _schema_criado = True
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _chave(fkEmpresa, fkMaquina, metrica, componente) -> tuple:
+    # NULL não funciona em chave primária no SQLite; "" representa "todas".
+    return (
+        int(fkEmpresa),
+        "" if fkMaquina is None else str(fkMaquina),
+        metrica,
+        componente or "",
+    )
+
+
+def _somar(**valores):
+    with _metricas_lock:
+        for nome, valor in valores.items():
+            _metricas[nome] += valor
+
+
+def registrar_serie(fkEmpresa, fkMaquina, metrica, componente) -> None:
+    """Marca a série para ser mantida pelo job de rollup."""
+    with _conectar() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO rollup_serie VALUES (?, ?, ?, ?, ?)",
+            _chave(fkEmpresa, fkMaquina, metrica, componente) + (time.time(),),
+        )
+
+
+def listar_series() -> list:
+    """Séries registradas: lista de (fkEmpresa, fkMaquina, metrica, componente)."""
+    with _conectar() as conn:
+        linhas = conn.execute(
+            "SELECT fkEmpresa, fkMaquina, metrica, componente FROM rollup_serie"
+        ).fetchall()
+    return [
+        (emp, None if maq == "" else int(maq), metrica, comp or None)
+        for emp, maq, metrica, comp in linhas
+    ]
+
+
+def obter_cobertura(fkEmpresa, fkMaquina, metrica, componente, granularidade: str):
+    """Retorna (inicio, fim) cobertos como datetime64[s] — fim exclusivo — ou None."""
+    with _conectar() as conn:
+        linha = conn.execute(
+            "SELECT inicio, fim FROM rollup_cobertura WHERE fkEmpresa=? AND fkMaquina=? "
+            "AND metrica=? AND componente=? AND granularidade=?",
+            _chave(fkEmpresa, fkMaquina, metrica, componente) + (granularidade,),
+        ).fetchone()
+    if linha is None:
+        return None
+    return np.datetime64(linha[0], 's'), np.datetime64(linha[1], 's')
+
+
+def ler_rollup(fkEmpresa, fkMaquina, metrica, componente, granularidade: str, inicio, fim=None):
+    """
+    Lê os buckets fechados da série com início em [inicio, fim] (fim inclusivo;
+    None = até o fim da cobertura).
+
+    Retorna (inicio_cobertura, fim_cobertura, datas, valores) ou None se o rollup
+    não cobrir `inicio`.
+    """
+    _somar(leituras=1)
+    cobertura = obter_cobertura(fkEmpresa, fkMaquina, metrica, componente, granularidade)
+    if cobertura is None:
+        return None
+    inicio_cobertura, fim_cobertura = cobertura
+    inicio = np.datetime64(inicio, 's')
+    if inicio < inicio_cobertura or inicio >= fim_cobertura:
+        return None
+    limite = fim_cobertura if fim is None else min(fim_cobertura, np.datetime64(fim, 's') + np.timedelta64(1, 's'))
+
+    with _conectar() as conn:
+        linhas = conn.execute(
+            "SELECT bucket, valor FROM rollup_bucket WHERE fkEmpresa=? AND fkMaquina=? AND metrica=? "
+            "AND componente=? AND granularidade=? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            _chave(fkEmpresa, fkMaquina, metrica, componente)
+            + (granularidade, int(inicio.astype('int64')), int(limite.astype('int64'))),
+        ).fetchall()
+
+    if linhas:
+        buckets, valores = zip(*linhas)
+        datas = np.array(buckets, dtype=np.int64).astype('datetime64[s]')
+        valores = np.array(valores, dtype=np.float64)
+    else:
+        datas, valores = np.empty(0, dtype='datetime64[s]'), np.empty(0, dtype=np.float64)
+    _somar(acertos=1, buckets_lidos=len(datas))
+    return inicio_cobertura, fim_cobertura, datas, valores
+
+
+def gravar_rollup(fkEmpresa, fkMaquina, metrica, componente, granularidade: str,
+                  datas, valores, inicio_cobertura, fim_cobertura) -> None:
+    """
+    Grava (upsert) buckets fechados e atualiza a cobertura da série para
+    [inicio_cobertura, fim_cobertura). Buckets a partir de fim_cobertura são ignorados.
+    """
+    chave = _chave(fkEmpresa, fkMaquina, metrica, componente)
+    fechados = datas < fim_cobertura
+    buckets = datas[fechados].astype('int64').tolist()
+    valores_fechados = [None if np.isnan(v) else v for v in valores[fechados].tolist()]
+
+    with _conectar() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO rollup_bucket VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [chave + (granularidade, b, v) for b, v in zip(buckets, valores_fechados)],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO rollup_cobertura VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            chave + (
+                granularidade,
+                int(np.datetime64(inicio_cobertura, 's').astype('int64')),
+                int(np.datetime64(fim_cobertura, 's').astype('int64')),
+                time.time(),
+            ),
+        )
+    _somar(buckets_gravados=len(buckets))
+
+
+def truncar_rollup(data_inicio, data_fim, fkEmpresa=None, fkMaquina=None) -> int:
+    """
+    Invalida o trecho [data_inicio, data_fim] do rollup: as coberturas que o
+    alcançam voltam para o início do bucket que contém data_inicio (os buckets
+    dali em diante são apagados e o job os regrava). Retorna a quantidade de
+    coberturas afetadas.
+    """
+    unidades = {"HORA": "h", "DIA": "D", "MES": "M"}
+    inicio = np.datetime64(data_inicio, 's')
+    fim = int(np.datetime64(data_fim, 's').astype('int64'))
+    filtros, valores = "", []
+    if fkEmpresa is not None:
+        filtros += " AND fkEmpresa = ?"
+        valores.append(int(fkEmpresa))
+    if fkMaquina is not None:
+        filtros += " AND fkMaquina = ?"
+        valores.append(str(fkMaquina))
+
+    with _conectar() as conn:
+        coberturas = conn.execute(
+            "SELECT fkEmpresa, fkMaquina, metrica, componente, granularidade, inicio FROM rollup_cobertura "
+            "WHERE fim > ? AND inicio <= ?" + filtros,
+            [int(inicio.astype('int64')), fim] + valores,
+        ).fetchall()
+
+        for *chave, granularidade, inicio_cobertura in coberturas:
+            unidade = unidades.get(granularidade, "D")
+            corte = int(inicio.astype(f'datetime64[{unidade}]').astype('datetime64[s]').astype('int64'))
+            conn.execute(
+                "DELETE FROM rollup_bucket WHERE fkEmpresa=? AND fkMaquina=? AND metrica=? "
+                "AND componente=? AND granularidade=? AND bucket >= ?",
+                chave + [granularidade, corte],
+            )
+            if corte <= inicio_cobertura:
+                conn.execute(
+                    "DELETE FROM rollup_cobertura WHERE fkEmpresa=? AND fkMaquina=? AND metrica=? "
+                    "AND componente=? AND granularidade=?",
+                    chave + [granularidade],
+                )
+            else:
+                conn.execute(
+                    "UPDATE rollup_cobertura SET fim=?, atualizada_em=? WHERE fkEmpresa=? AND fkMaquina=? "
+                    "AND metrica=? AND componente=? AND granularidade=?",
+                    [corte, time.time()] + chave + [granularidade],
+                )
+    return len(coberturas)
+
+
+def obter_metricas_rollup() -> dict:
+    with _metricas_lock:
+        dados = dict(_metricas)
+    dados["habilitado"] = rollup_habilitado()
+    dados["granularidades"] = list(ROLLUP_GRANULARIDADES)
+    return dados
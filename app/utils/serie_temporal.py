@@ -0,0 +1,180 @@
+# app/utils/serie_temporal.py
+
+import json
+import re
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_UNIDADE_AGRUPAMENTO = {"HORA": 'h', "DIA": 'D', "MES": 'M'}
+# Posição de cada código do strftime na string ISO 'AAAA-MM-DDTHH:MM'
+_CAMPOS_ISO = {"%Y": (0, 4), "%m": (5, 7), "%d": (8, 10), "%H": (11, 13), "%M": (14, 16)}
+_RE_CODIGO = re.compile(r"%.")
+
+
+class SerieTemporal:
+    """
+    Série temporal colunar: datas datetime64[s] (ordenadas) e valores float64,
+    com NaN onde o banco devolveu nulo. Substitui os DataFrames montados a cada
+    requisição; as operações são vetorizadas e não copiam os arrays quando não
+    precisam. Desempacota como a tupla (datas, valores) do fetch colunar.
+    """
+
+    __slots__ = ("datas", "valores")
+
+    def __init__(self, datas, valores):
+        # asarray não copia arrays já no tipo certo (ex.: os somente leitura do cache)
+        self.datas = np.asarray(datas, dtype='datetime64[s]')
+        self.valores = np.asarray(valores, dtype=np.float64)
+
+    @classmethod
+    def vazia(cls) -> "SerieTemporal":
+        return cls(np.empty(0, dtype='datetime64[s]'), np.empty(0, dtype=np.float64))
+
+    @classmethod
+    def de_registros(cls, registros) -> "SerieTemporal":
+        """A partir das tuplas (data, valor) da SP; valores não numéricos viram NaN."""
+        if not registros:
+            return cls.vazia()
+        datas, valores = zip(*registros)
+        try:
+            valores = np.array(valores, dtype=np.float64)
+        except (TypeError, ValueError):
+            valores = pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=np.float64)
+        return cls(np.array(datas, dtype='datetime64[s]'), valores).ordenada()
+
+    def __len__(self) -> int:
+        return len(self.datas)
+
+    def __iter__(self):
+        return iter((self.datas, self.valores))
+
+    def __repr__(self) -> str:
+        if not len(self):
+            return "SerieTemporal(vazia)"
+        return f"SerieTemporal({len(self)} pontos, {self.datas[0]} a {self.datas[-1]})"
+
+    def ordenada(self) -> "SerieTemporal":
+        if len(self) < 2 or np.all(self.datas[:-1] <= self.datas[1:]):
+            return self
+        ordem = np.argsort(self.datas, kind='stable')
+        return SerieTemporal(self.datas[ordem], self.valores[ordem])
+
+    def preencher_nulos(self, modo: str = "interpolar") -> "SerieTemporal":
+        """
+        Preenche os NaN: "interpolar" (linear por posição; as pontas repetem o
+        valor válido mais próximo) ou "zero". Sem nulos devolve a própria série.
+        """
+        nulos = np.isnan(self.valores)
+        if not nulos.any():
+            return self
+        if modo == "zero":
+            return SerieTemporal(self.datas, np.where(nulos, 0.0, self.valores))
+        if nulos.all():
+            return self
+        validos = np.flatnonzero(~nulos)
+        valores = self.valores.copy()
+        valores[nulos] = np.interp(np.flatnonzero(nulos), validos, valores[validos])
+        return SerieTemporal(self.datas, valores)
+
+    def recortar(self, data_inicio, data_fim, incluir_fim: bool = True) -> "SerieTemporal":
+        """
+        Fatia (sem cópia) os pontos com data entre data_inicio e data_fim
+        (inclusive; com incluir_fim=False o limite superior fica de fora).
+        """
+        ini = np.searchsorted(self.datas, np.datetime64(data_inicio, 's'), side='left')
+        fim = np.searchsorted(self.datas, np.datetime64(data_fim, 's'), side='right' if incluir_fim else 'left')
+        return SerieTemporal(self.datas[ini:fim], self.valores[ini:fim])
+
+    @staticmethod
+    def concatenar(series: list) -> "SerieTemporal":
+        """Junta séries de trechos consecutivos (na ordem dada) numa só."""
+        series = [serie for serie in series if len(serie)]
+        if not series:
+            return SerieTemporal.vazia()
+        if len(series) == 1:
+            return series[0]
+        return SerieTemporal(
+            np.concatenate([serie.datas for serie in series]),
+            np.concatenate([serie.valores for serie in series]),
+        )
+
+    @staticmethod
+    def alinhar(series: list) -> list:
+        """Séries restritas à interseção ordenada das datas (todas com o mesmo array de datas)."""
+        if not series:
+            return []
+        datas_comuns = series[0].datas
+        for serie in series[1:]:
+            datas_comuns = np.intersect1d(datas_comuns, serie.datas, assume_unique=True)
+        return [
+            SerieTemporal(datas_comuns, serie.valores[np.searchsorted(serie.datas, datas_comuns)])
+            for serie in series
+        ]
+
+    @staticmethod
+    def grade_regular(inicio, fim, agrupar_por: str):
+        """Buckets consecutivos (datetime64[s]) de inicio a fim, inclusive, no passo do agrupamento."""
+        unidade = _UNIDADE_AGRUPAMENTO[agrupar_por]
+        inicio = np.datetime64(inicio, unidade)
+        fim = np.datetime64(fim, unidade)
+        return np.arange(inicio, fim + 1).astype('datetime64[s]')
+
+    @staticmethod
+    def em_grade(series: list, agrupar_por: str) -> list:
+        """
+        Séries levadas para a mesma grade regular (trecho comum a todas), com
+        buckets ausentes ou nulos interpolados linearmente no tempo. Sem trecho
+        comum devolve séries vazias.
+        """
+        series = [SerieTemporal(s.datas[~np.isnan(s.valores)], s.valores[~np.isnan(s.valores)]) for s in series]
+        if not series or any(len(s) == 0 for s in series):
+            return [SerieTemporal.vazia() for _ in series]
+        inicio = max(s.datas[0] for s in series)
+        fim = min(s.datas[-1] for s in series)
+        if inicio > fim:
+            return [SerieTemporal.vazia() for _ in series]
+
+        grade = SerieTemporal.grade_regular(inicio, fim, agrupar_por)
+        eixo = grade.astype(np.int64)
+        return [SerieTemporal(grade, np.interp(eixo, s.datas.astype(np.int64), s.valores)) for s in series]
+
+    def rotulos(self, formato: str = '%d/%m') -> list:
+        """
+        Rótulos dos gráficos. Formatos só com %Y, %m, %d, %H e %M são montados
+        vetorialmente a partir da string ISO; os demais passam pelo strftime do pandas.
+        """
+        n = len(self)
+        if n == 0:
+            return []
+        partes = _RE_CODIGO.split(formato)
+        codigos = _RE_CODIGO.findall(formato)
+        if any(codigo not in _CAMPOS_ISO for codigo in codigos):
+            return pd.DatetimeIndex(self.datas).strftime(formato).tolist()
+
+        caracteres = np.datetime_as_string(self.datas, unit='m').astype('U16').view('U1').reshape(n, 16)
+        colunas = []
+        for literal, codigo in zip(partes, codigos + [None]):
+            colunas += [np.full((n, 1), c, dtype='U1') for c in literal]
+            if codigo:
+                ini, fim = _CAMPOS_ISO[codigo]
+                colunas.append(caracteres[:, ini:fim])
+        rotulos = np.ascontiguousarray(np.hstack(colunas))
+        return rotulos.view(f'U{rotulos.shape[1]}').ravel().tolist()
+
+    def valores_lista(self) -> list:
+        """Valores como lista de float para o JSON da resposta (NaN vira None/null)."""
+        lista = self.valores.tolist()
+        if np.isnan(self.valores).any():
+            return [None if v != v else v for v in lista]
+        return lista
+
+    def para_json(self) -> str:
+        """Lista de registros {data, valor} em JSON (datas ISO)."""
+        if len(self) == 0:
+            return "[]"
+        datas_iso = np.datetime_as_string(self.datas, unit='s').tolist()
+        return json.dumps([{"data": d, "valor": v} for d, v in zip(datas_iso, self.valores_lista())])
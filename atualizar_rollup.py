@@ -0,0 +1,57 @@
+# Job de manutenção do rollup (agregados HORA/DIA/MES das séries)
+#
+# Exemplos:
+#   python atualizar_rollup.py --desde 2025-01-01
+#   python atualizar_rollup.py --desde 2025-01-01 --serie 2,-,"Total de Alertas" --intervalo 300
+
+from app.services.coleta_dados_service import atualizar_rollups
+from app.utils.rollup import registrar_serie
+from logging_config import setup_logging
+import argparse
+import logging
+import time
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def interpretar_serie(texto: str) -> tuple:
+    """Converte 'empresa,maquina,metrica[,componente]' (maquina '-' = todas) em tupla."""
+    partes = [p.strip() for p in texto.split(",")]
+    if len(partes) not in (3, 4):
+        raise argparse.ArgumentTypeError("Use empresa,maquina,metrica[,componente].")
+    fk_empresa = int(partes[0])
+    fk_maquina = None if partes[1] in ("", "-") else int(partes[1])
+    componente = partes[3] if len(partes) == 4 and partes[3] else None
+    return fk_empresa, fk_maquina, partes[2], componente
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualiza o rollup de séries a partir da sp_coleta_dados_brutos.")
+    parser.add_argument("--desde", required=True, help="Início da cobertura para séries novas (AAAA-MM-DD).")
+    parser.add_argument("--granularidades", nargs="+", choices=["HORA", "DIA", "MES"], default=None)
+    parser.add_argument("--serie", action="append", type=interpretar_serie, default=[],
+                        help="Registra uma série: empresa,maquina,metrica[,componente]. Pode repetir.")
+    parser.add_argument("--intervalo", type=int, default=0,
+                        help="Segundos entre execuções (0 = executa uma vez).")
+    args = parser.parse_args()
+
+    for serie in args.serie:
+        registrar_serie(*serie)
+
+    while True:
+        inicio = time.perf_counter()
+        try:
+            resumo = atualizar_rollups(args.desde, args.granularidades)
+            logger.info("Rollup concluído em %.2fs: %s", time.perf_counter() - inicio, resumo)
+        except RuntimeError as e:
+            logger.error("Falha ao atualizar o rollup: %s", e)
+            if not args.intervalo:
+                raise SystemExit(1)
+        if not args.intervalo:
+            break
+        time.sleep(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
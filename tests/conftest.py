@@ -0,0 +1,74 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Camadas opcionais desligadas e sem chamadas à IA antes de importar os serviços
+os.environ.setdefault("CACHE_DISCO_DIR", "")
+os.environ.setdefault("ROLLUP_DB_PATH", "")
+os.environ.setdefault("INSIGHT_IA_ATIVO", "0")
+os.environ.setdefault("PRECALCULO_ATIVO", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from app.services import coleta_dados_service
+from app.utils import acumuladores
+
+_UNIDADE = {"HORA": "h", "DIA": "D", "MES": "M"}
+
+
+class SPSimulada:
+    """
+    Imita a sp_coleta_dados_brutos sobre amostras brutas em memória: filtra
+    data_hora entre p_data_inicio e p_data_fim (inclusive) e soma por bucket.
+    `agora` faz o papel do NOW() das coletas históricas.
+    """
+
+    def __init__(self, datas, valores, agora):
+        self.datas = np.asarray(datas, dtype='datetime64[s]')
+        self.valores = np.asarray(valores, dtype=np.float64)
+        self.agora = np.datetime64(agora, 's')
+        self.chamadas = []
+
+    def executar(self, config):
+        params = config["params"]
+        if len(params) == 7:
+            inicio, fim, _, _, agrupar_por, _, _ = params
+        else:
+            (inicio, _, _, agrupar_por, _, _), fim = params, self.agora
+        inicio = np.datetime64(str(inicio).replace(" ", "T"), 's')
+        fim = np.datetime64(str(fim).replace(" ", "T"), 's')
+        self.chamadas.append((inicio, fim, agrupar_por))
+
+        na_janela = (self.datas >= inicio) & (self.datas <= fim)
+        buckets = self.datas[na_janela].astype(f'datetime64[{_UNIDADE[agrupar_por]}]').astype('datetime64[s]')
+        datas, indices = np.unique(buckets, return_inverse=True)
+        valores = np.bincount(indices, weights=self.valores[na_janela], minlength=len(datas))
+        return datas, valores.astype(np.float64)
+
+    def consultas_colunares(self, configs):
+        return [self.executar(config) for config in configs]
+
+
+@pytest.fixture(autouse=True)
+def caches_limpos():
+    """Cada teste começa com os caches de séries e acumuladores vazios."""
+    coleta_dados_service.invalidar_cache_series()
+    acumuladores.invalidar_acumuladores()
+    yield
+    coleta_dados_service.invalidar_cache_series()
+    acumuladores.invalidar_acumuladores()
+
+
+@pytest.fixture
+def sp_simulada(monkeypatch):
+    """Fábrica de SPSimulada já instalada no lugar do fetch colunar do banco."""
+    def fabricar(datas, valores, agora="2025-04-01T12:00:00"):
+        sp = SPSimulada(datas, valores, agora)
+        monkeypatch.setattr(coleta_dados_service, "fazer_consultas_colunares", sp.consultas_colunares)
+        monkeypatch.setattr(coleta_dados_service, "agora_local", lambda: sp.agora)
+        return sp
+    return fabricar
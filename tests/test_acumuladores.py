@@ -0,0 +1,102 @@
+# tests/test_acumuladores.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.analise_correlacao import calcular_pearson, calcular_regressao_linear
+from app.utils.acumuladores import (
+    AcumuladorPar, AcumuladorSerie, acumular_incremental, invalidar_acumuladores, obter_metricas_acumuladores
+)
+
+
+@pytest.fixture
+def serie():
+    rng = np.random.default_rng(3)
+    datas = np.arange(np.datetime64("2025-03-01", "D"), np.datetime64("2025-03-31", "D")).astype("datetime64[s]")
+    x = rng.normal(50, 10, len(datas))
+    y = 2.5 * x + rng.normal(0, 5, len(datas))
+    return datas, x, y
+
+
+def test_mesclar_trechos_bate_com_o_calculo_direto(serie):
+    _, x, y = serie
+    direto = AcumuladorPar.de_valores(x, y)
+    mesclado = AcumuladorPar.de_valores(x[:7], y[:7]).mesclar(AcumuladorPar.de_valores(x[7:], y[7:]))
+
+    assert mesclado.pearson() == pytest.approx(np.corrcoef(x, y)[0, 1])
+    np.testing.assert_allclose(mesclado.regressao(), np.polyfit(x, y, 1))
+    np.testing.assert_allclose(mesclado.regressao(), direto.regressao())
+
+    serie_mesclada = AcumuladorSerie.de_valores(y[:11]).mesclar(AcumuladorSerie.de_valores(y[11:]))
+    assert serie_mesclada.soma == pytest.approx(y.sum())
+    assert serie_mesclada.variancia == pytest.approx(y.var())
+
+
+def test_incremental_soma_so_os_buckets_novos(serie):
+    datas, x, y = serie
+    chave = ("par", 1)
+    acumular_incremental(chave, datas[:20], (x[:20], y[:20]), AcumuladorPar, datas[18])
+    antes = obter_metricas_acumuladores()
+
+    resultado = acumular_incremental(chave, datas, (x, y), AcumuladorPar, datas[28])
+    depois = obter_metricas_acumuladores()
+
+    assert depois["reaproveitados"] == antes["reaproveitados"] + 1
+    assert depois["pontos_reaproveitados"] - antes["pontos_reaproveitados"] == 18
+    assert resultado.pearson() == pytest.approx(np.corrcoef(x, y)[0, 1])
+
+
+def test_cauda_corrigida_forca_recalculo(serie):
+    datas, x, y = serie
+    chave = ("par", 2)
+    acumular_incremental(chave, datas, (x, y), AcumuladorPar, datas[25])
+    antes = obter_metricas_acumuladores()
+
+    # Mesmas datas, valor de um bucket recente refeito: a última data não basta para detectar
+    y_corrigido = y.copy()
+    y_corrigido[22] += 100.0
+    resultado = acumular_incremental(chave, datas, (x, y_corrigido), AcumuladorPar, datas[25])
+    depois = obter_metricas_acumuladores()
+
+    assert depois["recalculados"] == antes["recalculados"] + 1
+    assert resultado.pearson() == pytest.approx(np.corrcoef(x, y_corrigido)[0, 1])
+
+
+def test_janela_com_outro_inicio_nao_reaproveita(serie):
+    datas, x, y = serie
+    chave = ("par", 3)
+    acumular_incremental(chave, datas, (x, y), AcumuladorPar, datas[25])
+    antes = obter_metricas_acumuladores()
+
+    resultado = acumular_incremental(chave, datas[1:], (x[1:], y[1:]), AcumuladorPar, datas[25])
+
+    assert obter_metricas_acumuladores()["recalculados"] == antes["recalculados"] + 1
+    assert resultado.n == len(datas) - 1
+
+
+def test_correcao_antiga_chega_pela_invalidacao(serie):
+    datas, x, y = serie
+    chave = ("par", 4)
+    acumular_incremental(chave, datas, (x, y), AcumuladorPar, datas[25])
+
+    y_corrigido = y.copy()
+    y_corrigido[3] += 100.0
+    invalidar_acumuladores(lambda c: c == chave)
+    resultado = acumular_incremental(chave, datas, (x, y_corrigido), AcumuladorPar, datas[25])
+
+    assert resultado.pearson() == pytest.approx(np.corrcoef(x, y_corrigido)[0, 1])
+
+
+def test_assinaturas_com_dataframe_continuam_valendo(serie):
+    _, x, y = serie
+    df = pd.DataFrame({"valor_a": y, "valor_b": x})
+    acumulador = AcumuladorPar.de_valores(x, y)
+
+    assert calcular_pearson(df) == pytest.approx(df["valor_a"].corr(df["valor_b"]))
+    assert calcular_pearson(df) == calcular_pearson(acumulador)
+    b1, b0, linha = calcular_regressao_linear(df)
+    np.testing.assert_allclose((b1, b0), np.polyfit(x, y, 1))
+    assert linha == calcular_regressao_linear(acumulador)[2]
+    assert calcular_pearson(df.iloc[:1]) == 0
+    assert calcular_regressao_linear(df.iloc[:1]) == (None, None, None)
@@ -0,0 +1,69 @@
+# tests/test_ajuste_forma_fechada.py
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import PolynomialFeatures
+
+from app.services.analise_previsao import FeaturesPrevisao, treinar_polinomial, treinar_regressao_linear
+from app.utils.serie_temporal import SerieTemporal
+
+
+def _serie(n=60, semente=11):
+    rng = np.random.default_rng(semente)
+    datas = np.arange(np.datetime64("2025-01-01"), np.datetime64("2025-01-01") + n).astype('datetime64[s]')
+    x = np.arange(n)
+    return SerieTemporal(datas, 30 + 0.8 * x - 0.01 * x ** 2 + rng.normal(0, 3, n))
+
+
+def _referencia_sklearn(serie, modelo, passos=5, centrar=False):
+    """
+    Ajuste de referência do sklearn. Com centrar=True o eixo é o ordinal menos a
+    média: com ordinais brutos (~7e5) elevados ao quadrado o sklearn perde
+    precisão e não chega ao mínimo de mínimos quadrados.
+    """
+    features = FeaturesPrevisao(serie, passos)
+    centro = features.centro if centrar else 0.0
+    modelo.fit(features.X - centro, features.y)
+    y_pred = modelo.predict(features.X - centro)
+    return (
+        r2_score(features.y, y_pred),
+        np.sqrt(mean_squared_error(features.y, y_pred)),
+        modelo.predict(features.X_futuro - centro),
+    )
+
+
+def test_linear_em_forma_fechada_bate_com_o_sklearn():
+    serie = _serie()
+    resultado = treinar_regressao_linear(serie, 5)
+    modelo = LinearRegression()
+    r2, rmse, futuro = _referencia_sklearn(serie, modelo)
+    assert resultado["r2"] == pytest.approx(r2, abs=1e-9)
+    assert resultado["rmse"] == pytest.approx(rmse, rel=1e-9)
+    assert resultado["projecao"] == [float(round(v, 2)) for v in futuro]
+    assert f"{modelo.coef_[0]:.2f}x" in resultado["equacao"]
+
+
+@pytest.mark.parametrize("grau", [2, 3])
+def test_polinomial_em_forma_fechada_bate_com_o_sklearn(grau):
+    serie = _serie()
+    resultado = treinar_polinomial(serie, 5, grau=grau)
+    r2, rmse, futuro = _referencia_sklearn(
+        serie, make_pipeline(PolynomialFeatures(grau), LinearRegression()), centrar=True
+    )
+    assert resultado["r2"] == pytest.approx(r2, abs=1e-6)
+    assert resultado["rmse"] == pytest.approx(rmse, rel=1e-6)
+    np.testing.assert_allclose(resultado["projecao"], futuro, atol=0.011)
+
+
+def test_poucas_datas_distintas_usam_o_sklearn():
+    # Vários buckets HORA no mesmo dia viram um único ordinal: o caso degenerado fica com o sklearn
+    datas = np.array(["2025-01-01T00", "2025-01-01T01", "2025-01-01T02", "2025-01-02T00", "2025-01-02T01"],
+                     dtype='datetime64[s]')
+    serie = SerieTemporal(datas, [1.0, 2.0, 3.0, 4.0, 5.0])
+    assert FeaturesPrevisao(serie, 5).distintos == 2
+    resultado = treinar_polinomial(serie, 5, grau=2)
+    _, rmse, _ = _referencia_sklearn(serie, make_pipeline(PolynomialFeatures(2), LinearRegression()))
+    assert resultado["rmse"] == pytest.approx(rmse, rel=1e-9)
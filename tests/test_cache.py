@@ -0,0 +1,88 @@
+# tests/test_cache.py
+
+import time
+
+import numpy as np
+import pytest
+
+from app.models.dataModel import AnaliseRequest
+from app.services.coleta_dados_service import coletar_dados_por_intervalo, invalidar_cache_series
+from app.utils.cache import CacheTTL, estimar_tamanho_bytes
+
+
+def test_entrada_expira_apos_o_ttl():
+    cache = CacheTTL(1024)
+    cache.guardar("a", 1, ttl_s=0.05)
+    assert cache.obter("a") == 1
+    time.sleep(0.06)
+    assert cache.obter("a") is None
+    assert cache.metricas()["expirados"] == 1
+
+
+def test_despejo_lru_pelo_limite_de_bytes():
+    cache = CacheTTL(300)
+    for chave in "abc":
+        cache.guardar(chave, chave, 60, tamanho_bytes=100)
+    cache.obter("a")
+    cache.guardar("d", "d", 60, tamanho_bytes=100)
+    assert cache.obter("b") is None
+    assert cache.obter("a") == "a"
+    assert cache.metricas()["despejos"] == 1
+    assert cache.metricas()["bytes"] == 300
+
+
+def test_entrada_maior_que_o_limite_nao_e_guardada():
+    cache = CacheTTL(100)
+    cache.guardar("grande", np.zeros(100), 60)
+    assert cache.obter("grande") is None
+    assert cache.metricas()["entradas"] == 0
+
+
+def test_invalidar_por_predicado():
+    cache = CacheTTL(1024)
+    for chave in [(1, 1), (1, 2), (2, 1)]:
+        cache.guardar(chave, "x", 60, tamanho_bytes=10)
+    assert cache.invalidar(lambda chave: chave[0] == 1) == 2
+    assert cache.metricas()["entradas"] == 1
+    assert cache.metricas()["bytes"] == 10
+
+
+def test_tamanho_de_arrays_conta_nbytes():
+    datas = np.zeros(10, dtype='datetime64[s]')
+    valores = np.zeros(10)
+    assert estimar_tamanho_bytes((datas, valores)) >= datas.nbytes + valores.nbytes
+
+
+def _req(fkMaquina=1):
+    return AnaliseRequest(tipoAnalise="comparacao", dataIncio="2025-03-01", metricaAnalisar="Uso de RAM",
+                          fkEmpresa=1, fkMaquina=fkMaquina)
+
+
+@pytest.fixture
+def sp(sp_simulada):
+    datas = np.arange(np.datetime64("2025-03-01", 'h'), np.datetime64("2025-03-10", 'h')).astype('datetime64[s]')
+    return sp_simulada(datas, np.arange(len(datas), dtype=np.float64))
+
+
+def test_serie_repetida_sai_do_cache(sp):
+    primeira = coletar_dados_por_intervalo(_req(), "2025-03-01", "2025-03-05", "DIA", colunar=True)
+    segunda = coletar_dados_por_intervalo(_req(), "2025-03-01", "2025-03-05", "DIA", colunar=True)
+    assert len(sp.chamadas) == 1
+    np.testing.assert_array_equal(primeira.valores, segunda.valores)
+    assert not segunda.valores.flags.writeable
+
+
+def test_parametros_diferentes_sao_chaves_diferentes(sp):
+    coletar_dados_por_intervalo(_req(), "2025-03-01", "2025-03-05", "DIA", colunar=True)
+    coletar_dados_por_intervalo(_req(), "2025-03-01", "2025-03-05", "HORA", colunar=True)
+    coletar_dados_por_intervalo(_req(fkMaquina=2), "2025-03-01", "2025-03-05", "DIA", colunar=True)
+    assert len(sp.chamadas) == 3
+
+
+def test_invalidar_a_maquina_forca_nova_consulta(sp):
+    coletar_dados_por_intervalo(_req(1), "2025-03-01", "2025-03-05", "DIA", colunar=True)
+    coletar_dados_por_intervalo(_req(2), "2025-03-01", "2025-03-05", "DIA", colunar=True)
+    assert invalidar_cache_series(fkMaquina=1) == 1
+    coletar_dados_por_intervalo(_req(1), "2025-03-01", "2025-03-05", "DIA", colunar=True)
+    coletar_dados_por_intervalo(_req(2), "2025-03-01", "2025-03-05", "DIA", colunar=True)
+    assert len(sp.chamadas) == 3
@@ -0,0 +1,141 @@
+# tests/test_cache_disco.py
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from app.models.dataModel import AnaliseRequest
+from app.services import coleta_dados_service
+from app.services.coleta_dados_service import coletar_dados_historicos
+from app.utils import cache_disco
+from app.utils.cache_disco import gravar_serie_disco, invalidar_intervalo_disco, ler_serie_disco
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _chave(agrupar_por):
+    return ("Uso de RAM", "2025-03-01", 1, 1, agrupar_por)
+
+
+@pytest.fixture
+def disco(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_disco, "CACHE_DISCO_DIR", str(tmp_path))
+    monkeypatch.setattr(cache_disco, "CACHE_DISCO_ASSENTAMENTO_S", 3600.0)
+    relogio = {"agora": np.datetime64("2025-03-10T12:00:00", "s")}
+    monkeypatch.setattr(cache_disco, "_agora_local", lambda: relogio["agora"])
+    return relogio
+
+
+def _gravar_horas(inicio="2025-03-09T00:00:00", fim="2025-03-10T12:00:00"):
+    datas = np.arange(np.datetime64(inicio, "h"), np.datetime64(fim, "h")).astype("datetime64[s]")
+    valores = np.arange(len(datas), dtype=np.float64)
+    gravar_serie_disco(_chave("HORA"), datas[0], np.datetime64(fim, "s"), datas, valores)
+    return datas, valores
+
+
+def test_buckets_assentados_voltam_iguais_do_disco(disco, monkeypatch):
+    monkeypatch.setattr(cache_disco, "CACHE_DISCO_ASSENTAMENTO_S", 0.0)
+    datas, valores = _gravar_horas()
+
+    inicio, fim, lidas, lidos = ler_serie_disco(_chave("HORA"))
+    assert (inicio, fim) == (datas[0], np.datetime64("2025-03-10T12:00:00", "s"))
+    np.testing.assert_array_equal(lidas, datas)
+    np.testing.assert_array_equal(lidos, valores)
+
+
+def test_buckets_recentes_na_gravacao_ficam_de_fora(disco):
+    datas, _ = _gravar_horas()
+
+    # Gravado às 12h com janela de 1h: o bucket das 11h ainda pode receber linhas atrasadas
+    _, fim, lidas, _ = ler_serie_disco(_chave("HORA"))
+    assert fim == np.datetime64("2025-03-10T11:00:00", "s")
+    np.testing.assert_array_equal(lidas, datas[datas < fim])
+    assert cache_disco.obter_metricas_cache_disco()["buckets_reabertos"] >= 1
+
+
+def test_cobertura_toda_recente_e_tratada_como_ausente(disco):
+    datas = np.array(["2025-03-09T00:00:00"], dtype="datetime64[s]")
+    # O único dia fechou meia hora antes da gravação
+    disco["agora"] = np.datetime64("2025-03-10T00:30:00", "s")
+    gravar_serie_disco(_chave("DIA"), datas[0], np.datetime64("2025-03-10T00:00:00", "s"), datas, [5.0])
+
+    assert ler_serie_disco(_chave("DIA")) is None
+
+
+def test_invalidacao_trunca_e_preserva_o_horario_da_gravacao(disco, monkeypatch):
+    monkeypatch.setattr(cache_disco, "CACHE_DISCO_ASSENTAMENTO_S", 0.0)
+    datas, _ = _gravar_horas()
+
+    assert invalidar_intervalo_disco("2025-03-10T05:30:00", "2025-03-10T06:00:00") == 1
+    _, fim, lidas, _ = ler_serie_disco(_chave("HORA"))
+    assert fim == np.datetime64("2025-03-10T05:00:00", "s")
+    assert lidas[-1] == np.datetime64("2025-03-10T04:00:00", "s")
+
+    entrada = cache_disco._ler_metadados(cache_disco._id_chave(_chave("HORA")))
+    assert entrada["gravado_em"] == "2025-03-10T12:00:00"
+
+
+def test_coleta_repede_a_sp_a_partir_do_corte(disco, sp_simulada, monkeypatch):
+    monkeypatch.setattr(coleta_dados_service, "COLETA_INCREMENTAL", True)
+    datas = np.arange(np.datetime64("2025-02-20", "h"), np.datetime64("2025-03-20", "h")).astype("datetime64[s]")
+    sp = sp_simulada(datas, np.ones(len(datas)), agora="2025-03-10T12:00:00")
+    req = AnaliseRequest(tipoAnalise="previsao", dataIncio="2025-03-01", metricaAnalisar="Uso de RAM",
+                         fkEmpresa=1, fkMaquina=1)
+
+    primeira = coletar_dados_historicos(req, "HORA", colunar=True)
+    # Simula um restart: só o disco sobrevive
+    coleta_dados_service.invalidar_cache_series()
+    segunda = coletar_dados_historicos(req, "HORA", colunar=True)
+
+    assert sp.chamadas[-1][0] == np.datetime64("2025-03-10T11:00:00", "s")
+    np.testing.assert_array_equal(segunda.datas, primeira.datas)
+    np.testing.assert_allclose(segunda.valores, primeira.valores)
+
+
+def test_sem_trava_de_arquivo_a_coleta_importa_e_o_disco_desliga():
+    codigo = (
+        "import sys; sys.modules['fcntl'] = None; sys.modules['msvcrt'] = None\n"
+        "from app.services import coleta_dados_service\n"
+        "from app.utils import cache_disco\n"
+        "cache_disco.CACHE_DISCO_DIR = 'qualquer'\n"
+        "print(cache_disco.cache_disco_habilitado())\n"
+    )
+    ambiente = dict(os.environ, CACHE_DISCO_DIR="", ROLLUP_DB_PATH="", INSIGHT_IA_ATIVO="0")
+    saida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=ambiente,
+                           capture_output=True, text=True, check=True)
+    assert saida.stdout.strip().splitlines()[-1] == "False"
+
+
+def test_invalidacao_respeita_o_predicado_por_serie(disco, monkeypatch):
+    monkeypatch.setattr(cache_disco, "CACHE_DISCO_ASSENTAMENTO_S", 0.0)
+    _gravar_horas()
+    datas = np.array(["2025-03-09T00:00:00"], dtype="datetime64[s]")
+    gravar_serie_disco(_chave("DIA"), datas[0], np.datetime64("2025-03-10T00:00:00", "s"), datas, [5.0])
+    assert cache_disco.obter_metricas_cache_disco()["series"] == 2
+
+    assert invalidar_intervalo_disco("2025-03-09", "2025-03-09", lambda chave: chave[4] == "DIA") == 1
+    assert ler_serie_disco(_chave("DIA")) is None
+    assert ler_serie_disco(_chave("HORA")) is not None
+
+
+def test_trava_msvcrt_esgotada_desliga_o_disco(disco, monkeypatch):
+    class MsvcrtOcupado:
+        LK_NBLCK, LK_UNLCK = 2, 0
+
+        @staticmethod
+        def locking(*args):
+            raise OSError("ocupado")
+
+    monkeypatch.setattr(cache_disco, "fcntl", None)
+    monkeypatch.setattr(cache_disco, "msvcrt", MsvcrtOcupado)
+    monkeypatch.setattr(cache_disco, "CACHE_DISCO_TRAVA_TENTATIVAS", 3)
+    monkeypatch.setattr(cache_disco, "CACHE_DISCO_TRAVA_ESPERA_S", 0.0)
+    monkeypatch.setattr(cache_disco, "_trava_esgotada", False)
+
+    with pytest.raises(TimeoutError):
+        _gravar_horas()
+    assert cache_disco.cache_disco_habilitado() is False
+    assert invalidar_intervalo_disco("2025-03-09", "2025-03-10") == 0
@@ -0,0 +1,135 @@
+# tests/test_coleta_incremental.py
+
+import numpy as np
+import pytest
+
+from app.models.dataModel import AnaliseRequest
+from app.services import coleta_dados_service
+from app.services.coleta_dados_service import (
+    atualizar_rollups, coletar_dados_historicos, coletar_dados_por_intervalo, invalidar_cache_series, invalidar_intervalo
+)
+from app.utils import rollup
+
+
+def _req(dataIncio="2025-03-01"):
+    return AnaliseRequest(tipoAnalise="previsao", dataIncio=dataIncio, metricaAnalisar="Uso de RAM",
+                          fkEmpresa=1, fkMaquina=1)
+
+
+@pytest.fixture
+def sp(sp_simulada, monkeypatch):
+    monkeypatch.setattr(coleta_dados_service, "COLETA_INCREMENTAL", True)
+    datas = np.arange(np.datetime64("2025-02-20", 'h'), np.datetime64("2025-03-20", 'h')).astype('datetime64[s]')
+    rng = np.random.default_rng(7)
+    return sp_simulada(datas, rng.random(len(datas)), agora="2025-03-10T12:00:00")
+
+
+def _coletar(agrupar_por="DIA", req=None):
+    # O cache de resultados fica de fora: o que se testa é o reaproveitamento dos buckets fechados
+    coleta_dados_service._cache_series.invalidar()
+    return coletar_dados_historicos(req or _req(), agrupar_por, colunar=True)
+
+
+def _coleta_completa(agrupar_por="DIA", req=None):
+    invalidar_cache_series()
+    return _coletar(agrupar_por, req)
+
+
+@pytest.mark.parametrize("agrupar_por", ["HORA", "DIA"])
+def test_delta_pede_so_o_bucket_aberto_e_bate_com_a_coleta_completa(sp, agrupar_por):
+    _coletar(agrupar_por)
+    sp.agora = np.datetime64("2025-03-12T15:30:00")
+    delta = _coletar(agrupar_por)
+
+    inicio_delta = sp.chamadas[-1][0]
+    assert inicio_delta == np.datetime64("2025-03-10T12:00:00" if agrupar_por == "HORA" else "2025-03-10T00:00:00")
+
+    completa = _coleta_completa(agrupar_por)
+    np.testing.assert_array_equal(delta.datas, completa.datas)
+    np.testing.assert_allclose(delta.valores, completa.valores)
+
+
+def test_metricas_contam_linhas_reaproveitadas(sp):
+    _coletar()
+    _coletar()
+    metricas = coleta_dados_service.obter_metricas_cache_series()["incremental"]
+    assert metricas["coletas_completas"] >= 1
+    assert metricas["coletas_delta"] >= 1
+    assert metricas["linhas_reaproveitadas"] >= 9
+
+
+def test_janela_que_comeca_no_meio_do_bucket_nao_reaproveita(sp):
+    _coletar("MES", _req("2025-02-01"))
+    chamadas = len(sp.chamadas)
+    _coletar("MES", _req("2025-02-15"))
+    assert sp.chamadas[chamadas][0] == np.datetime64("2025-02-15T00:00:00")
+
+
+def test_janela_no_meio_do_mes_reaproveita_os_meses_inteiros(sp):
+    _coletar("MES", _req("2025-01-01"))
+    chamadas = len(sp.chamadas)
+    parcial = _coletar("MES", _req("2025-01-15"))
+
+    assert [c[:2] for c in sp.chamadas[chamadas:]] == [
+        (np.datetime64("2025-01-15T00:00:00"), np.datetime64("2025-01-31T23:59:59")),
+        (np.datetime64("2025-03-01T00:00:00"), np.datetime64("2025-03-10T12:00:00")),
+    ]
+    completa = _coleta_completa("MES", _req("2025-01-15"))
+    np.testing.assert_array_equal(parcial.datas, completa.datas)
+    np.testing.assert_allclose(parcial.valores, completa.valores)
+
+
+def test_invalidacao_descarta_os_buckets_fechados(sp):
+    _coletar()
+    sp.valores[:] = 1.0
+    assert invalidar_intervalo("2025-03-01", "2025-03-05", fkEmpresa=1)["series_fechadas"] == 1
+    corrigida = _coletar()
+    assert sp.chamadas[-1][0] == np.datetime64("2025-03-01T00:00:00")
+    np.testing.assert_allclose(corrigida.valores[:-1], 24.0)
+
+
+@pytest.fixture
+def sp_com_rollup(sp_simulada, monkeypatch, tmp_path):
+    """SP com meses de amostras e o rollup MES já atualizado; só o rollup guarda buckets."""
+    monkeypatch.setattr(coleta_dados_service, "COLETA_INCREMENTAL", False)
+    monkeypatch.setattr(rollup, "ROLLUP_DB_PATH", str(tmp_path / "rollup.db"))
+    monkeypatch.setattr(rollup, "_schema_criado", False)
+    datas = np.arange(np.datetime64("2024-10-01", 'h'), np.datetime64("2025-03-20", 'h')).astype('datetime64[s]')
+    sp = sp_simulada(datas, np.random.default_rng(11).random(len(datas)), agora="2025-03-10T12:00:00")
+    atualizar_rollups("2024-10-01", ["MES"], series=[(1, 1, "Uso de RAM", None)])
+    sp.chamadas.clear()
+    return sp
+
+
+def _sem_rollup(monkeypatch, coletar):
+    invalidar_cache_series()
+    monkeypatch.setattr(rollup, "ROLLUP_DB_PATH", "")
+    return coletar()
+
+
+def test_mes_no_meio_do_mes_pede_so_o_bucket_parcial(sp_com_rollup, monkeypatch):
+    req = _req("2024-11-15")
+    serie = coletar_dados_historicos(req, "MES", colunar=True)
+
+    assert sp_com_rollup.chamadas == [
+        (np.datetime64("2024-11-15T00:00:00"), np.datetime64("2024-11-30T23:59:59"), "MES"),
+        (np.datetime64("2025-03-01T00:00:00"), np.datetime64("2025-03-10T12:00:00"), "MES"),
+    ]
+    completa = _sem_rollup(monkeypatch, lambda: coletar_dados_historicos(req, "MES", colunar=True))
+    np.testing.assert_array_equal(serie.datas, completa.datas)
+    np.testing.assert_allclose(serie.valores, completa.valores)
+
+
+def test_intervalo_mes_no_meio_do_mes_pede_so_as_pontas(sp_com_rollup, monkeypatch):
+    req = _req("2024-11-15")
+    serie = coletar_dados_por_intervalo(req, "2024-11-15", "2025-02-01", "MES", colunar=True)
+
+    assert sp_com_rollup.chamadas == [
+        (np.datetime64("2024-11-15T00:00:00"), np.datetime64("2024-11-30T23:59:59"), "MES"),
+        (np.datetime64("2025-02-01T00:00:00"), np.datetime64("2025-02-01T00:00:00"), "MES"),
+    ]
+    completa = _sem_rollup(
+        monkeypatch, lambda: coletar_dados_por_intervalo(req, "2024-11-15", "2025-02-01", "MES", colunar=True)
+    )
+    np.testing.assert_array_equal(serie.datas, completa.datas)
+    np.testing.assert_allclose(serie.valores, completa.valores)
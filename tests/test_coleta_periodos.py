@@ -0,0 +1,66 @@
+# tests/test_coleta_periodos.py
+
+import numpy as np
+import pytest
+
+from app.models.dataModel import AnaliseRequest
+from app.services import coleta_dados_service
+from app.services.analise_comparacao import calcular_periodo_anterior
+from app.services.coleta_dados_service import coletar_dados_periodos, coletar_dados_por_intervalo
+
+
+def _req():
+    return AnaliseRequest(
+        tipoAnalise="comparacao", dataIncio="2025-03-10", metricaAnalisar="Total de Alertas",
+        fkEmpresa=1, fkMaquina=1, dataPrevisao="2025-03-20",
+    )
+
+
+def _amostras_horarias(inicio, fim):
+    datas = np.arange(np.datetime64(inicio, 'h'), np.datetime64(fim, 'h')).astype('datetime64[s]')
+    return datas, np.ones(len(datas))
+
+
+@pytest.mark.parametrize("agrupar_por", ["HORA", "DIA", "MES"])
+def test_periodos_em_lote_batem_com_chamadas_separadas(sp_simulada, agrupar_por):
+    sp_simulada(*_amostras_horarias("2025-02-20", "2025-03-25"))
+    req = _req()
+    periodo_atual = ("2025-03-10", "2025-03-20")
+    periodo_anterior = calcular_periodo_anterior(*periodo_atual)
+
+    atual, anterior = coletar_dados_periodos(req, periodo_atual, periodo_anterior, agrupar_por)
+
+    coleta_dados_service.invalidar_cache_series()
+    atual_separado = coletar_dados_por_intervalo(req, *periodo_atual, agrupar_por, colunar=True)
+    anterior_separado = coletar_dados_por_intervalo(req, *periodo_anterior, agrupar_por, colunar=True)
+
+    np.testing.assert_array_equal(atual.datas, atual_separado.datas)
+    np.testing.assert_array_equal(atual.valores, atual_separado.valores)
+    np.testing.assert_array_equal(anterior.datas, anterior_separado.datas)
+    np.testing.assert_array_equal(anterior.valores, anterior_separado.valores)
+
+
+def test_periodos_usam_uma_conexao_e_duas_chamadas(sp_simulada, monkeypatch):
+    sp = sp_simulada(*_amostras_horarias("2025-02-20", "2025-03-25"))
+    lotes = []
+    monkeypatch.setattr(
+        coleta_dados_service, "fazer_consultas_colunares",
+        lambda configs: lotes.append(len(configs)) or sp.consultas_colunares(configs),
+    )
+    periodo_atual = ("2025-03-10", "2025-03-20")
+    coletar_dados_periodos(_req(), periodo_atual, calcular_periodo_anterior(*periodo_atual), "DIA")
+    assert lotes == [2]
+    # Só as duas janelas: nada do intervalo entre elas
+    assert sorted(c[:2] for c in sp.chamadas) == [
+        (np.datetime64("2025-02-27T00:00:00"), np.datetime64("2025-03-09T00:00:00")),
+        (np.datetime64("2025-03-10T00:00:00"), np.datetime64("2025-03-20T00:00:00")),
+    ]
+
+
+def test_ultimo_bucket_do_periodo_anterior_so_tem_a_meia_noite(sp_simulada):
+    sp_simulada(*_amostras_horarias("2025-02-20", "2025-03-25"))
+    periodo_atual = ("2025-03-10", "2025-03-20")
+    _, anterior = coletar_dados_periodos(_req(), periodo_atual, calcular_periodo_anterior(*periodo_atual), "DIA")
+    assert anterior.datas[-1] == np.datetime64("2025-03-09", 's')
+    assert anterior.valores[-1] == 1
+    assert anterior.valores.sum() == 24 * 10 + 1
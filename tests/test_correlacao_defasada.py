@@ -0,0 +1,62 @@
+# tests/test_correlacao_defasada.py
+
+import numpy as np
+import pytest
+
+from app.services.analise_correlacao import analisar_defasagem, calcular_correlacao_defasada
+from app.utils.serie_temporal import SerieTemporal
+
+
+def _pearson_forca_bruta(a, b, k):
+    """r entre A(t) e B(t - k) sobre o trecho sobreposto."""
+    n = len(a)
+    trecho_a = a[max(k, 0):n + min(k, 0)]
+    trecho_b = b[max(-k, 0):n - max(k, 0)]
+    if trecho_a.std() == 0 or trecho_b.std() == 0:
+        return 0.0
+    return np.corrcoef(trecho_a, trecho_b)[0, 1]
+
+
+@pytest.mark.parametrize("n, defasagem_maxima", [(50, 20), (301, 100), (1000, 500)])
+def test_fft_bate_com_pearson_por_defasagem(n, defasagem_maxima):
+    rng = np.random.default_rng(n)
+    a = np.cumsum(rng.normal(size=n)) + 1e3
+    b = np.roll(a, 3) + rng.normal(0, 0.5, n)
+    defasagens, r = calcular_correlacao_defasada(a, b, defasagem_maxima)
+    np.testing.assert_array_equal(defasagens, np.arange(-defasagem_maxima, defasagem_maxima + 1))
+    referencia = np.array([_pearson_forca_bruta(a, b, int(k)) for k in defasagens])
+    np.testing.assert_allclose(r, referencia, atol=1e-9)
+
+
+def test_defasagem_maior_que_a_serie_e_limitada():
+    a = np.arange(10, dtype=np.float64)
+    defasagens, _ = calcular_correlacao_defasada(a, a[::-1].copy(), 100)
+    assert defasagens[-1] == 8
+
+
+def test_trecho_constante_da_r_zero():
+    a = np.r_[np.ones(20), np.arange(20.0)]
+    b = np.arange(40.0)
+    defasagens, r = calcular_correlacao_defasada(a, b, 30)
+    assert np.all(np.isfinite(r))
+    assert r[defasagens == -25][0] == 0.0
+
+
+def test_analisar_defasagem_encontra_o_atraso_com_lacunas():
+    rng = np.random.default_rng(9)
+    datas = np.arange(np.datetime64("2025-03-01T00", 'h'), np.datetime64("2025-03-11T00", 'h')).astype('datetime64[s]')
+    sinal = np.convolve(rng.normal(size=len(datas) + 20), np.ones(5) / 5, mode='same')
+    # A repete B com 4 horas de atraso: B antecede A, defasagem positiva
+    a, b = sinal[16:16 + len(datas)], sinal[20:20 + len(datas)]
+    presentes = rng.random(len(datas)) > 0.1
+    resultado = analisar_defasagem(
+        SerieTemporal(datas[presentes], a[presentes]), SerieTemporal(datas, b), "HORA", 24
+    )
+    assert resultado["melhorDefasagem"] == 4
+    assert resultado["pearson"] > 0.9
+    assert len(resultado["curva"]["r"]) == 49
+
+
+def test_analisar_defasagem_sem_pontos_suficientes():
+    datas = np.arange(np.datetime64("2025-03-01"), np.datetime64("2025-03-05")).astype('datetime64[s]')
+    assert analisar_defasagem(SerieTemporal(datas, np.arange(4.0)), SerieTemporal(datas, np.arange(4.0)), "DIA", 3) is None
@@ -0,0 +1,61 @@
+# tests/test_correlacao_frota.py
+
+import numpy as np
+import pytest
+
+from app.models.dataModel import AnaliseRequest
+from app.services import analise_frota, coleta_dados_service
+from app.services.analise_frota import processar_request_correlacao_frota
+from tests.conftest import SPSimulada
+
+AGORA = "2025-04-01T12:00:00"
+
+
+@pytest.fixture
+def lotes(monkeypatch):
+    """SP por (máquina, métrica); guarda o tamanho de cada lote enviado ao banco."""
+    rng = np.random.default_rng(11)
+    datas = np.arange(np.datetime64("2025-03-01", "h"), np.datetime64("2025-03-31", "h")).astype("datetime64[s]")
+    ram = {m: rng.random(len(datas)) for m in (1, 2, 3)}
+    sps = {
+        (1, "Uso de RAM"): SPSimulada(datas, ram[1], AGORA),
+        (1, "Uso de CPU"): SPSimulada(datas, 2 * ram[1] + rng.normal(0, 0.01, len(datas)), AGORA),
+        (2, "Uso de RAM"): SPSimulada(datas, ram[2], AGORA),
+        (2, "Uso de CPU"): SPSimulada(datas, rng.random(len(datas)), AGORA),
+        (3, "Uso de RAM"): SPSimulada(datas, ram[3], AGORA),
+        (3, "Uso de CPU"): SPSimulada(datas[:0], [], AGORA),
+    }
+    tamanhos = []
+
+    def consultas_colunares(configs):
+        tamanhos.append(len(configs))
+        # params do histórico: (inicio, fkEmpresa, fkMaquina, agrupar_por, métrica, componente)
+        return [sps[(config["params"][2], config["params"][4])].executar(config) for config in configs]
+
+    monkeypatch.setattr(coleta_dados_service, "fazer_consultas_colunares", consultas_colunares)
+    monkeypatch.setattr(coleta_dados_service, "agora_local", lambda: np.datetime64(AGORA, "s"))
+    monkeypatch.setattr(coleta_dados_service, "listar_maquinas_empresa", lambda fk_empresa: [1, 2, 3])
+    monkeypatch.setattr(analise_frota, "calcular_agrupamento", lambda inicio, fim: "DIA")
+    return tamanhos
+
+
+def _req():
+    return AnaliseRequest(tipoAnalise="correlacao", dataIncio="2025-03-01", metricaAnalisar="Uso de RAM",
+                          fkEmpresa=1, variavelRelacionada="Uso de CPU")
+
+
+def test_duas_metricas_de_todas_as_maquinas_num_unico_lote(lotes):
+    resultado = processar_request_correlacao_frota(_req())
+
+    assert lotes == [6]
+    assert [m["fkMaquina"] for m in resultado["maquinas"]] == [1, 2]
+    assert resultado["maquinas"][0]["pearson"] > 0.99
+    assert resultado["maquinas_sem_dados"] == [3]
+
+
+def test_lote_unico_bate_com_a_correlacao_por_maquina(lotes):
+    resultado = processar_request_correlacao_frota(_req())
+
+    for item in resultado["maquinas"]:
+        serie_a, serie_b = coleta_dados_service.coletar_dados_correlacao(_req(), "DIA", item["fkMaquina"])
+        assert item["pearson"] == pytest.approx(np.corrcoef(serie_a.valores, serie_b.valores)[0, 1], abs=1e-4)
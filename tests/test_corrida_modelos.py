@@ -0,0 +1,63 @@
+# tests/test_corrida_modelos.py
+
+import numpy as np
+import pytest
+
+from app.services import analise_previsao
+from app.services.analise_previsao import selecionar_melhor_modelo
+from app.utils.serie_temporal import SerieTemporal
+
+CHAVE_SERIE = (1, 1, "Uso de RAM", None, "DIA")
+
+
+@pytest.fixture(autouse=True)
+def caches_de_modelos_limpos():
+    for cache in (analise_previsao._modelos_ajustados, analise_previsao._estados_holt, analise_previsao._vencedores):
+        cache.invalidar()
+    yield
+
+
+def _serie(valores):
+    n = len(valores)
+    datas = np.arange(np.datetime64("2025-01-01"), np.datetime64("2025-01-01") + n).astype('datetime64[s]')
+    return SerieTemporal(datas, valores)
+
+
+def _ruidosa(n=60, semente=5):
+    rng = np.random.default_rng(semente)
+    return _serie(40 + 10 * np.sin(np.arange(n) / 4) + rng.normal(0, 4, n))
+
+
+def _ordem(resultado):
+    return [a["modelo"] for a in resultado["candidatos"] if a["status"] != "pulado"]
+
+
+def test_serie_linear_para_no_primeiro_modelo():
+    resultado = selecionar_melhor_modelo(_serie(10 + 2.0 * np.arange(30)), estrategia="corrida")
+    assert resultado["nome"] == "Regressão Linear"
+    status = {a["modelo"]: a["status"] for a in resultado["candidatos"]}
+    assert status == {"linear": "avaliado", "polinomial": "pulado", "holt": "pulado", "random_forest": "pulado"}
+
+
+def test_vencedor_anterior_vai_primeiro():
+    analise_previsao._vencedores.guardar(CHAVE_SERIE, "holt", 60)
+    resultado = selecionar_melhor_modelo(_ruidosa(), estrategia="corrida", chave_serie=CHAVE_SERIE)
+    assert _ordem(resultado)[0] == "holt"
+
+
+def test_floresta_vencedora_nao_e_antecipada():
+    analise_previsao._vencedores.guardar(CHAVE_SERIE, "random_forest", 60)
+    resultado = selecionar_melhor_modelo(_ruidosa(), estrategia="corrida", chave_serie=CHAVE_SERIE)
+    assert _ordem(resultado) == ["linear", "polinomial", "holt", "random_forest"]
+
+
+def test_serie_curta_pula_a_floresta():
+    resultado = selecionar_melhor_modelo(_ruidosa(n=8), estrategia="corrida")
+    status = {a["modelo"]: a["status"] for a in resultado["candidatos"]}
+    assert status["random_forest"] == "pulado"
+
+
+def test_padrao_e_o_torneio_com_todos_os_modelos():
+    assert analise_previsao.PREVISAO_ESTRATEGIA == "torneio"
+    resultado = selecionar_melhor_modelo(_serie(10 + 2.0 * np.arange(30)), prazo_s=30)
+    assert {a["status"] for a in resultado["candidatos"]} == {"avaliado"}
@@ -0,0 +1,104 @@
+# tests/test_holt_online.py
+
+import numpy as np
+import pytest
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+from app.services import analise_previsao
+from app.models.dataModel import AnaliseRequest
+from app.services.analise_previsao import FeaturesPrevisao, chave_serie_previsao, treinar_holt
+from app.utils.serie_temporal import SerieTemporal
+
+CHAVE_SERIE = (1, 1, "Uso de RAM", None, "DIA")
+
+
+@pytest.fixture(autouse=True)
+def estados_limpos():
+    analise_previsao._estados_holt.invalidar()
+    yield
+
+
+def _serie(valores):
+    n = len(valores)
+    datas = np.arange(np.datetime64("2025-01-01"), np.datetime64("2025-01-01") + n).astype('datetime64[s]')
+    return SerieTemporal(datas, valores)
+
+
+def _valores(n, semente=2):
+    rng = np.random.default_rng(semente)
+    return 20 + 0.4 * np.arange(n) + rng.normal(0, 1.5, n)
+
+
+def _holt(serie, chave_serie=CHAVE_SERIE):
+    return treinar_holt(serie, 5, features=FeaturesPrevisao(serie, 5), chave_serie=chave_serie)
+
+
+def _contadores():
+    metricas = analise_previsao.obter_metricas_modelos()
+    return metricas["holt_online"], metricas["holt_reajustes"]
+
+
+def test_atualizacao_online_bate_com_statsmodels_de_parametros_fixos():
+    valores = _valores(46)
+    online_antes, reajustes_antes = _contadores()
+    _holt(_serie(valores[:40]))
+    resultado = _holt(_serie(valores))
+    assert _contadores() == (online_antes + 1, reajustes_antes + 1)
+
+    ajuste = ExponentialSmoothing(valores[:40], trend='add', seasonal=None, damped_trend=True).fit()
+    referencia = ExponentialSmoothing(
+        valores, trend='add', seasonal=None, damped_trend=True, initialization_method='known',
+        initial_level=ajuste.params['initial_level'], initial_trend=ajuste.params['initial_trend'],
+    ).fit(
+        smoothing_level=ajuste.params['smoothing_level'],
+        smoothing_trend=ajuste.params['smoothing_trend'],
+        damping_trend=ajuste.params['damping_trend'],
+        optimized=False,
+    )
+    residuos = valores - referencia.fittedvalues
+    assert resultado["rmse"] == pytest.approx(np.sqrt(residuos @ residuos / len(valores)), rel=1e-9)
+    np.testing.assert_allclose(resultado["projecao"], referencia.forecast(5), atol=0.006)
+
+
+def test_ultimo_bucket_alterado_ainda_e_online():
+    valores = _valores(40)
+    _holt(_serie(valores))
+    # O último bucket pode estar aberto: mudar seu valor não invalida o estado
+    valores[-1] += 3
+    online_antes, reajustes_antes = _contadores()
+    _holt(_serie(valores))
+    assert _contadores() == (online_antes + 1, reajustes_antes)
+
+
+def test_prefixo_corrigido_reajusta():
+    valores = _valores(44)
+    _holt(_serie(valores[:40]))
+    valores[10] += 5
+    online_antes, reajustes_antes = _contadores()
+    _holt(_serie(valores))
+    assert _contadores() == (online_antes, reajustes_antes + 1)
+
+
+def test_muitos_pontos_novos_reajustam(monkeypatch):
+    monkeypatch.setattr(analise_previsao, "HOLT_ONLINE_MAX_NOVOS", 3)
+    valores = _valores(50)
+    _holt(_serie(valores[:40]))
+    online_antes, reajustes_antes = _contadores()
+    _holt(_serie(valores))
+    assert _contadores() == (online_antes, reajustes_antes + 1)
+
+
+def test_janelas_diferentes_nao_sobrescrevem_o_estado():
+    def chave(data_inicio, agrupar_por="DIA"):
+        req = AnaliseRequest(tipoAnalise="previsao", dataIncio=data_inicio, metricaAnalisar="Uso de RAM",
+                             fkEmpresa=1, fkMaquina=1)
+        return chave_serie_previsao(req, agrupar_por)
+
+    assert len({chave("2025-01-01"), chave("2025-01-11"), chave("2025-01-01", "HORA")}) == 3
+
+    valores = _valores(50)
+    _holt(_serie(valores[:40]), chave("2025-01-01"))
+    _holt(_serie(valores[10:45]), chave("2025-01-11"))
+    online_antes, reajustes_antes = _contadores()
+    _holt(_serie(valores[:42]), chave("2025-01-01"))
+    assert _contadores() == (online_antes + 1, reajustes_antes)
@@ -0,0 +1,118 @@
+# tests/test_insight_fallback.py
+
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.models.dataModel import AnaliseRequest
+from app.services import gemini_service, insight_service
+from app.services.analise_comparacao import interpretacao_local_comparacao, processar_request_comparacao
+from app.services.insight_service import aguardar_insight, agendar_insight, resolver_insight
+from app.utils.disjuntor import DisjuntorCircuito
+
+ORCAMENTO_S = 0.3
+SCHEMA = {"type": "object", "properties": {"interpretacao": {"type": "array"}}}
+
+
+class _Resposta:
+    def __init__(self, texto):
+        self.text = texto
+
+
+class ClienteStub:
+    """Substitui o GenerativeModel: lento para prompts com 'lento', falha com 'falha'."""
+
+    def __init__(self, atraso_s=1.5):
+        self.atraso_s = atraso_s
+        self.chamadas = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, generation_config=None, request_options=None):
+        with self._lock:
+            self.chamadas += 1
+        if "falha" in prompt:
+            raise RuntimeError("erro simulado")
+        if "lento" in prompt:
+            time.sleep(self.atraso_s)
+        return _Resposta(json.dumps({"interpretacao": ["texto da IA"]}))
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    stub = ClienteStub()
+    gemini_service.definir_cliente(stub)
+    gemini_service.invalidar_cache_insights()
+    monkeypatch.setattr(gemini_service, "disjuntor_gemini", DisjuntorCircuito(5, 60, nome="disjuntor_teste"))
+    monkeypatch.setattr(insight_service, "INSIGHT_IA_ATIVO", True)
+    monkeypatch.setenv("INSIGHT_ORCAMENTO_S_COMPARACAO", str(ORCAMENTO_S))
+    yield stub
+    gemini_service.reiniciar_cliente()
+    gemini_service.invalidar_cache_insights()
+
+
+def _req(**opcoes):
+    return AnaliseRequest(tipoAnalise="comparacao", dataIncio="2025-03-10", metricaAnalisar="Total de Alertas",
+                          fkEmpresa=1, fkMaquina=1, dataPrevisao="2025-03-20", **opcoes)
+
+
+def _resolver_cronometrado(prompt):
+    fallback = interpretacao_local_comparacao("Total de Alertas", "+10.0%", 110, 100)
+    inicio = time.monotonic()
+    insight, insight_id = resolver_insight(_req(), "comparacao", prompt, SCHEMA, fallback)
+    return insight, insight_id, time.monotonic() - inicio, fallback
+
+
+def test_cliente_rapido_devolve_texto_da_ia(cliente):
+    insight, _, _, _ = _resolver_cronometrado("prompt rápido")
+    assert insight == ["texto da IA"]
+
+
+def test_cliente_lento_cai_no_texto_local_dentro_do_orcamento(cliente):
+    insight, insight_id, duracao, fallback = _resolver_cronometrado("prompt lento")
+    assert insight == fallback
+    assert insight_id is None
+    assert duracao < ORCAMENTO_S + 0.2
+
+
+def test_cliente_com_erro_cai_no_texto_local(cliente):
+    insight, _, duracao, fallback = _resolver_cronometrado("prompt falha")
+    assert insight == fallback
+    assert duracao < ORCAMENTO_S + 0.2
+
+
+def test_circuito_aberto_nao_chama_a_api(cliente):
+    gemini_service.disjuntor_gemini = DisjuntorCircuito(1, 60, nome="disjuntor_teste")
+    gemini_service.disjuntor_gemini.registrar_falha()
+    insight, _, duracao, fallback = _resolver_cronometrado("prompt rápido")
+    assert insight == fallback
+    assert cliente.chamadas == 0
+    assert duracao < ORCAMENTO_S
+
+
+def test_chamadas_estouradas_nao_ocupam_os_workers_assincronos(cliente):
+    fallback = ["local"]
+    for i in range(insight_service.INSIGHT_WORKERS + 1):
+        assert insight_service.gerar_insight(f"prompt lento {i}", SCHEMA, False, fallback, ORCAMENTO_S) == fallback
+    insight_id = agendar_insight("prompt rápido", SCHEMA, False, fallback)
+    estado = aguardar_insight(insight_id, 1.0)
+    assert estado["status"] == insight_service.STATUS_PRONTO
+    assert estado["interpretacao"] == ["texto da IA"]
+
+
+def test_comparacao_com_cliente_lento_responde_com_interpretacao_local(cliente, sp_simulada):
+    datas = np.arange(np.datetime64("2025-02-20", 'h'), np.datetime64("2025-03-25", 'h')).astype('datetime64[s]')
+    sp_simulada(datas, np.ones(len(datas)))
+    cliente.atraso_s = 1.5
+    # Todo prompt da comparação fica lento
+    original = cliente.generate_content
+    cliente.generate_content = lambda prompt, **kw: original("lento " + prompt, **kw)
+
+    inicio = time.monotonic()
+    resposta = processar_request_comparacao(_req())
+    duracao = time.monotonic() - inicio
+
+    assert resposta["iaMetricas"]["interpretacao"] == interpretacao_local_comparacao("Total de Alertas", "0.0%", 241, 241)
+    assert duracao < ORCAMENTO_S + 1.0
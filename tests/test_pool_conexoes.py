@@ -0,0 +1,159 @@
+# tests/test_pool_conexoes.py
+
+import threading
+import time
+
+import pytest
+
+from app.utils import database
+from app.utils.database import PoolConexoes
+
+
+class CursorFalso:
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.conjuntos_pendentes = 0
+
+    def execute(self, instrucao, params=None):
+        self.conexao.execucoes.append((instrucao, params))
+        if self.conexao.falhar:
+            raise database.Error("falha simulada")
+        self.conjuntos_pendentes = 2
+
+    def fetchall(self):
+        return [("2025-01-01 00:00:00", 1.0)]
+
+    def nextset(self):
+        self.conjuntos_pendentes -= 1
+        return self.conjuntos_pendentes > 0
+
+    def close(self):
+        self.conexao.cursores_abertos -= 1
+
+
+class ConexaoFalsa:
+    def __init__(self):
+        self.execucoes = []
+        self.falhar = False
+        self.fechada = False
+        self.pings = 0
+        self.cursores_abertos = 0
+        self.autocommit = False
+
+    def cursor(self):
+        self.cursores_abertos += 1
+        return CursorFalso(self)
+
+    def is_connected(self):
+        return not self.fechada
+
+    def ping(self, **kwargs):
+        self.pings += 1
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.fechada = True
+
+
+@pytest.fixture
+def conexoes(monkeypatch):
+    criadas = []
+
+    def conectar(**config):
+        conn = ConexaoFalsa()
+        criadas.append(conn)
+        return conn
+
+    monkeypatch.setattr(database.mysql.connector, "connect", conectar)
+    return criadas
+
+
+def _pool(**opcoes):
+    config = dict(tamanho=2, timeout_s=0.1, reciclar_s=1800, ping_ocioso_s=30)
+    config.update(opcoes)
+    return PoolConexoes({}, **config)
+
+
+def test_conexao_e_reaproveitada(conexoes):
+    pool = _pool()
+    for _ in range(5):
+        with pool.conexao():
+            pass
+    assert len(conexoes) == 1
+    metricas = pool.metricas()
+    assert metricas["checkouts"] == 5
+    assert metricas["conexoes_criadas"] == 1
+    assert metricas["conexoes_livres"] == 1
+
+
+def test_pool_esgotado_levanta_runtime_error(conexoes):
+    pool = _pool(tamanho=1)
+    conn, criada_em = pool.obter()
+    with pytest.raises(RuntimeError):
+        pool.obter()
+    assert pool.metricas()["esgotamentos"] == 1
+    pool.devolver(conn, criada_em)
+    with pool.conexao() as outra:
+        assert outra is conn
+
+
+def test_espera_libera_quando_conexao_volta(conexoes):
+    pool = _pool(tamanho=1, timeout_s=2)
+    conn, criada_em = pool.obter()
+    threading.Timer(0.05, pool.devolver, (conn, criada_em)).start()
+    with pool.conexao() as reaproveitada:
+        assert reaproveitada is conn
+
+
+def test_conexao_com_erro_e_descartada(conexoes):
+    pool = _pool()
+    with pytest.raises(ValueError):
+        with pool.conexao():
+            raise ValueError("erro na consulta")
+    assert conexoes[0].fechada
+    assert pool.metricas()["conexoes_abertas"] == 0
+    with pool.conexao() as conn:
+        assert conn is conexoes[1]
+
+
+def test_conexao_velha_e_reciclada(conexoes):
+    pool = _pool(reciclar_s=0.05)
+    with pool.conexao():
+        pass
+    time.sleep(0.1)
+    with pool.conexao() as conn:
+        assert conn is conexoes[1]
+    assert conexoes[0].fechada
+    assert pool.metricas()["conexoes_recicladas"] == 1
+    assert pool.metricas()["conexoes_abertas"] == 1
+
+
+def test_conexao_ociosa_recebe_ping(conexoes):
+    pool = _pool(ping_ocioso_s=0.05)
+    with pool.conexao():
+        pass
+    time.sleep(0.1)
+    with pool.conexao():
+        pass
+    assert conexoes[0].pings == 1
+
+
+def test_fazer_consulta_banco_consome_os_result_sets_do_call(conexoes, monkeypatch):
+    pool = _pool()
+    monkeypatch.setattr(database, "obter_pool", lambda: pool)
+    resultado = database.fazer_consulta_banco({"query": "CALL sp_teste(%s)", "params": (1,)})
+    assert resultado == [("2025-01-01 00:00:00", 1.0)]
+    assert conexoes[0].cursores_abertos == 0
+    assert pool.metricas()["conexoes_livres"] == 1
+
+
+def test_erro_do_mysql_vira_runtime_error_e_descarta_a_conexao(conexoes, monkeypatch):
+    pool = _pool()
+    monkeypatch.setattr(database, "obter_pool", lambda: pool)
+    with pool.conexao() as conn:
+        conn.falhar = True
+    with pytest.raises(RuntimeError):
+        database.fazer_consulta_banco({"query": "SELECT 1"})
+    assert conexoes[0].fechada
@@ -0,0 +1,63 @@
+# tests/test_pre_calculo.py
+
+import pytest
+
+from app.models.dataModel import AnaliseRequest
+from app.services import pre_calculo_service
+from app.services.pre_calculo_service import chave_pre_calculo, servir_com_pre_calculo
+
+
+@pytest.fixture
+def pre_calculo(monkeypatch):
+    monkeypatch.setattr(pre_calculo_service, "PRECALCULO_ATIVO", True)
+    monkeypatch.setattr(pre_calculo_service, "PRECALCULO_MIN_ACESSOS", 3)
+    monkeypatch.setattr(pre_calculo_service, "_iniciar_agendador", lambda: None)
+    pre_calculo_service._chaves.clear()
+    pre_calculo_service._resultados.invalidar()
+    yield pre_calculo_service
+    pre_calculo_service._chaves.clear()
+    pre_calculo_service._resultados.invalidar()
+
+
+def _req(**opcoes):
+    return AnaliseRequest(tipoAnalise="previsao", dataIncio="2025-01-01", metricaAnalisar="Uso de RAM",
+                          fkEmpresa=1, fkMaquina=2, **opcoes)
+
+
+class Processar:
+    def __init__(self):
+        self.pedidos = []
+
+    def __call__(self, analise_req):
+        self.pedidos.append(analise_req)
+        return {"analise_tipo": "previsao", "chamada": len(self.pedidos)}
+
+
+def test_chave_fria_nao_e_guardada(pre_calculo):
+    processar = Processar()
+    servir_com_pre_calculo("previsao", _req(), processar)
+    servir_com_pre_calculo("previsao", _req(), processar)
+    assert len(processar.pedidos) == 2
+    assert pre_calculo._resultados.obter(chave_pre_calculo("previsao", _req())) is None
+
+
+def test_chave_quente_e_servida_da_memoria(pre_calculo):
+    processar = Processar()
+    for _ in range(3):
+        servir_com_pre_calculo("previsao", _req(), processar)
+    assert servir_com_pre_calculo("previsao", _req(), processar) == {"analise_tipo": "previsao", "chamada": 3}
+    assert len(processar.pedidos) == 3
+
+
+def test_recalculo_ignora_opcoes_de_entrega_do_ultimo_pedido(pre_calculo):
+    processar = Processar()
+    servir_com_pre_calculo("previsao", _req(), processar)
+    servir_com_pre_calculo("previsao", _req(ignorarCacheIa=True), processar)
+    servir_com_pre_calculo("previsao", _req(insightAssincrono=True), processar)
+    chave = chave_pre_calculo("previsao", _req())
+    assert pre_calculo._resultados.obter(chave) is None
+
+    pre_calculo._recalcular(chave, pre_calculo._chaves[chave]["req"], processar)
+    refeito = processar.pedidos[-1]
+    assert not refeito.insightAssincrono and not refeito.ignorarCacheIa
+    assert servir_com_pre_calculo("previsao", _req(), processar)["chamada"] == 4
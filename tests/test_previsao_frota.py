@@ -0,0 +1,80 @@
+# tests/test_previsao_frota.py
+
+import numpy as np
+import pytest
+
+from app.services.analise_frota import (
+    _GRADE_HOLT, ajustar_holt_frota, ajustar_polinomios_frota, montar_matriz_frota,
+)
+from app.utils.serie_temporal import SerieTemporal
+
+PASSOS = 5
+
+
+def _frota(semente=4):
+    """Três máquinas com janelas e lacunas diferentes na mesma grade de dias."""
+    rng = np.random.default_rng(semente)
+    dias = np.arange(np.datetime64("2025-01-01"), np.datetime64("2025-03-01")).astype('datetime64[s]')
+    t = np.arange(len(dias))
+    com_lacunas = rng.random(len(dias)) > 0.2
+    return {
+        1: SerieTemporal(dias, 30 + 0.5 * t + rng.normal(0, 2, len(t))),
+        2: SerieTemporal(dias[10:], 80 - 0.3 * t[10:] + 0.004 * t[10:] ** 2 + rng.normal(0, 1, len(t) - 10)),
+        3: SerieTemporal(dias[com_lacunas][:-7], 55 + 5 * np.sin(t[com_lacunas][:-7] / 5)),
+    }
+
+
+def test_matriz_tem_nan_onde_a_maquina_nao_tem_ponto():
+    series = _frota()
+    maquinas, datas_grade, Y = montar_matriz_frota(series)
+    assert maquinas == [1, 2, 3]
+    for i, maquina in enumerate(maquinas):
+        presentes = ~np.isnan(Y[i])
+        np.testing.assert_array_equal(datas_grade[presentes], series[maquina].datas)
+        np.testing.assert_array_equal(Y[i, presentes], series[maquina].valores)
+
+
+@pytest.mark.parametrize("grau", [1, 2])
+def test_ajuste_em_lote_bate_com_polyfit_por_maquina(grau):
+    series = _frota()
+    _, datas_grade, Y = montar_matriz_frota(series)
+    rmse, r2, projecao = ajustar_polinomios_frota(datas_grade, Y, grau, PASSOS)
+
+    for i, serie in enumerate(series.values()):
+        x = serie.datas.astype('datetime64[D]').astype(np.int64).astype(np.float64)
+        centro = x.mean()
+        coeficientes = np.polyfit(x - centro, serie.valores, grau)
+        residuos = serie.valores - np.polyval(coeficientes, x - centro)
+        ss_tot = ((serie.valores - serie.valores.mean()) ** 2).sum()
+        futuro = np.polyval(coeficientes, x[-1] + np.arange(1, PASSOS + 1) - centro)
+
+        assert rmse[i] == pytest.approx(np.sqrt((residuos ** 2).mean()), rel=1e-8)
+        assert r2[i] == pytest.approx(1 - (residuos ** 2).sum() / ss_tot, abs=1e-8)
+        np.testing.assert_allclose(projecao[i], futuro, rtol=1e-8)
+
+
+def _holt_referencia(valores):
+    """Busca na grade com a recursão escalar, máquina a máquina."""
+    melhor = None
+    for alpha, beta, phi in _GRADE_HOLT:
+        nivel, tendencia, sse = valores[0], 0.0, 0.0
+        for y in valores[1:]:
+            previsto = nivel + phi * tendencia
+            sse += (y - previsto) ** 2
+            novo_nivel = alpha * y + (1 - alpha) * previsto
+            tendencia = beta * (novo_nivel - nivel) + (1 - beta) * phi * tendencia
+            nivel = novo_nivel
+        if melhor is None or sse < melhor[0]:
+            projecao = nivel + np.cumsum(phi ** np.arange(1, PASSOS + 1)) * tendencia
+            melhor = (sse, projecao)
+    return np.sqrt(melhor[0] / (len(valores) - 1)), melhor[1]
+
+
+def test_holt_em_lote_bate_com_a_recursao_escalar():
+    series = _frota()
+    _, _, Y = montar_matriz_frota(series)
+    rmse, _, projecao = ajustar_holt_frota(Y, PASSOS)
+    for i, serie in enumerate(series.values()):
+        rmse_ref, projecao_ref = _holt_referencia(serie.valores)
+        assert rmse[i] == pytest.approx(rmse_ref, rel=1e-10)
+        np.testing.assert_allclose(projecao[i], projecao_ref, rtol=1e-10)
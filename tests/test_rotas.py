@@ -0,0 +1,162 @@
+# tests/test_rotas.py
+
+import pytest
+from flask import Flask
+
+from app.models.dataModel import AnaliseRequest
+from app.routes import routes_analisis
+from app.services.analise_correlacao import processar_request_matriz_correlacao
+
+
+@pytest.fixture
+def cliente():
+    app = Flask(__name__)
+    app.register_blueprint(routes_analisis.ai_bp, url_prefix="/ai")
+    return app.test_client()
+
+
+@pytest.fixture
+def recebidas(monkeypatch):
+    """Troca os serviços das rotas por stubs que só guardam a requisição mapeada."""
+    chamadas = []
+
+    def processar(analise_req, *args, **kwargs):
+        chamadas.append((analise_req, args, kwargs))
+        return {"ok": True}
+
+    monkeypatch.setattr(routes_analisis, "servir_com_pre_calculo", lambda tipo, req, _: processar(req))
+    monkeypatch.setattr(routes_analisis, "processar_request_correlacao", processar)
+    monkeypatch.setattr(routes_analisis, "processar_request_correlacao_frota", processar)
+    return chamadas
+
+
+_PREVISAO = {"dataInicio": "2025-03-01", "dataPrevisao": "2025-04-01", "metricaAnalisar": "Uso de RAM",
+             "fkEmpresa": 1, "fkMaquina": 1}
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("false", False), ("False", False), ("0", False), (False, False), (0, False),
+    ("true", True), ("1", True), (True, True), (1, True),
+])
+def test_flags_em_texto_sao_lidas_pelo_valor(cliente, recebidas, valor, esperado):
+    resposta = cliente.post("/ai/previsao", json=dict(_PREVISAO, ignorarCacheIa=valor, insightAssincrono=valor))
+
+    assert resposta.status_code == 200
+    analise_req = recebidas[-1][0]
+    assert analise_req.ignorarCacheIa is esperado
+    assert analise_req.insightAssincrono is esperado
+
+
+def test_flag_ausente_e_falsa(cliente, recebidas):
+    cliente.post("/ai/previsao", json=_PREVISAO)
+    assert recebidas[-1][0].ignorarCacheIa is False
+
+
+@pytest.mark.parametrize("valor", ["talvez", 2, [True]])
+def test_flag_invalida_responde_400(cliente, recebidas, valor):
+    resposta = cliente.post("/ai/previsao", json=dict(_PREVISAO, ignorarCacheIa=valor))
+
+    assert resposta.status_code == 400
+    assert "ignorarCacheIa" in resposta.get_json()["erro"]
+    assert recebidas == []
+
+
+def test_resumo_ia_da_frota_em_texto(cliente, recebidas):
+    cliente.post("/ai/correlacao/frota", json={"fkEmpresa": 1, "metricaAnalisar": "Uso de RAM",
+                                              "variavelRelacionada": "Uso de CPU", "resumoIa": "false"})
+    assert recebidas[-1][2]["resumo_ia"] is False
+
+
+_CORRELACAO = {"dataInicio": "2025-03-01", "metricaAnalisar": "Uso de RAM", "variavelRelacionada": "Uso de CPU",
+               "fkEmpresa": 1, "fkMaquina": 1}
+
+
+@pytest.mark.parametrize("rota, campo, valor", [
+    ("/ai/correlacao", "defasagemMaxima", "dez"),
+    ("/ai/correlacao", "defasagemMaxima", -1),
+    ("/ai/correlacao/matriz", "topN", "cinco"),
+    ("/ai/correlacao/matriz", "topN", 0),
+    ("/ai/correlacao/frota", "pagina", "x"),
+    ("/ai/correlacao/frota", "tamanhoPagina", 2.5),
+    ("/ai/correlacao/frota", "pagina", True),
+])
+def test_inteiro_invalido_responde_400(cliente, recebidas, monkeypatch, rota, campo, valor):
+    monkeypatch.setattr(routes_analisis, "processar_request_matriz_correlacao", lambda *a: {"ok": True})
+    corpo = dict(_CORRELACAO, metricas=["Uso de RAM", "Uso de CPU"], **{campo: valor})
+
+    resposta = cliente.post(rota, json=corpo)
+
+    assert resposta.status_code == 400
+    assert campo in resposta.get_json()["erro"]
+    assert recebidas == []
+
+
+def test_inteiros_em_texto_sao_convertidos(cliente, recebidas):
+    cliente.post("/ai/correlacao", json=dict(_CORRELACAO, defasagemMaxima="12"))
+    assert recebidas[-1][0].defasagemMaxima == 12
+
+    cliente.post("/ai/correlacao/frota", json=dict(_CORRELACAO, pagina="2", tamanhoPagina=10))
+    assert recebidas[-1][2]["pagina"] == 2
+    assert recebidas[-1][2]["tamanho_pagina"] == 10
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(routes_analisis, "ADMIN_TOKEN", "segredo")
+    return {"X-Admin-Token": "segredo"}
+
+
+@pytest.mark.parametrize("metodo, rota", [("get", "/ai/metricas"), ("post", "/ai/cache/invalidar")])
+def test_rotas_administrativas_exigem_token(cliente, monkeypatch, metodo, rota):
+    monkeypatch.setattr(routes_analisis, "ADMIN_TOKEN", "")
+    assert getattr(cliente, metodo)(rota, json={}).status_code == 403
+
+    monkeypatch.setattr(routes_analisis, "ADMIN_TOKEN", "segredo")
+    assert getattr(cliente, metodo)(rota, json={}).status_code == 401
+    assert getattr(cliente, metodo)(rota, json={}, headers={"X-Admin-Token": "outro"}).status_code == 401
+
+
+@pytest.mark.parametrize("corpo, campo", [
+    ({"dataInicio": "2025-13-40", "dataFim": "2025-03-10"}, "dataInicio"),
+    ({"dataInicio": "2025-03-01", "dataFim": "ontem"}, "dataFim"),
+    ({"dataInicio": "2025-03-01", "dataFim": 20250310}, "dataFim"),
+    ({"dataInicio": "2025-03-01"}, "dataFim"),
+    ({"dataInicio": "2025-03-10", "dataFim": "2025-03-01"}, "dataFim"),
+    ({"dataInicio": "2025-03-01", "dataFim": "2025-03-10", "fkEmpresa": "um"}, "fkEmpresa"),
+])
+def test_invalidar_com_parametro_invalido_responde_400(cliente, admin, monkeypatch, corpo, campo):
+    chamadas = []
+    monkeypatch.setattr(routes_analisis, "invalidar_intervalo", lambda *a, **k: chamadas.append(a) or {})
+
+    resposta = cliente.post("/ai/cache/invalidar", json=corpo, headers=admin)
+
+    assert resposta.status_code == 400
+    assert campo in resposta.get_json()["erro"]
+    assert chamadas == []
+
+
+def test_invalidar_com_token_e_datas_validas(cliente, admin, monkeypatch):
+    chamadas = []
+    monkeypatch.setattr(routes_analisis, "invalidar_intervalo", lambda *a, **k: chamadas.append((a, k)) or {})
+    monkeypatch.setattr(routes_analisis, "invalidar_pre_calculo", lambda *a: 0)
+
+    resposta = cliente.post("/ai/cache/invalidar", headers=admin,
+                            json={"dataInicio": "2025-03-01", "dataFim": "2025-03-10T06:00:00", "fkEmpresa": "1"})
+
+    assert resposta.status_code == 200
+    assert chamadas == [(("2025-03-01", "2025-03-10T06:00:00"), {"fkEmpresa": 1, "fkMaquina": None})]
+
+
+@pytest.mark.parametrize("metricas", [[["Uso de RAM"], "Uso de CPU"], [{"a": 1}, {"b": 2}], ["Uso de RAM", 3], ["Uso de RAM", " "]])
+def test_matriz_com_metricas_que_nao_sao_texto_responde_400(cliente, metricas):
+    resposta = cliente.post("/ai/correlacao/matriz", json=dict(_CORRELACAO, metricas=metricas))
+
+    assert resposta.status_code == 400
+    assert "metricas" in resposta.get_json()["erro"]
+
+
+def test_servico_da_matriz_rejeita_metricas_nao_hashaveis():
+    req = AnaliseRequest(tipoAnalise="correlacao", dataIncio="2025-03-01", metricaAnalisar="Uso de RAM",
+                         fkEmpresa=1, fkMaquina=1)
+    resultado = processar_request_matriz_correlacao(req, [["Uso de RAM"], ["Uso de CPU"]])
+    assert "metricas" in resultado["erro"]
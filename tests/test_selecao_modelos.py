@@ -0,0 +1,93 @@
+# tests/test_selecao_modelos.py
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.services import analise_previsao
+from app.services.analise_previsao import selecionar_melhor_modelo
+from app.utils.serie_temporal import SerieTemporal
+
+
+@pytest.fixture(autouse=True)
+def caches_de_modelos_limpos():
+    for cache in (analise_previsao._modelos_ajustados, analise_previsao._estados_holt, analise_previsao._vencedores):
+        cache.invalidar()
+    yield
+
+
+def _serie(n=40, ruido=2.0, semente=3):
+    rng = np.random.default_rng(semente)
+    datas = np.arange(np.datetime64("2025-01-01"), np.datetime64("2025-01-01") + n).astype('datetime64[s]')
+    return SerieTemporal(datas, 50 + 0.5 * np.arange(n) + rng.normal(0, ruido, n))
+
+
+def _status(resultado):
+    return {avaliacao["modelo"]: avaliacao["status"] for avaliacao in resultado["candidatos"]}
+
+
+def test_torneio_escolhe_o_menor_rmse_entre_todos():
+    resultado = selecionar_melhor_modelo(_serie(), estrategia="torneio", prazo_s=30)
+    assert set(_status(resultado).values()) == {"avaliado"}
+    menor = min(a["rmse"] for a in resultado["candidatos"])
+    assert round(resultado["rmse"], 4) == menor
+
+
+def test_torneio_e_sequencial_concordam():
+    paralelo = selecionar_melhor_modelo(_serie(), estrategia="torneio", prazo_s=30)
+    analise_previsao._modelos_ajustados.invalidar()
+    features = analise_previsao.FeaturesPrevisao(_serie(), 5)
+    sequenciais = [
+        treinador(None, 5, features=features) for _, treinador, _ in analise_previsao.CANDIDATOS_POR_CUSTO
+    ]
+    melhor = min((r for r in sequenciais if r), key=lambda r: r["rmse"])
+    assert paralelo["nome"] == melhor["nome"]
+    assert paralelo["projecao"] == melhor["projecao"]
+
+
+def test_prazo_esgotado_descarta_os_modelos_lentos(monkeypatch):
+    original = analise_previsao.treinar_random_forest
+
+    def floresta_lenta(*args, **kwargs):
+        time.sleep(0.5)
+        return original(*args, **kwargs)
+
+    candidatos = [
+        (chave, floresta_lenta if chave == "random_forest" else treinador, ordem)
+        for chave, treinador, ordem in analise_previsao.CANDIDATOS_POR_CUSTO
+    ]
+    monkeypatch.setattr(analise_previsao, "CANDIDATOS_POR_CUSTO", candidatos)
+
+    inicio = time.monotonic()
+    resultado = selecionar_melhor_modelo(_serie(), estrategia="torneio", prazo_s=0.2)
+    assert time.monotonic() - inicio < 0.45
+    assert _status(resultado)["random_forest"] == "descartado"
+    assert resultado["nome"] != "Random Forest"
+
+
+def test_torneios_simultaneos_nao_dividem_o_prazo(monkeypatch):
+    # O torneio da série de 41 pontos trava todos os modelos além do próprio prazo
+    def lento_na_serie_marcada(treinador):
+        def treinar(*args, features=None, **kwargs):
+            if len(features.y) == 41:
+                time.sleep(1.5)
+            return treinador(*args, features=features, **kwargs)
+        return treinar
+
+    candidatos = [
+        (chave, lento_na_serie_marcada(treinador), ordem)
+        for chave, treinador, ordem in analise_previsao.CANDIDATOS_POR_CUSTO
+    ]
+    monkeypatch.setattr(analise_previsao, "CANDIDATOS_POR_CUSTO", candidatos)
+
+    travado = threading.Thread(
+        target=selecionar_melhor_modelo, args=(_serie(n=41),), kwargs={"estrategia": "torneio", "prazo_s": 0.1}
+    )
+    travado.start()
+    time.sleep(0.05)
+    resultado = selecionar_melhor_modelo(_serie(), estrategia="torneio", prazo_s=1.0)
+    travado.join()
+
+    assert set(_status(resultado).values()) == {"avaliado"}
@@ -0,0 +1,108 @@
+# tests/test_serie_temporal.py
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils.serie_temporal import SerieTemporal
+
+
+def _serie(inicio="2025-03-01", n=10, passo="h", valores=None):
+    datas = (np.datetime64(inicio, passo) + np.arange(n)).astype("datetime64[s]")
+    return SerieTemporal(datas, np.arange(n, dtype=np.float64) if valores is None else valores)
+
+
+def test_de_registros_ordena_e_troca_invalidos_por_nan():
+    registros = [("2025-03-02 00:00:00", "7.5"), ("2025-03-01 00:00:00", None), ("2025-03-03 00:00:00", "x")]
+    serie = SerieTemporal.de_registros(registros)
+
+    assert serie.datas.tolist() == sorted(serie.datas.tolist())
+    assert np.isnan(serie.valores[0]) and serie.valores[1] == 7.5 and np.isnan(serie.valores[2])
+    assert len(SerieTemporal.de_registros([])) == 0
+
+
+def test_desempacota_como_a_tupla_do_fetch_colunar():
+    serie = _serie()
+    datas, valores = serie
+    assert datas is serie.datas and valores is serie.valores
+
+
+def test_preencher_nulos_bate_com_o_interpolate_do_pandas():
+    valores = np.array([np.nan, 1.0, np.nan, np.nan, 4.0, np.nan, 10.0, np.nan])
+    serie = _serie(n=len(valores), valores=valores)
+
+    esperado = pd.Series(valores).interpolate(method="linear").bfill().ffill().to_numpy()
+    np.testing.assert_allclose(serie.preencher_nulos().valores, esperado)
+    np.testing.assert_array_equal(serie.preencher_nulos("zero").valores, np.nan_to_num(valores))
+
+    sem_nulos = _serie()
+    assert sem_nulos.preencher_nulos() is sem_nulos
+
+
+def test_alinhar_bate_com_o_merge_interno_do_pandas():
+    rng = np.random.default_rng(5)
+    a = _serie(n=30, valores=rng.random(30))
+    presentes = rng.random(30) > 0.3
+    b = SerieTemporal(a.datas[presentes], rng.random(int(presentes.sum())))
+
+    comum_a, comum_b = SerieTemporal.alinhar([a, b])
+    df = pd.merge(pd.DataFrame({"data": a.datas, "valor_a": a.valores}),
+                  pd.DataFrame({"data": b.datas, "valor_b": b.valores}), on="data", how="inner")
+
+    np.testing.assert_array_equal(comum_a.datas, comum_b.datas)
+    np.testing.assert_array_equal(comum_a.datas, df["data"].to_numpy().astype("datetime64[s]"))
+    np.testing.assert_array_equal(comum_a.valores, df["valor_a"].to_numpy())
+    np.testing.assert_array_equal(comum_b.valores, df["valor_b"].to_numpy())
+
+
+def test_em_grade_interpola_buckets_ausentes_no_trecho_comum():
+    a = _serie(n=6, passo="D", valores=np.array([0.0, 1.0, np.nan, 3.0, 4.0, 5.0]))
+    b = SerieTemporal(a.datas[[1, 4, 5]], [10.0, 40.0, 50.0])
+
+    grade_a, grade_b = SerieTemporal.em_grade([a, b], "DIA")
+
+    np.testing.assert_array_equal(grade_a.datas, a.datas[1:])
+    np.testing.assert_allclose(grade_a.valores, [1.0, 2.0, 3.0, 4.0, 5.0])
+    np.testing.assert_allclose(grade_b.valores, [10.0, 20.0, 30.0, 40.0, 50.0])
+    assert [len(s) for s in SerieTemporal.em_grade([a, SerieTemporal.vazia()], "DIA")] == [0, 0]
+
+
+@pytest.mark.parametrize("formato", ["%d/%m", "%H:%M", "%d/%m %Hh", "%Y-%m", "%b/%y"])
+def test_rotulos_batem_com_o_strftime_do_pandas(formato):
+    serie = _serie(inicio="2024-12-30T22", n=50)
+    assert serie.rotulos(formato) == pd.DatetimeIndex(serie.datas).strftime(formato).tolist()
+
+
+def test_recortar_e_concatenar_reconstroem_a_serie():
+    serie = _serie(n=24)
+    meio = np.datetime64("2025-03-01T12:00:00")
+
+    antes = serie.recortar(serie.datas[0], meio, incluir_fim=False)
+    depois = serie.recortar(meio, serie.datas[-1])
+    assert antes.datas[-1] < meio <= depois.datas[0]
+
+    junta = SerieTemporal.concatenar([antes, SerieTemporal.vazia(), depois])
+    np.testing.assert_array_equal(junta.datas, serie.datas)
+    np.testing.assert_array_equal(junta.valores, serie.valores)
+
+
+def test_para_json_lista_registros_com_datas_iso():
+    serie = _serie(n=2)
+    assert json.loads(serie.para_json()) == [
+        {"data": "2025-03-01T00:00:00", "valor": 0.0},
+        {"data": "2025-03-01T01:00:00", "valor": 1.0},
+    ]
+    assert SerieTemporal.vazia().para_json() == "[]"
+
+
+def test_nulos_viram_null_no_json():
+    serie = _serie(n=3, valores=np.array([1.5, np.nan, 3.0]))
+
+    assert serie.valores_lista() == [1.5, None, 3.0]
+    assert _serie(n=2).valores_lista() == [0.0, 1.0]
+    # json.loads rejeita o token NaN com parse_constant
+    texto = json.dumps({"valores": serie.valores_lista()})
+    assert json.loads(texto, parse_constant=lambda c: pytest.fail(f"token inválido {c}"))["valores"][1] is None
+    assert json.loads(serie.para_json(), parse_constant=lambda c: pytest.fail(f"token inválido {c}"))[1]["valor"] is None